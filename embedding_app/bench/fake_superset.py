@@ -0,0 +1,173 @@
+# embedding_app/bench/fake_superset.py
+# Local stand-in for the Superset security, dashboard and chart data APIs, used by the benchmark
+# harness and for exercising chart cache warm-up.
+#
+# Run:  uvicorn fake_superset:app --port 8099     (from embedding_app/bench)
+#
+# Behaviour is controlled through environment variables:
+#   FAKE_SUPERSET_LATENCY_MS   base latency added to every API call (default 20)
+#   FAKE_SUPERSET_JITTER_MS    +/- uniform jitter around the base latency (default 5)
+#   FAKE_SUPERSET_ERROR_RATE   fraction of calls answered with HTTP 500, 0..1 (default 0)
+#   FAKE_SUPERSET_TOKEN_TTL    lifetime in seconds of issued access tokens (default 3600)
+#   FAKE_SUPERSET_GUEST_TTL    lifetime in seconds of issued guest tokens (default 300)
+#   FAKE_SUPERSET_CHARTS       charts on every dashboard (default 6)
+#   FAKE_SUPERSET_QUERY_MS     extra latency of a chart data query that misses the cache (default 200)
+#
+# Chart data results are "cached" per (chart, RLS rules of the guest token), like Superset's data cache.
+import os
+import json
+import asyncio
+import random
+import time
+import uuid
+from typing import Dict, Any, Set, Tuple
+
+import jwt
+from fastapi import FastAPI, Request, HTTPException, status
+from fastapi.responses import JSONResponse
+
+LATENCY_MS = float(os.getenv("FAKE_SUPERSET_LATENCY_MS", 20))
+JITTER_MS = float(os.getenv("FAKE_SUPERSET_JITTER_MS", 5))
+ERROR_RATE = float(os.getenv("FAKE_SUPERSET_ERROR_RATE", 0))
+TOKEN_TTL = int(os.getenv("FAKE_SUPERSET_TOKEN_TTL", 3600))
+GUEST_TTL = int(os.getenv("FAKE_SUPERSET_GUEST_TTL", 300))
+SECRET = os.getenv("FAKE_SUPERSET_SECRET", "fake-superset-secret-key-for-benchmarks")
+GUEST_AUDIENCE = os.getenv("FAKE_SUPERSET_GUEST_AUDIENCE", "superset")
+CHARTS_PER_DASHBOARD = int(os.getenv("FAKE_SUPERSET_CHARTS", 6))
+QUERY_MS = float(os.getenv("FAKE_SUPERSET_QUERY_MS", 200))
+
+app = FastAPI(title="Fake Superset API")
+
+@app.exception_handler(HTTPException)
+async def superset_style_error(request: Request, exc: HTTPException):
+    # Superset answers errors as {"message": ...} rather than FastAPI's {"detail": ...}
+    content = exc.detail if isinstance(exc.detail, dict) else {"message": exc.detail}
+    return JSONResponse(status_code=exc.status_code, content=content)
+
+# Per-endpoint call counters, readable at GET /_stats
+call_counts: Dict[str, int] = {"login": 0, "guest_token": 0, "dashboard": 0, "chart_data": 0,
+                               "chart_data_cached": 0, "chart_data_in_flight": 0, "chart_data_max_in_flight": 0,
+                               "errors": 0}
+# (chart id, RLS rules) whose chart data is cached
+data_cache: Set[Tuple[int, str]] = set()
+
+
+async def _simulate_upstream(endpoint: str) -> None:
+    """Sleeps for the configured latency and randomly fails at the configured error rate."""
+    call_counts[endpoint] += 1
+    delay = max(LATENCY_MS + random.uniform(-JITTER_MS, JITTER_MS), 0) / 1000
+    if delay:
+        await asyncio.sleep(delay)
+    if ERROR_RATE and random.random() < ERROR_RATE:
+        call_counts["errors"] += 1
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail={"message": "Injected failure"})
+
+
+@app.post("/api/v1/security/login")
+async def login(request: Request):
+    body = await request.json()
+    await _simulate_upstream("login")
+    if not body.get("username") or not body.get("password"):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail={"message": "Not authorized"})
+    now = int(time.time())
+    access_token = jwt.encode({
+        "fresh": True,
+        "iat": now,
+        "jti": str(uuid.uuid4()),
+        "type": "access",
+        "sub": 1,
+        "nbf": now,
+        "csrf": str(uuid.uuid4()),
+        "exp": now + TOKEN_TTL,
+    }, SECRET, algorithm="HS256")
+    return {"access_token": access_token}
+
+
+@app.post("/api/v1/security/guest_token/")
+async def guest_token(request: Request):
+    if not request.headers.get("Authorization", "").startswith("Bearer "):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail={"message": "Missing Authorization Header"})
+    body: Dict[str, Any] = await request.json()
+    await _simulate_upstream("guest_token")
+    now = time.time()
+    token = jwt.encode({
+        "user": body.get("user", {}),
+        "resources": body.get("resources", []),
+        "rls_rules": body.get("rls", []),
+        "iat": now,
+        "exp": now + GUEST_TTL,
+        "aud": GUEST_AUDIENCE,
+        "type": "guest",
+    }, SECRET, algorithm="HS256")
+    return {"token": token}
+
+
+def _require_admin(request: Request) -> None:
+    if not request.headers.get("Authorization", "").startswith("Bearer "):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail={"message": "Missing Authorization Header"})
+
+
+def _dashboard_number(embedded_uuid: str) -> int:
+    return uuid.UUID(embedded_uuid).int % 1000 + 1
+
+
+@app.get("/api/v1/embedded_dashboard/{embedded_uuid}")
+async def embedded_dashboard(embedded_uuid: str, request: Request):
+    _require_admin(request)
+    await _simulate_upstream("dashboard")
+    try:
+        dashboard_id = _dashboard_number(embedded_uuid)
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail={"message": "Not found"})
+    return {"result": {"uuid": embedded_uuid, "dashboard_id": str(dashboard_id), "allowed_domains": []}}
+
+
+@app.get("/api/v1/dashboard/{dashboard_id}/charts")
+async def dashboard_charts(dashboard_id: int, request: Request):
+    _require_admin(request)
+    await _simulate_upstream("dashboard")
+    return {"result": [{"id": dashboard_id * 100 + n, "slice_name": f"Chart {n}",
+                        "form_data": {"viz_type": "table"}} for n in range(CHARTS_PER_DASHBOARD)]}
+
+
+@app.get("/api/v1/chart/{chart_id}")
+async def chart(chart_id: int, request: Request):
+    _require_admin(request)
+    await _simulate_upstream("dashboard")
+    query_context = {"datasource": {"id": 1, "type": "table"}, "form_data": {"viz_type": "table"},
+                     "queries": [{"columns": ["Manufacturer"], "metrics": ["count"]}], "result_format": "json"}
+    return {"result": {"id": chart_id, "query_context": json.dumps(query_context)}}
+
+
+@app.post("/api/v1/chart/data")
+async def chart_data(request: Request):
+    try:
+        claims = jwt.decode(request.headers.get("X-GuestToken", ""), SECRET, algorithms=["HS256"], audience=GUEST_AUDIENCE)
+    except jwt.PyJWTError:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail={"message": "Guest token invalid"})
+    body: Dict[str, Any] = await request.json()
+    call_counts["chart_data_in_flight"] += 1
+    call_counts["chart_data_max_in_flight"] = max(call_counts["chart_data_max_in_flight"],
+                                                  call_counts["chart_data_in_flight"])
+    try:
+        await _simulate_upstream("chart_data")
+        cache_key = (body["form_data"]["slice_id"], json.dumps(claims.get("rls_rules", []), sort_keys=True))
+        is_cached = cache_key in data_cache
+        if is_cached:
+            call_counts["chart_data_cached"] += 1
+        else:
+            await asyncio.sleep(QUERY_MS / 1000)
+            data_cache.add(cache_key)
+    finally:
+        call_counts["chart_data_in_flight"] -= 1
+    return {"result": [{"is_cached": is_cached, "rowcount": 1, "data": [{"count": 1}]}]}
+
+
+@app.get("/_stats")
+async def stats():
+    return call_counts
+
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host="127.0.0.1", port=int(os.getenv("PORT", 8099)), log_level="warning")
@@ -0,0 +1,86 @@
+# embedding_app/bench/import_budget.py
+# Import-time budget for main.py: how long a new replica spends importing the app before uvicorn
+# can start the lifespan. Measured with `python -X importtime` in fresh interpreters.
+#
+# Usage (from embedding_app/bench):
+#   python import_budget.py                      # 5 runs, fail if the median exceeds the budget
+#   python import_budget.py --runs 10 --budget-ms 600 --top 15
+#
+# Exits 1 when the median cumulative import time of `main` is over --budget-ms, so it can run in CI.
+# The breakdown lists main's direct imports by cumulative time; most of the total is FastAPI /
+# pydantic and aiohttp, which every replica needs. Anything only some requests need (e.g. Jinja2 for
+# the legacy pages) should be imported on first use rather than show up here.
+import os
+import sys
+import argparse
+import statistics
+import subprocess
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+BENCH_DIR = Path(__file__).resolve().parent
+APP_DIR = BENCH_DIR.parent
+
+DEFAULT_BUDGET_MS = 750.0
+
+# Enough configuration for main.py to import without a .env (values are not contacted at import).
+IMPORT_ENV = {"SUPERSET_URL": "http://127.0.0.1:8088", "SUPERSET_DASHBOARD_ID": "import-budget"}
+
+
+def measure_once(module: str) -> Tuple[float, Dict[str, float]]:
+    """Imports `module` in a fresh interpreter; returns its cumulative ms and its direct imports' ms."""
+    env = {**IMPORT_ENV, **os.environ}
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], cwd=APP_DIR, env=env,
+                          capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise SystemExit(f"Importing {module} failed:\n{proc.stderr[-2000:]}")
+    # Lines are "import time: <self us> | <cumulative us> | <indent><name>", children before parents.
+    entries: List[Tuple[int, str, float]] = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        entries.append((len(name) - len(name.lstrip()), name.strip(), int(cumulative) / 1000))
+    for index, (depth, name, cumulative_ms) in enumerate(entries):
+        if name != module:
+            continue
+        children: Dict[str, float] = {}
+        for child_depth, child_name, child_ms in reversed(entries[:index]):
+            if child_depth <= depth:
+                break
+            if child_depth == depth + 2:
+                children[child_name] = child_ms
+        return cumulative_ms, children
+    raise SystemExit(f"{module} not found in -X importtime output")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Measure main.py import time against a budget.")
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS)
+    parser.add_argument("--top", type=int, default=10, help="Direct imports to list, slowest first")
+    args = parser.parse_args()
+
+    measure_once(args.module)  # Unmeasured: compiles .pyc files and warms the OS file cache
+    totals: List[float] = []
+    children: Dict[str, List[float]] = {}
+    for _ in range(args.runs):
+        total, direct = measure_once(args.module)
+        totals.append(total)
+        for name, ms in direct.items():
+            children.setdefault(name, []).append(ms)
+
+    median = statistics.median(totals)
+    print(f"import {args.module}: median {median:.1f} ms (min {min(totals):.1f}, max {max(totals):.1f}) "
+          f"over {args.runs} runs; budget {args.budget_ms:.0f} ms")
+    ranked = sorted(((statistics.median(v), k) for k, v in children.items()), reverse=True)
+    for ms, name in ranked[:args.top]:
+        print(f"  {ms:8.1f} ms  {name}")
+    if median > args.budget_ms:
+        print(f"Over budget by {median - args.budget_ms:.1f} ms")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
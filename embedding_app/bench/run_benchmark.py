@@ -0,0 +1,240 @@
+# embedding_app/bench/run_benchmark.py
+# Load-test harness for the embedding middleware, run against the local Superset stand-in.
+#
+# Usage (from embedding_app/bench):
+#   python run_benchmark.py                                   # spawn fake Superset + middleware, default run
+#   python run_benchmark.py --concurrency 1 16 64 --requests 500
+#   python run_benchmark.py --scenarios rls full-uncached --latency-ms 80 --error-rate 0.01
+#   python run_benchmark.py --target http://localhost:8000    # drive an already running middleware
+#   python run_benchmark.py --compare results/<earlier>.json  # print the change against an earlier run
+#
+# Each run is written to results/<UTC timestamp>-<git sha>.json so regressions in main.py
+# show up when runs from different commits are compared.
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import itertools
+import subprocess
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Callable, Tuple
+
+import aiohttp
+
+BENCH_DIR = Path(__file__).resolve().parent
+APP_DIR = BENCH_DIR.parent
+RESULTS_DIR = BENCH_DIR / "results"
+
+sys.path.insert(0, str(APP_DIR))
+from config import MANUFACTURER_PASSWORDS, ADMIN_CREDENTIALS  # noqa: E402
+
+SCENARIOS = ("login", "rls", "full", "full-uncached")
+
+RequestSpec = Tuple[str, str, Optional[Dict[str, Any]]]  # (method, path, json body)
+
+
+def scenario_requests(name: str) -> Callable[[int], RequestSpec]:
+    """Returns a function mapping a request number to the request to send for that scenario."""
+    manufacturers = list(MANUFACTURER_PASSWORDS.items())
+    if name == "login":
+        creds = itertools.cycle(manufacturers + [(ADMIN_CREDENTIALS["username"], ADMIN_CREDENTIALS["password"])])
+        return lambda i: ("POST", "/login", dict(zip(("username", "password"), next(creds))))
+    if name == "rls":
+        return lambda i: ("GET", f"/get-guest-token-rls?manufacturer={manufacturers[i % len(manufacturers)][0]}", None)
+    if name == "full":
+        return lambda i: ("GET", f"/get-guest-token-full?user_id={ADMIN_CREDENTIALS['username']}", None)
+    if name == "full-uncached":
+        # A distinct identity per request forces a Superset round trip every time.
+        run_id = int(time.time())
+        return lambda i: ("GET", f"/get-guest-token-full?user_id=bench_{run_id}_{i}", None)
+    raise ValueError(f"Unknown scenario '{name}'")
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(int(round(pct / 100 * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+async def run_level(base_url: str, scenario: str, concurrency: int, total: int, timeout: float) -> Dict[str, Any]:
+    """Sends `total` requests with `concurrency` workers and returns throughput and latency stats."""
+    next_request = scenario_requests(scenario)
+    counter = itertools.count()
+    latencies: List[float] = []
+    errors: Dict[str, int] = {}
+
+    async def worker(session: aiohttp.ClientSession) -> None:
+        while True:
+            i = next(counter)
+            if i >= total:
+                return
+            method, path, body = next_request(i)
+            started = time.perf_counter()
+            try:
+                async with session.request(method, f"{base_url}{path}", json=body) as response:
+                    await response.read()
+                    if response.status >= 400:
+                        errors[str(response.status)] = errors.get(str(response.status), 0) + 1
+                        continue
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+                continue
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=timeout)) as session:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(session) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "scenario": scenario,
+        "concurrency": concurrency,
+        "requests": total,
+        "ok": len(latencies),
+        "errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "rps": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+        "max_ms": round(latencies[-1], 2) if latencies else 0.0,
+    }
+
+
+# --- Process Management ---
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_for_port(port: int, proc: subprocess.Popen, timeout: float = 30) -> None:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"Process exited early with code {proc.returncode}")
+        with socket.socket() as s:
+            if s.connect_ex(("127.0.0.1", port)) == 0:
+                return
+        time.sleep(0.1)
+    raise RuntimeError(f"Timed out waiting for port {port}")
+
+
+def _spawn_uvicorn(app: str, cwd: Path, port: int, env: Dict[str, str], workers: int = 1,
+                   verbose: bool = False) -> subprocess.Popen:
+    cmd = [sys.executable, "-m", "uvicorn", app, "--host", "127.0.0.1", "--port", str(port),
+           "--log-level", "warning", "--workers", str(workers)]
+    output = None if verbose else subprocess.DEVNULL
+    proc = subprocess.Popen(cmd, cwd=str(cwd), env={**os.environ, **env}, stdout=output, stderr=output)
+    _wait_for_port(port, proc)
+    return proc
+
+
+def _git_sha() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=str(APP_DIR),
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "nogit"
+
+
+def print_table(results: List[Dict[str, Any]], baseline: Optional[Dict[Tuple[str, int], Dict[str, Any]]] = None) -> None:
+    header = f"{'scenario':<15}{'conc':>6}{'ok':>8}{'err':>6}{'rps':>10}{'p50':>9}{'p95':>9}{'p99':>9}"
+    if baseline:
+        header += f"{'d_rps':>9}{'d_p99':>9}"
+    print(header)
+    for r in results:
+        line = (f"{r['scenario']:<15}{r['concurrency']:>6}{r['ok']:>8}{sum(r['errors'].values()):>6}"
+                f"{r['rps']:>10.1f}{r['p50_ms']:>9.2f}{r['p95_ms']:>9.2f}{r['p99_ms']:>9.2f}")
+        base = (baseline or {}).get((r["scenario"], r["concurrency"]))
+        if base:
+            d_rps = (r["rps"] - base["rps"]) / base["rps"] * 100 if base["rps"] else 0.0
+            d_p99 = (r["p99_ms"] - base["p99_ms"]) / base["p99_ms"] * 100 if base["p99_ms"] else 0.0
+            line += f"{d_rps:>+8.1f}%{d_p99:>+8.1f}%"
+        print(line)
+
+
+async def main_async(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    results = []
+    for scenario in args.scenarios:
+        for concurrency in args.concurrency:
+            if args.warmup:
+                await run_level(args.target, scenario, concurrency, args.warmup, args.timeout)
+            results.append(await run_level(args.target, scenario, concurrency, args.requests, args.timeout))
+            print(f"  {scenario} x{concurrency}: {results[-1]['rps']} req/s, p99 {results[-1]['p99_ms']} ms")
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the Superset embedding middleware.")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=["login", "rls", "full", "full-uncached"])
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=300, help="Measured requests per scenario and concurrency level")
+    parser.add_argument("--warmup", type=int, default=20, help="Unmeasured requests sent before each level")
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--target", help="Base URL of a running middleware; if omitted, one is spawned")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers for the spawned middleware")
+    parser.add_argument("--latency-ms", type=float, default=20, help="Fake Superset base latency")
+    parser.add_argument("--jitter-ms", type=float, default=5, help="Fake Superset latency jitter")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fake Superset injected error rate (0..1)")
+    parser.add_argument("--app-env", nargs="*", default=[], metavar="KEY=VALUE",
+                        help="Extra environment for the spawned middleware, e.g. GUEST_TOKEN_MODE=local")
+    parser.add_argument("--compare", type=Path, help="Earlier results file to compare against")
+    parser.add_argument("--no-save", action="store_true", help="Do not write a results file")
+    parser.add_argument("--verbose", action="store_true", help="Show output of the spawned servers")
+    args = parser.parse_args()
+
+    procs: List[subprocess.Popen] = []
+    config: Dict[str, Any] = {}
+    try:
+        if not args.target:
+            fake_port, app_port = _free_port(), _free_port()
+            procs.append(_spawn_uvicorn("fake_superset:app", BENCH_DIR, fake_port, {
+                "FAKE_SUPERSET_LATENCY_MS": str(args.latency_ms),
+                "FAKE_SUPERSET_JITTER_MS": str(args.jitter_ms),
+                "FAKE_SUPERSET_ERROR_RATE": str(args.error_rate),
+            }, verbose=args.verbose))
+            app_env = {"SUPERSET_URL": f"http://127.0.0.1:{fake_port}"}
+            app_env.update(kv.split("=", 1) for kv in args.app_env)
+            procs.append(_spawn_uvicorn("main:app", APP_DIR, app_port, app_env, workers=args.workers,
+                                        verbose=args.verbose))
+            args.target = f"http://127.0.0.1:{app_port}"
+            config = {"latency_ms": args.latency_ms, "jitter_ms": args.jitter_ms,
+                      "error_rate": args.error_rate, "workers": args.workers, "app_env": args.app_env}
+        args.target = args.target.rstrip("/")
+        print(f"Benchmarking {args.target} ...")
+        results = asyncio.run(main_async(args))
+    finally:
+        for proc in reversed(procs):
+            proc.terminate()
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+    baseline = None
+    if args.compare:
+        previous = json.loads(args.compare.read_text())
+        baseline = {(r["scenario"], r["concurrency"]): r for r in previous["results"]}
+    print()
+    print_table(results, baseline)
+
+    if not args.no_save:
+        RESULTS_DIR.mkdir(exist_ok=True)
+        sha = _git_sha()
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+        out = RESULTS_DIR / f"{stamp}-{sha}.json"
+        out.write_text(json.dumps({"git_sha": sha, "timestamp": stamp, "target": args.target,
+                                   "config": config, "results": results}, indent=2))
+        print(f"\nResults written to {out}")
+
+
+if __name__ == "__main__":
+    main()
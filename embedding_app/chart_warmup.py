@@ -0,0 +1,184 @@
+# embedding_app/chart_warmup.py
+# Warms Superset's chart-data cache for a tenant once it has a guest token.
+#
+# Superset caches chart query results under a key that includes the RLS clauses of the user, so a
+# tenant's first dashboard render misses the cache for every chart. After a guest token is issued
+# the warmer replays the dashboard's chart queries with that token (X-GuestToken), so they run
+# under exactly the tenant's RLS and land in the cache (DATA_CACHE_CONFIG in superset_config.py)
+# before the browser asks for them.
+#
+# Per embedded dashboard the "plan" (numeric dashboard id and each chart's saved query_context) is
+# fetched once with the admin token and reused for every tenant. Charts saved without a
+# query_context (never re-saved since Superset 1.x) cannot be replayed and are skipped.
+# Warm-ups are deduplicated per (tenant, dashboard) for `dedupe_ttl` seconds, and chart queries
+# run with bounded concurrency on a separate client so they never compete with token minting.
+import json
+import time
+import asyncio
+import logging
+from urllib.parse import quote
+from typing import Optional, Dict, Any, List, Tuple, Callable, Awaitable, NamedTuple
+
+from fastapi import HTTPException
+
+from superset_client import SupersetClient
+
+logger = logging.getLogger(__name__)
+
+# --- Warm-up Defaults ---
+DEFAULT_WARMUP_CONCURRENCY = 4      # Chart queries in flight at once, across all tenants
+DEFAULT_WARMUP_DEDUPE_TTL = 900     # Seconds before the same tenant's dashboard is warmed again
+DEFAULT_WARMUP_PLAN_TTL = 300       # Seconds a dashboard's chart list is reused
+DEFAULT_WARMUP_MAX_JOBS = 100       # Warm-ups running or waiting; further ones are dropped
+DEFAULT_WARMUP_TIMEOUT = 60         # Per chart query
+
+AdminHeaders = Callable[[], Awaitable[Dict[str, str]]]
+
+
+class DashboardPlan(NamedTuple):
+    dashboard_id: str                              # Numeric id behind the embedded UUID
+    charts: Tuple[Tuple[int, Dict[str, Any]], ...]  # (chart id, saved query_context)
+    expires: float
+
+
+class ChartCacheWarmer:
+    def __init__(self, client: SupersetClient, admin_headers: AdminHeaders,
+                 concurrency: int = DEFAULT_WARMUP_CONCURRENCY,
+                 dedupe_ttl: float = DEFAULT_WARMUP_DEDUPE_TTL,
+                 plan_ttl: float = DEFAULT_WARMUP_PLAN_TTL,
+                 max_jobs: int = DEFAULT_WARMUP_MAX_JOBS,
+                 timeout: float = DEFAULT_WARMUP_TIMEOUT):
+        self.client = client
+        self._admin_headers = admin_headers
+        self._concurrency = concurrency
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self.dedupe_ttl = dedupe_ttl
+        self.plan_ttl = plan_ttl
+        self.max_jobs = max_jobs
+        self.timeout = timeout
+        self._plans: Dict[str, DashboardPlan] = {}
+        self._plan_tasks: Dict[str, "asyncio.Task[DashboardPlan]"] = {}
+        self._jobs: Dict[Tuple[str, str], "asyncio.Task[None]"] = {}
+        self._warmed_at: Dict[Tuple[str, str], float] = {}
+        self.started = 0
+        self.deduplicated = 0
+        self.dropped = 0
+        self.charts_warmed = 0
+        self.charts_already_cached = 0
+        self.chart_failures = 0
+
+    def schedule(self, tenant: str, dashboard_uuid: str, guest_token: str) -> bool:
+        """Starts a background warm-up for the tenant's dashboard unless one ran recently. Never blocks."""
+        job_key = (tenant, dashboard_uuid)
+        warmed_at = self._warmed_at.get(job_key)
+        if job_key in self._jobs or (warmed_at is not None and time.time() - warmed_at < self.dedupe_ttl):
+            self.deduplicated += 1
+            return False
+        if len(self._warmed_at) > 4 * self.max_jobs:
+            now = time.time()
+            self._warmed_at = {k: t for k, t in self._warmed_at.items() if now - t < self.dedupe_ttl}
+        if len(self._jobs) >= self.max_jobs:
+            self.dropped += 1
+            logger.warning("Chart warm-up queue full; not warming '%s' for %s", dashboard_uuid, tenant)
+            return False
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self._concurrency)
+        self.started += 1
+        self._warmed_at[job_key] = time.time()
+        task = asyncio.create_task(self._warm(tenant, dashboard_uuid, guest_token))
+        self._jobs[job_key] = task
+        task.add_done_callback(lambda _: self._jobs.pop(job_key, None))
+        return True
+
+    async def _warm(self, tenant: str, dashboard_uuid: str, guest_token: str) -> None:
+        try:
+            plan = await self._plan(dashboard_uuid)
+        except Exception as e:
+            # Retry on the next token request rather than after the dedupe period.
+            self._warmed_at.pop((tenant, dashboard_uuid), None)
+            logger.error("Chart warm-up for %s skipped: could not load dashboard '%s': %r", tenant, dashboard_uuid, e)
+            return
+        started = time.perf_counter()
+        results = await asyncio.gather(*(self._warm_chart(plan.dashboard_id, chart_id, query_context, guest_token)
+                                         for chart_id, query_context in plan.charts))
+        logger.info("Chart warm-up for %s on dashboard %s: %d warmed, %d already cached, %d failed in %.2fs",
+                    tenant, plan.dashboard_id, results.count("warmed"), results.count("cached"),
+                    results.count("failed"), time.perf_counter() - started)
+
+    async def _warm_chart(self, dashboard_id: str, chart_id: int, query_context: Dict[str, Any], guest_token: str) -> str:
+        # Same request the embedded dashboard makes, so the cache key (which includes dashboardId) matches.
+        body = {**query_context, "form_data": {**query_context.get("form_data", {}),
+                                                "slice_id": chart_id, "dashboardId": int(dashboard_id)}}
+        form_data = quote(json.dumps({"slice_id": chart_id}, separators=(",", ":")))
+        path = f"/api/v1/chart/data?form_data={form_data}&dashboard_id={dashboard_id}"
+        headers = {"X-GuestToken": guest_token, "Content-Type": "application/json", "Accept": "application/json"}
+        async with self._semaphore:
+            try:
+                data = await self.client.post_json(path, body, timeout=self.timeout, headers=headers,
+                                                   label="Superset Chart Data API (warm-up)")
+            except HTTPException as e:
+                self.chart_failures += 1
+                logger.warning("Chart %s warm-up failed (%s): %s", chart_id, e.status_code, e.detail)
+                return "failed"
+            except Exception as e:
+                self.chart_failures += 1
+                logger.warning("Chart %s warm-up failed: %r", chart_id, e)
+                return "failed"
+        if all(result.get("is_cached") for result in data.get("result") or [{}]):
+            self.charts_already_cached += 1
+            return "cached"
+        self.charts_warmed += 1
+        return "warmed"
+
+    async def _plan(self, dashboard_uuid: str) -> DashboardPlan:
+        plan = self._plans.get(dashboard_uuid)
+        if plan is not None and plan.expires > time.time():
+            return plan
+        # One load per dashboard, shared by the tenants that need it at the same time.
+        task = self._plan_tasks.get(dashboard_uuid)
+        if task is None:
+            task = asyncio.create_task(self._load_plan(dashboard_uuid))
+            self._plan_tasks[dashboard_uuid] = task
+            task.add_done_callback(lambda _: self._plan_tasks.pop(dashboard_uuid, None))
+        return await asyncio.shield(task)
+
+    async def _load_plan(self, dashboard_uuid: str) -> DashboardPlan:
+        headers = {**await self._admin_headers(), "Accept": "application/json"}
+        embedded = await self.client.get_json(f"/api/v1/embedded_dashboard/{dashboard_uuid}", timeout=self.timeout,
+                                              headers=headers, label="Superset Embedded Dashboard API")
+        dashboard_id = str(embedded["result"]["dashboard_id"])
+        chart_list = await self.client.get_json(f"/api/v1/dashboard/{dashboard_id}/charts", timeout=self.timeout,
+                                                headers=headers, label="Superset Dashboard Charts API")
+        charts: List[Tuple[int, Dict[str, Any]]] = []
+        for chart in chart_list.get("result", []):
+            detail = await self.client.get_json(f"/api/v1/chart/{chart['id']}", timeout=self.timeout,
+                                                headers=headers, label="Superset Chart API")
+            query_context = detail.get("result", {}).get("query_context")
+            if not query_context:
+                logger.info("Chart %s has no saved query context; it will not be warmed.", chart["id"])
+                continue
+            charts.append((chart["id"], json.loads(query_context)))
+        plan = DashboardPlan(dashboard_id, tuple(charts), time.time() + self.plan_ttl)
+        self._plans[dashboard_uuid] = plan
+        logger.info("Chart warm-up plan for dashboard %s: %d of %d charts", dashboard_id, len(charts),
+                    len(chart_list.get("result", [])))
+        return plan
+
+    async def close(self) -> None:
+        tasks = list(self._jobs.values()) + list(self._plan_tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await self.client.close()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "started": self.started,
+            "running": len(self._jobs),
+            "deduplicated": self.deduplicated,
+            "dropped": self.dropped,
+            "charts_warmed": self.charts_warmed,
+            "charts_already_cached": self.charts_already_cached,
+            "chart_failures": self.chart_failures,
+            "dashboards": len(self._plans),
+        }
@@ -0,0 +1,218 @@
+# embedding_app/credentials.py
+# Login credential store: salted slow hashes, verified off the event loop.
+#
+# Credentials are loaded once into a dict keyed by username, from one of:
+#   - CREDENTIALS_FILE=*.json    {"users": [{"username": ..., "role": "admin"|"manufacturer", "password_hash": ...}]}
+#   - CREDENTIALS_FILE=*.csv     header: username,role,password_hash
+#   - CREDENTIALS_FILE=*.db|*.sqlite|*.sqlite3   table credentials(username TEXT PRIMARY KEY, role TEXT, password_hash TEXT)
+#   - otherwise ADMIN_CREDENTIALS / MANUFACTURER_PASSWORDS from config.py (plain text, development only)
+#
+# Generate a hash with:  python credentials.py hash
+import os
+import csv
+import hmac
+import json
+import time
+import base64
+import sqlite3
+import asyncio
+import hashlib
+import logging
+import secrets
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, NamedTuple, Tuple
+
+logger = logging.getLogger(__name__)
+
+# --- Hashing Defaults ---
+HASH_ALGORITHM = "pbkdf2_sha256"
+DEFAULT_ITERATIONS = 260000
+DEFAULT_HASH_WORKERS = min(4, os.cpu_count() or 1)
+DEFAULT_VERIFY_CACHE_TTL = 300      # Seconds a successful verification is remembered
+DEFAULT_VERIFY_CACHE_SIZE = 10000
+
+ROLE_ADMIN = "admin"
+ROLE_MANUFACTURER = "manufacturer"
+
+
+class Credential(NamedTuple):
+    role: str
+    password_hash: str  # "pbkdf2_sha256$<iterations>$<salt>$<hash>" or "plain$<password>"
+
+
+def hash_password(password: str, iterations: int = DEFAULT_ITERATIONS) -> str:
+    salt = secrets.token_bytes(16)
+    digest = hashlib.pbkdf2_hmac("sha256", password.encode(), salt, iterations)
+    return "$".join([HASH_ALGORITHM, str(iterations),
+                     base64.b64encode(salt).decode(), base64.b64encode(digest).decode()])
+
+
+def check_password(password: str, password_hash: str) -> bool:
+    """Verifies `password` against a stored hash using a constant-time comparison. CPU-bound for real hashes."""
+    if not isinstance(password_hash, str):
+        logger.error("Malformed password hash in credential store.")
+        return False
+    algorithm, _, rest = password_hash.partition("$")
+    if algorithm == "plain":
+        return hmac.compare_digest(password.encode(), rest.encode())
+    if algorithm != HASH_ALGORITHM:
+        logger.error("Unsupported password hash algorithm: '%s'", algorithm)
+        return False
+    try:
+        iterations, salt, expected = rest.split("$")
+        digest = hashlib.pbkdf2_hmac("sha256", password.encode(), base64.b64decode(salt), int(iterations))
+        return hmac.compare_digest(digest, base64.b64decode(expected))
+    except (ValueError, TypeError):
+        logger.error("Malformed password hash in credential store.")
+        return False
+
+
+# --- Loaders ---
+def _load_json(path: str) -> Dict[str, Credential]:
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    return {u["username"]: Credential(u["role"], u["password_hash"]) for u in data["users"]}
+
+
+def _load_csv(path: str) -> Dict[str, Credential]:
+    with open(path, newline="", encoding="utf-8") as f:
+        return {row["username"]: Credential(row["role"], row["password_hash"]) for row in csv.DictReader(f)}
+
+
+def _load_sqlite(path: str) -> Dict[str, Credential]:
+    with sqlite3.connect(f"file:{path}?mode=ro", uri=True) as conn:
+        rows = conn.execute("SELECT username, role, password_hash FROM credentials")
+        return {username: Credential(role, password_hash) for username, role, password_hash in rows}
+
+
+def load_credentials_file(path: str) -> Dict[str, Credential]:
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".json":
+        credentials = _load_json(path)
+    elif extension == ".csv":
+        credentials = _load_csv(path)
+    elif extension in (".db", ".sqlite", ".sqlite3"):
+        credentials = _load_sqlite(path)
+    else:
+        raise ValueError(f"Unsupported credentials file type: '{path}'")
+    invalid_roles = {c.role for c in credentials.values()} - {ROLE_ADMIN, ROLE_MANUFACTURER}
+    if invalid_roles:
+        raise ValueError(f"Unknown roles in credentials file: {sorted(invalid_roles)}")
+    return credentials
+
+
+def credentials_from_config(admin_credentials: Dict[str, str], manufacturer_passwords: Dict[str, str]) -> Dict[str, Credential]:
+    credentials = {name: Credential(ROLE_MANUFACTURER, f"plain${password}")
+                   for name, password in manufacturer_passwords.items()}
+    credentials[admin_credentials["username"]] = Credential(ROLE_ADMIN, f"plain${admin_credentials['password']}")
+    return credentials
+
+
+class CredentialStore:
+    """Username-indexed credentials with hash verification on a bounded thread pool.
+
+    Successful verifications are remembered for `cache_ttl` seconds (keyed by an HMAC of the
+    username and password under a per-process random key), so repeated logins skip the slow hash.
+    """
+
+    def __init__(self, credentials: Dict[str, Credential],
+                 hash_workers: int = DEFAULT_HASH_WORKERS,
+                 cache_ttl: float = DEFAULT_VERIFY_CACHE_TTL,
+                 cache_size: int = DEFAULT_VERIFY_CACHE_SIZE):
+        self._credentials = credentials
+        self._executor = ThreadPoolExecutor(max_workers=hash_workers, thread_name_prefix="password-hash")
+        self._cache_key = secrets.token_bytes(32)
+        self._verified: "OrderedDict[bytes, Tuple[str, float]]" = OrderedDict()
+        self._pending: Dict[bytes, "asyncio.Future[bool]"] = {}
+        self.cache_ttl = cache_ttl
+        self.cache_size = cache_size
+        self._dummy_hash = self._make_dummy_hash(credentials)
+        self.verifications = 0
+        self.cache_hits = 0
+
+    def __len__(self) -> int:
+        return len(self._credentials)
+
+    def __contains__(self, username: str) -> bool:
+        return username in self._credentials
+
+    def role_of(self, username: str) -> Optional[str]:
+        credential = self._credentials.get(username)
+        return credential.role if credential else None
+
+    @staticmethod
+    def _make_dummy_hash(credentials: Dict[str, Credential]) -> str:
+        """A hash that never matches, checked for unknown usernames so they cost the same work as known ones.
+
+        Plain-text (config.py) credentials get a plain dummy; otherwise PBKDF2 at the stored iteration count.
+        """
+        stored = [c.password_hash for c in credentials.values() if isinstance(c.password_hash, str)]
+        if stored and all(h.startswith("plain$") for h in stored):
+            return "plain$" + secrets.token_urlsafe(16)
+        iterations = DEFAULT_ITERATIONS
+        for password_hash in stored:
+            parts = password_hash.split("$")
+            if parts[0] == HASH_ALGORITHM and len(parts) == 4 and parts[1].isdigit():
+                iterations = int(parts[1])
+                break
+        return "$".join([HASH_ALGORITHM, str(iterations),
+                         base64.b64encode(bytes(16)).decode(), base64.b64encode(bytes(32)).decode()])
+
+    def _cache_token(self, username: str, password: str) -> bytes:
+        return hmac.new(self._cache_key, f"{username}\0{password}".encode(), hashlib.sha256).digest()
+
+    async def verify(self, username: str, password: str) -> Optional[str]:
+        """Returns the user's role if the password matches, otherwise None."""
+        credential = self._credentials.get(username)
+        cache_token = self._cache_token(username, password)
+        cached = self._verified.get(cache_token)
+        if credential is not None and cached is not None and cached[1] > time.time() and cached[0] == credential.password_hash:
+            self.cache_hits += 1
+            return credential.role
+
+        stored_hash = credential.password_hash if credential else self._dummy_hash
+        if isinstance(stored_hash, str) and stored_hash.startswith("plain$"):
+            ok = check_password(password, stored_hash)
+        else:
+            # Identical concurrent attempts (a login storm) share one hash computation.
+            pending = self._pending.get(cache_token)
+            if pending is None:
+                loop = asyncio.get_running_loop()
+                pending = loop.run_in_executor(self._executor, check_password, password, stored_hash)
+                self._pending[cache_token] = pending
+                pending.add_done_callback(lambda _: self._pending.pop(cache_token, None))
+            ok = await asyncio.shield(pending)
+        self.verifications += 1
+        if not ok or credential is None:
+            return None
+
+        self._verified[cache_token] = (credential.password_hash, time.time() + self.cache_ttl)
+        self._verified.move_to_end(cache_token)
+        while len(self._verified) > self.cache_size:
+            self._verified.popitem(last=False)
+        return credential.role
+
+    def replace(self, credentials: Dict[str, Credential]) -> None:
+        """Swaps in a new credential set (e.g. after a tenant config reload).
+
+        Remembered verifications stay valid only for users whose stored hash is unchanged.
+        """
+        self._credentials = credentials
+        self._dummy_hash = self._make_dummy_hash(credentials)
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False)
+
+    def stats(self) -> Dict[str, int]:
+        return {"users": len(self._credentials), "verifications": self.verifications,
+                "cache_hits": self.cache_hits, "cached": len(self._verified)}
+
+
+if __name__ == "__main__":
+    import sys
+    import getpass
+    if len(sys.argv) != 2 or sys.argv[1] != "hash":
+        print("Usage: python credentials.py hash")
+        sys.exit(1)
+    print(hash_password(getpass.getpass("Password: ")))
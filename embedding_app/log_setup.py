@@ -0,0 +1,210 @@
+# embedding_app/log_setup.py
+# Non-blocking logging for the request path.
+#
+# Request handlers only put records on an in-memory queue (QueueHandler); a background thread
+# (QueueListener) formats and writes them. Formatting is deferred to that thread too: messages are
+# logged %-style (logger.info("... %s", value)) and only rendered when written, so disabled levels
+# cost a level check and enabled ones a queue put. When the queue is full, records are dropped and
+# counted rather than blocking the event loop.
+#
+# On the way out records are redacted (JWTs, bearer tokens, password / token fields) and written as
+# text or one JSON object per line (LOG_FORMAT=json). Repetitive success lines are logged with
+# `extra=SAMPLED`; at most `sample_burst` of each such line (per logger and message template) are
+# written per `sample_interval` seconds, and the next one written notes how many were suppressed.
+# Warnings and errors are never sampled, whether or not they are marked.
+import re
+import sys
+import json
+import time
+import queue
+import atexit
+import logging
+import logging.handlers
+from typing import Any, Dict, Tuple
+
+from timing import RequestIdFilter
+
+# --- Defaults ---
+DEFAULT_LOG_LEVEL = "INFO"
+DEFAULT_LOG_FORMAT = "text"
+DEFAULT_QUEUE_SIZE = 10000
+DEFAULT_SAMPLE_INTERVAL = 10.0
+DEFAULT_SAMPLE_BURST = 5
+TEXT_FORMAT = "%(levelname)s:%(name)s:[%(request_id)s] %(message)s"
+
+# Pass as `extra=SAMPLED` on high-volume success lines.
+SAMPLED = {"sampled": True}
+
+SENSITIVE_KEYS = frozenset({"password", "token", "access_token", "refresh_token", "csrf_token", "guest_token"})
+_JWT = re.compile(r"\beyJ[\w-]{5,}\.[\w-]{5,}\.[\w-]*")
+_BEARER = re.compile(r"(Bearer\s+)[\w.~+/=-]+")
+_SECRET_FIELD = re.compile(r"""(["']?(?:password|access_token|refresh_token|csrf_token|token)["']?\s*[:=]\s*)(["'])[^"']*\2""",
+                           re.IGNORECASE)
+_SECRET_BARE = re.compile(r"""(\b(?:password|access_token|refresh_token|csrf_token|token)\s*[:=]\s*)(?!["'<])[^\s,;&"'}]+""",
+                          re.IGNORECASE)
+
+
+def redact_text(text: str) -> str:
+    text = _JWT.sub("<jwt:redacted>", text)
+    text = _BEARER.sub(r"\1<redacted>", text)
+    text = _SECRET_FIELD.sub(r"\1\2<redacted>\2", text)
+    return _SECRET_BARE.sub(r"\1<redacted>", text)
+
+
+def _redact_value(value: Any, key: str = "") -> Any:
+    if key in SENSITIVE_KEYS:
+        return "<redacted>"
+    if key == "clause" and isinstance(value, str):
+        return f"<redacted {len(value)} chars>"
+    if isinstance(value, dict):
+        return {k: _redact_value(v, k) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_redact_value(v) for v in value]
+    return value
+
+
+class Redacted:
+    """Log argument that renders a redacted copy of a payload, only if and when the record is written.
+
+    RLS clauses (tenant data) are replaced by their length; secret fields are masked.
+    """
+
+    __slots__ = ("value",)
+
+    def __init__(self, value: Any):
+        self.value = value
+
+    def __str__(self) -> str:
+        return json.dumps(_redact_value(self.value), default=str)
+
+
+class RedactingFilter(logging.Filter):
+    """Renders the message, then masks tokens and secrets in it (runs on the writer thread)."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.msg = redact_text(record.getMessage())
+        record.args = None
+        if record.exc_info and not record.exc_text:
+            record.exc_text = redact_text(logging.Formatter().formatException(record.exc_info))
+            record.exc_info = None
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Lets at most `burst` records of each sampled line through per `interval` seconds (below WARNING)."""
+
+    def __init__(self, interval: float = DEFAULT_SAMPLE_INTERVAL, burst: int = DEFAULT_SAMPLE_BURST):
+        super().__init__()
+        self.interval = interval
+        self.burst = burst
+        self._windows: Dict[Tuple[str, Any], list] = {}  # (logger, template) -> [window start, written, suppressed]
+        self.suppressed = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not getattr(record, "sampled", False) or self.burst <= 0 or record.levelno >= logging.WARNING:
+            return True
+        key = (record.name, record.msg)
+        now = time.monotonic()
+        window = self._windows.get(key)
+        if window is None or now - window[0] >= self.interval:
+            skipped = window[2] if window else 0
+            self._windows[key] = [now, 1, 0]
+            if skipped:
+                record.msg = f"{record.msg} [{skipped} similar suppressed]"
+            return True
+        if window[1] < self.burst:
+            window[1] += 1
+            return True
+        window[2] += 1
+        self.suppressed += 1
+        return False
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "request_id": getattr(record, "request_id", "-"),
+            "message": record.getMessage(),
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that leaves formatting to the listener thread and never blocks on a full queue.
+
+    The stock QueueHandler renders the message in the caller before enqueueing. Log arguments must
+    therefore not be mutated after the call; the app only logs immutable values and shared,
+    never-mutated payloads.
+    """
+
+    def __init__(self, log_queue: "queue.Queue[logging.LogRecord]"):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class LoggingRuntime:
+    def __init__(self, handler: DeferredQueueHandler, listener: logging.handlers.QueueListener,
+                 sampler: SamplingFilter):
+        self.handler = handler
+        self.listener = listener
+        self.sampler = sampler
+
+    def stop(self) -> None:
+        """Flushes queued records and stops the writer thread."""
+        if self.listener._thread is not None:
+            self.listener.stop()
+
+    def stats(self) -> Dict[str, int]:
+        return {"queued": self.handler.queue.qsize(), "dropped": self.handler.dropped,
+                "sampled_out": self.sampler.suppressed}
+
+
+def setup_logging(level: str = DEFAULT_LOG_LEVEL, fmt: str = DEFAULT_LOG_FORMAT,
+                  queue_size: int = DEFAULT_QUEUE_SIZE, sample_interval: float = DEFAULT_SAMPLE_INTERVAL,
+                  sample_burst: int = DEFAULT_SAMPLE_BURST,
+                  capture: Tuple[str, ...] = ("uvicorn", "uvicorn.error", "uvicorn.access")) -> LoggingRuntime:
+    """Routes the root logger (and uvicorn's loggers) through a queue to a stderr writer thread."""
+    if fmt not in ("text", "json"):
+        raise ValueError(f"Invalid LOG_FORMAT '{fmt}' (expected 'text' or 'json')")
+    output = logging.StreamHandler(sys.stderr)
+    output.setFormatter(JsonFormatter() if fmt == "json" else logging.Formatter(TEXT_FORMAT))
+    output.addFilter(RedactingFilter())
+
+    # Filters on the queue handler run in the caller: request ids live in a context variable, and
+    # sampled-out records are dropped before they are queued.
+    sampler = SamplingFilter(sample_interval, sample_burst)
+    handler = DeferredQueueHandler(queue.Queue(maxsize=queue_size))
+    handler.addFilter(RequestIdFilter())
+    handler.addFilter(sampler)
+
+    root = logging.getLogger()
+    for existing in root.handlers[:]:
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level.upper())
+    for name in capture:
+        captured = logging.getLogger(name)
+        captured.handlers.clear()
+        captured.propagate = True
+
+    listener = logging.handlers.QueueListener(handler.queue, output, respect_handler_level=True)
+    listener.start()
+    runtime = LoggingRuntime(handler, listener, sampler)
+    atexit.register(runtime.stop)
+    return runtime
@@ -1,17 +1,17 @@
 # embedding_app/main.py
 import os
+import json
+import asyncio
 import logging
 import time
-from typing import Optional, Dict, Any
+from contextlib import asynccontextmanager, suppress
+from typing import Optional, Dict, Any, List
 import hashlib # Import for potential future password hashing
 
-import requests
 import jwt
 from fastapi import FastAPI, Request, HTTPException, Depends, Form, status
-from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse, RedirectResponse
-from fastapi.templating import Jinja2Templates
+from fastapi.responses import HTMLResponse, RedirectResponse, Response, StreamingResponse
 from pydantic import BaseModel
 from dotenv import load_dotenv
 
@@ -28,10 +28,43 @@ except ImportError:
     logging.error("FATAL: embedding_app/config.py not found or missing required variables.")
     raise ImportError("Could not load configuration from embedding_app/config.py")
 
+from superset_client import (SupersetClient, CircuitBreaker, AdaptiveTimeout, DEFAULT_POOL_LIMIT,
+                             DEFAULT_POOL_LIMIT_PER_HOST, DEFAULT_MAX_RETRIES, DEFAULT_FAILURE_THRESHOLD,
+                             DEFAULT_RECOVERY_TIMEOUT, DEFAULT_MIN_TIMEOUT)
+from token_cache import (GuestTokenCache, token_expiry, DEFAULT_MAX_ENTRIES,
+                         DEFAULT_SAFETY_MARGIN, DEFAULT_STALE_MARGIN, DEFAULT_STALE_GRACE)
+from shared_cache import SharedTokenStore, create_redis_client
+from credentials import (CredentialStore, load_credentials_file, credentials_from_config, ROLE_ADMIN,
+                         DEFAULT_HASH_WORKERS, DEFAULT_VERIFY_CACHE_TTL)
+from session import SessionManager, Session, DEFAULT_SESSION_TTL
+from tenant_config import (TenantConfig, TenantConfigWatcher, GuestTokenRequest, load_tenant_file,
+                           DEFAULT_RELOAD_INTERVAL)
+from rate_limit import (AdmissionController, DEFAULT_TENANT_RATE, DEFAULT_TENANT_BURST, DEFAULT_CLIENT_RATE,
+                        DEFAULT_CLIENT_BURST, DEFAULT_GLOBAL_RATE, DEFAULT_GLOBAL_BURST, DEFAULT_MAX_QUEUE,
+                        DEFAULT_MAX_WAIT)
+from chart_warmup import (ChartCacheWarmer, DEFAULT_WARMUP_CONCURRENCY, DEFAULT_WARMUP_DEDUPE_TTL,
+                          DEFAULT_WARMUP_PLAN_TTL, DEFAULT_WARMUP_TIMEOUT)
+from token_scheduler import TokenRenewalScheduler, DEFAULT_CONCURRENCY, DEFAULT_RENEW_LEAD
+from metrics import (REGISTRY, CONTENT_TYPE as METRICS_CONTENT_TYPE, ADMIN_TOKEN_REFRESHES,
+                     RequestMetricsMiddleware, register_callback)
+from timing import (RequestTimingMiddleware, ProfileKeeper, phase, timed, current_request_id,
+                    REQUEST_ID_HEADER, DEFAULT_PROFILE_DIR, DEFAULT_PROFILE_KEEP)
+from log_setup import (setup_logging, Redacted, SAMPLED, DEFAULT_LOG_LEVEL, DEFAULT_LOG_FORMAT, DEFAULT_QUEUE_SIZE,
+                       DEFAULT_SAMPLE_INTERVAL, DEFAULT_SAMPLE_BURST)
+from readiness import ReadinessGate
+
 # --- Configuration Loading ---
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
 load_dotenv()
+# Records are queued and written by a background thread (see log_setup.py). LOG_FORMAT=json writes
+# one JSON object per line; LOG_SAMPLE_BURST repetitive success lines are kept per LOG_SAMPLE_INTERVAL.
+logging_runtime = setup_logging(
+    level=os.getenv("LOG_LEVEL", DEFAULT_LOG_LEVEL),
+    fmt=os.getenv("LOG_FORMAT", DEFAULT_LOG_FORMAT).strip().lower(),
+    queue_size=int(os.getenv("LOG_QUEUE_SIZE", DEFAULT_QUEUE_SIZE)),
+    sample_interval=float(os.getenv("LOG_SAMPLE_INTERVAL", DEFAULT_SAMPLE_INTERVAL)),
+    sample_burst=int(os.getenv("LOG_SAMPLE_BURST", DEFAULT_SAMPLE_BURST)),
+)
+logger = logging.getLogger(__name__)
 
 SUPERSET_URL = os.getenv("SUPERSET_URL", "http://localhost:8088").rstrip('/')
 SUPERSET_ADMIN_USER = os.getenv("SUPERSET_ADMIN_USER", "admin")
@@ -40,21 +73,296 @@ SUPERSET_DASHBOARD_ID = os.getenv("SUPERSET_DASHBOARD_ID")
 SUPERSET_RLS_ROLE_NAME = os.getenv("SUPERSET_RLS_ROLE_NAME", "Gamma")
 FRONTEND_URL = os.getenv("FRONTEND_URL", "http://localhost:5173")
 
-logger.info(f"SUPERSET_RLS_ROLE_NAME (base guest role): {SUPERSET_RLS_ROLE_NAME}")
-logger.info(f"RLS based on column: '{RLS_COLUMN_NAME}'")
-if RLS_DATASET_ID:
-    logger.info(f"RLS clause applied specifically to dataset ID: {RLS_DATASET_ID}")
-else:
-    logger.info("RLS clause applied globally to accessible datasets for the guest user.")
-logger.info(f"Admin user configured: '{ADMIN_CREDENTIALS.get('username')}'")
-logger.info(f"Allowed CORS requests from: {FRONTEND_URL}")
-
 if not all([SUPERSET_URL, SUPERSET_ADMIN_USER, SUPERSET_ADMIN_PASSWORD, SUPERSET_DASHBOARD_ID]):
     logger.error("FATAL: Missing SUPERSET_URL, SUPERSET_ADMIN_USER, SUPERSET_ADMIN_PASSWORD, or SUPERSET_DASHBOARD_ID in .env")
     raise ValueError("Missing essential Superset configuration in .env file")
 
+# Additional embedded dashboards guest tokens may be requested for (comma-separated UUIDs).
+# SUPERSET_DASHBOARD_ID is always allowed and remains the default resource.
+ALLOWED_DASHBOARD_IDS = {SUPERSET_DASHBOARD_ID} | {
+    d.strip() for d in os.getenv("SUPERSET_DASHBOARD_IDS", "").split(",") if d.strip()
+}
+
+GUEST_TOKEN_BATCH_MAX_ITEMS = int(os.getenv("GUEST_TOKEN_BATCH_MAX_ITEMS", 50))
+GUEST_TOKEN_BATCH_CONCURRENCY = int(os.getenv("GUEST_TOKEN_BATCH_CONCURRENCY", 8))
+
+# --- Tenant Configuration ---
+# TENANTS_FILE (see tenant_config.py) holds logins, the RLS column/dataset and dashboards, and is
+# reloaded without a restart when it changes. Without it, logins come from CREDENTIALS_FILE (JSON,
+# CSV or SQLite with salted hashes, see credentials.py) or the plain-text ADMIN_CREDENTIALS /
+# MANUFACTURER_PASSWORDS in config.py, and the RLS settings from config.py.
+TENANTS_FILE = os.getenv("TENANTS_FILE")
+TENANTS_RELOAD_INTERVAL = float(os.getenv("TENANTS_RELOAD_INTERVAL", DEFAULT_RELOAD_INTERVAL))
+CREDENTIALS_FILE = os.getenv("CREDENTIALS_FILE")
+CREDENTIAL_HASH_WORKERS = int(os.getenv("CREDENTIAL_HASH_WORKERS", DEFAULT_HASH_WORKERS))
+CREDENTIAL_VERIFY_CACHE_TTL = float(os.getenv("CREDENTIAL_VERIFY_CACHE_TTL", DEFAULT_VERIFY_CACHE_TTL))
+
+def _load_tenant_config() -> TenantConfig:
+    if TENANTS_FILE:
+        return load_tenant_file(TENANTS_FILE, SUPERSET_DASHBOARD_ID, ALLOWED_DASHBOARD_IDS)
+    if CREDENTIALS_FILE:
+        credentials = load_credentials_file(CREDENTIALS_FILE)
+    else:
+        credentials = credentials_from_config(ADMIN_CREDENTIALS, MANUFACTURER_PASSWORDS)
+        logger.warning("Using plain-text login credentials from config.py; set CREDENTIALS_FILE or TENANTS_FILE in production.")
+    return TenantConfig(credentials, RLS_COLUMN_NAME, RLS_DATASET_ID, SUPERSET_DASHBOARD_ID, ALLOWED_DASHBOARD_IDS,
+                        source=CREDENTIALS_FILE or "config.py")
+
+def _log_tenant_config(config: TenantConfig) -> None:
+    logger.info("Tenant config %s from %s: %d manufacturers, admins %s, RLS column '%s'", config.version,
+                config.source, len(config.manufacturers), list(config.admins), config.rls_column)
+    if config.rls_dataset_id:
+        logger.info("RLS clause applied specifically to dataset ID: %s", config.rls_dataset_id)
+    else:
+        logger.info("RLS clause applied globally to accessible datasets for the guest user.")
+    logger.info("Embeddable dashboards: %s (default %s)", sorted(config.dashboard_ids), config.default_dashboard_id)
+
+# Replaced as a whole on reload; read it afresh on every use rather than caching parts of it.
+tenant_config = _load_tenant_config()
+credential_store = CredentialStore(tenant_config.credentials, hash_workers=CREDENTIAL_HASH_WORKERS,
+                                   cache_ttl=CREDENTIAL_VERIFY_CACHE_TTL)
+
+# --- Login Sessions ---
+# /login issues a signed session (cookie + response body); token endpoints verify it locally.
+# With REQUIRE_SESSION enabled, guest tokens are only issued to logged-in users, and only for their own tenant.
+SESSION_SECRET = os.getenv("SESSION_SECRET")
+SESSION_TTL = int(os.getenv("SESSION_TTL", DEFAULT_SESSION_TTL))
+SESSION_COOKIE_SECURE = os.getenv("SESSION_COOKIE_SECURE", "False").lower() in ['true', '1', 'yes']
+REQUIRE_SESSION = os.getenv("REQUIRE_SESSION", "False").lower() in ['true', '1', 'yes']
+session_manager = SessionManager(SESSION_SECRET, ttl=SESSION_TTL, cookie_secure=SESSION_COOKIE_SECURE)
+
+# --- Guest Token Minting Mode ---
+# "upstream" (default): guest tokens are minted by Superset's /api/v1/security/guest_token/ API.
+# "local": the middleware signs guest tokens itself with the secret Superset verifies them with
+# (GUEST_TOKEN_JWT_SECRET in superset_config.py). Audience and lifetime must match Superset's config.
+GUEST_TOKEN_MODE = os.getenv("GUEST_TOKEN_MODE", "upstream").strip().lower()
+GUEST_TOKEN_JWT_SECRET = os.getenv("GUEST_TOKEN_JWT_SECRET")
+GUEST_TOKEN_JWT_ALGO = os.getenv("GUEST_TOKEN_JWT_ALGO", "HS256")
+GUEST_TOKEN_JWT_AUDIENCE = os.getenv("GUEST_TOKEN_JWT_AUDIENCE", "superset")
+GUEST_TOKEN_JWT_EXP_SECONDS = int(os.getenv("GUEST_TOKEN_JWT_EXP_SECONDS", 300))
+
+if GUEST_TOKEN_MODE not in ("upstream", "local"):
+    raise ValueError(f"Invalid GUEST_TOKEN_MODE '{GUEST_TOKEN_MODE}' (expected 'upstream' or 'local')")
+if GUEST_TOKEN_MODE == "local" and not GUEST_TOKEN_JWT_SECRET:
+    logger.error("FATAL: GUEST_TOKEN_MODE=local requires GUEST_TOKEN_JWT_SECRET in .env")
+    raise ValueError("Missing GUEST_TOKEN_JWT_SECRET for local guest token minting")
+
+# --- Superset API Client ---
+# One pooled client per worker process; opened and closed through the app lifespan.
+SUPERSET_POOL_LIMIT = int(os.getenv("SUPERSET_POOL_LIMIT", DEFAULT_POOL_LIMIT))
+SUPERSET_POOL_LIMIT_PER_HOST = int(os.getenv("SUPERSET_POOL_LIMIT_PER_HOST", DEFAULT_POOL_LIMIT_PER_HOST))
+# Failing Superset calls are retried with jittered backoff; after SUPERSET_BREAKER_FAILURE_THRESHOLD
+# consecutive failures the circuit opens and calls fail fast for SUPERSET_BREAKER_RECOVERY_TIMEOUT seconds.
+SUPERSET_MAX_RETRIES = int(os.getenv("SUPERSET_MAX_RETRIES", DEFAULT_MAX_RETRIES))
+SUPERSET_BREAKER_FAILURE_THRESHOLD = int(os.getenv("SUPERSET_BREAKER_FAILURE_THRESHOLD", DEFAULT_FAILURE_THRESHOLD))
+SUPERSET_BREAKER_RECOVERY_TIMEOUT = float(os.getenv("SUPERSET_BREAKER_RECOVERY_TIMEOUT", DEFAULT_RECOVERY_TIMEOUT))
+SUPERSET_MIN_TIMEOUT = float(os.getenv("SUPERSET_MIN_TIMEOUT", DEFAULT_MIN_TIMEOUT))
+superset_client = SupersetClient(
+    SUPERSET_URL,
+    pool_limit=SUPERSET_POOL_LIMIT,
+    pool_limit_per_host=SUPERSET_POOL_LIMIT_PER_HOST,
+    max_retries=SUPERSET_MAX_RETRIES,
+    breaker=CircuitBreaker(SUPERSET_BREAKER_FAILURE_THRESHOLD, SUPERSET_BREAKER_RECOVERY_TIMEOUT),
+    adaptive_timeout=AdaptiveTimeout(min_timeout=SUPERSET_MIN_TIMEOUT),
+)
+
+# --- Guest Token Cache ---
+# Minted guest tokens are reused until shortly before their own `exp` claim. Past that point a
+# still-valid token is served stale while a refresh runs if Superset is down or slow.
+GUEST_TOKEN_CACHE_MAX_ENTRIES = int(os.getenv("GUEST_TOKEN_CACHE_MAX_ENTRIES", DEFAULT_MAX_ENTRIES))
+GUEST_TOKEN_CACHE_SAFETY_MARGIN = float(os.getenv("GUEST_TOKEN_CACHE_SAFETY_MARGIN", DEFAULT_SAFETY_MARGIN))
+GUEST_TOKEN_STALE_MARGIN = float(os.getenv("GUEST_TOKEN_STALE_MARGIN", DEFAULT_STALE_MARGIN))
+GUEST_TOKEN_STALE_GRACE = float(os.getenv("GUEST_TOKEN_STALE_GRACE", DEFAULT_STALE_GRACE))
+guest_token_cache = GuestTokenCache(
+    max_entries=GUEST_TOKEN_CACHE_MAX_ENTRIES,
+    safety_margin=GUEST_TOKEN_CACHE_SAFETY_MARGIN,
+    stale_margin=GUEST_TOKEN_STALE_MARGIN,
+    stale_grace=GUEST_TOKEN_STALE_GRACE,
+)
+
+# --- Shared (cross-worker) Token Store ---
+# Optional Redis tier behind the per-worker caches, e.g. REDIS_URL=redis://localhost:6379/0.
+# REDIS_URL=memory:// uses an in-process stand-in (no network), useful for tests.
+REDIS_URL = os.getenv("REDIS_URL")
+REDIS_KEY_PREFIX = os.getenv("REDIS_KEY_PREFIX", "embedding:")
+SHARED_ADMIN_TOKEN_KEY = "admin_token"
+ADMIN_LOGIN_LOCK_TTL = 15  # Seconds; covers a login including retries
+shared_token_store: Optional[SharedTokenStore] = (
+    SharedTokenStore(create_redis_client(REDIS_URL), prefix=REDIS_KEY_PREFIX) if REDIS_URL else None
+)
+
+register_callback("embedding_guest_token_cache_hits_total", "Guest token cache hits.",
+                  lambda: guest_token_cache.hits, "counter")
+register_callback("embedding_guest_token_cache_misses_total", "Guest token cache misses.",
+                  lambda: guest_token_cache.misses, "counter")
+register_callback("embedding_guest_token_cache_coalesced_total", "Guest token cache misses that joined an in-flight mint.",
+                  lambda: guest_token_cache.coalesced, "counter")
+register_callback("embedding_guest_token_cache_stale_served_total", "Stale guest tokens served while refreshing.",
+                  lambda: guest_token_cache.stale_served, "counter")
+register_callback("embedding_superset_circuit_open", "1 while the Superset circuit breaker rejects calls.",
+                  lambda: int(superset_client.breaker.is_open))
+register_callback("embedding_log_records_dropped_total", "Log records dropped because the log queue was full.",
+                  lambda: logging_runtime.handler.dropped, "counter")
+register_callback("embedding_log_records_sampled_out_total", "Repetitive log lines suppressed by sampling.",
+                  lambda: logging_runtime.sampler.suppressed, "counter")
+register_callback("embedding_guest_token_cache_entries", "Guest tokens currently cached.", lambda: len(guest_token_cache))
+register_callback("embedding_guest_token_cache_hit_ratio", "Guest token cache hits / lookups.",
+                  lambda: guest_token_cache.stats()["hit_ratio"])
+
+# --- Guest Token Pre-warming ---
+# Every tenant is known up front (config.py), so their tokens are minted at startup and renewed before expiry.
+# PREWARM_TENANTS (comma-separated manufacturer / admin usernames) limits this to the hot tenants.
+PREWARM_GUEST_TOKENS = os.getenv("PREWARM_GUEST_TOKENS", "True").lower() in ['true', '1', 'yes']
+PREWARM_TENANTS = [t.strip() for t in os.getenv("PREWARM_TENANTS", "").split(",") if t.strip()] or None
+PREWARM_CONCURRENCY = int(os.getenv("PREWARM_CONCURRENCY", DEFAULT_CONCURRENCY))
+GUEST_TOKEN_RENEW_LEAD = float(os.getenv("GUEST_TOKEN_RENEW_LEAD", DEFAULT_RENEW_LEAD))
+guest_token_scheduler = TokenRenewalScheduler(
+    guest_token_cache,
+    concurrency=PREWARM_CONCURRENCY,
+    renew_lead=GUEST_TOKEN_RENEW_LEAD,
+)
+register_callback("embedding_guest_token_renewals_total", "Scheduled guest token renewals completed.",
+                  lambda: guest_token_scheduler.renewals, "counter")
+register_callback("embedding_guest_token_renewal_failures_total", "Scheduled guest token renewals failed.",
+                  lambda: guest_token_scheduler.renewal_failures, "counter")
+register_callback("embedding_guest_token_stream_connections", "Open guest token SSE streams.",
+                  lambda: guest_token_scheduler.subscriber_count)
+
+# --- Admission Control ---
+# Requests that would mint a new guest token (cache hits are never limited) must pass a per-tenant,
+# a per-client-IP and a global token bucket; over-limit requests queue fairly across tenants.
+# Behind a reverse proxy, run uvicorn with --proxy-headers so the client IP is the real one.
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "True").lower() in ['true', '1', 'yes']
+guest_token_admission = AdmissionController(
+    tenant_rate=float(os.getenv("RATE_LIMIT_TENANT_RATE", DEFAULT_TENANT_RATE)),
+    tenant_burst=float(os.getenv("RATE_LIMIT_TENANT_BURST", DEFAULT_TENANT_BURST)),
+    client_rate=float(os.getenv("RATE_LIMIT_CLIENT_RATE", DEFAULT_CLIENT_RATE)),
+    client_burst=float(os.getenv("RATE_LIMIT_CLIENT_BURST", DEFAULT_CLIENT_BURST)),
+    global_rate=float(os.getenv("RATE_LIMIT_GLOBAL_RATE", DEFAULT_GLOBAL_RATE)),
+    global_burst=float(os.getenv("RATE_LIMIT_GLOBAL_BURST", DEFAULT_GLOBAL_BURST)),
+    max_queue=int(os.getenv("RATE_LIMIT_MAX_QUEUE", DEFAULT_MAX_QUEUE)),
+    max_wait=float(os.getenv("RATE_LIMIT_MAX_WAIT", DEFAULT_MAX_WAIT)),
+)
+for _name, _doc in (("admitted", "Guest token mints admitted by the rate limiter."),
+                    ("admitted_after_wait", "Guest token mints admitted after queueing."),
+                    ("rejected_queue_full", "Guest token requests rejected because the admission queue was full."),
+                    ("rejected_timeout", "Guest token requests rejected after waiting too long for admission.")):
+    register_callback(f"embedding_rate_limit_{_name}_total", _doc,
+                      lambda _name=_name: getattr(guest_token_admission, _name), "counter")
+register_callback("embedding_rate_limit_queued", "Guest token requests waiting for admission.",
+                  lambda: guest_token_admission.stats()["queued"])
+
+# --- Guest Token Stream (SSE) ---
+# Comment line sent on idle streams so proxies and browsers keep the connection open.
+GUEST_TOKEN_STREAM_HEARTBEAT = float(os.getenv("GUEST_TOKEN_STREAM_HEARTBEAT", 15))
+
+# --- Chart Cache Warm-up ---
+# Optional: once a manufacturer's RLS guest token is issued, replay the dashboard's chart queries
+# with it in the background so Superset's data cache (Redis, see superset_config.py) holds that
+# tenant's results before the browser asks. Uses its own small connection pool and circuit breaker.
+CHART_WARMUP_ENABLED = os.getenv("CHART_WARMUP_ENABLED", "False").lower() in ['true', '1', 'yes']
+CHART_WARMUP_CONCURRENCY = int(os.getenv("CHART_WARMUP_CONCURRENCY", DEFAULT_WARMUP_CONCURRENCY))
+chart_warmer: Optional[ChartCacheWarmer] = None
+if CHART_WARMUP_ENABLED:
+    chart_warmer = ChartCacheWarmer(
+        SupersetClient(SUPERSET_URL, pool_limit=CHART_WARMUP_CONCURRENCY, pool_limit_per_host=CHART_WARMUP_CONCURRENCY,
+                       max_retries=0, breaker=CircuitBreaker(SUPERSET_BREAKER_FAILURE_THRESHOLD,
+                                                             SUPERSET_BREAKER_RECOVERY_TIMEOUT)),
+        admin_headers=lambda: _admin_api_headers(),
+        concurrency=CHART_WARMUP_CONCURRENCY,
+        dedupe_ttl=float(os.getenv("CHART_WARMUP_DEDUPE_TTL", DEFAULT_WARMUP_DEDUPE_TTL)),
+        plan_ttl=float(os.getenv("CHART_WARMUP_PLAN_TTL", DEFAULT_WARMUP_PLAN_TTL)),
+        timeout=float(os.getenv("CHART_WARMUP_TIMEOUT", DEFAULT_WARMUP_TIMEOUT)),
+    )
+    register_callback("embedding_chart_warmup_charts_warmed_total", "Chart queries run by cache warm-up.",
+                      lambda: chart_warmer.charts_warmed, "counter")
+    register_callback("embedding_chart_warmup_chart_failures_total", "Chart warm-up queries that failed.",
+                      lambda: chart_warmer.chart_failures, "counter")
+
+# --- Request Timing / Profiling ---
+# Every response carries Server-Timing (admin token, guest token API, handler, ...) and X-Request-ID.
+# PROFILE_MODE=header profiles requests sent with "X-Profile: 1"; PROFILE_MODE=all profiles a
+# PROFILE_SAMPLE_RATE fraction of requests. The slowest PROFILE_KEEP profiles are kept in PROFILE_DIR.
+request_profiler = ProfileKeeper(
+    mode=os.getenv("PROFILE_MODE", "off").strip().lower(),
+    directory=os.getenv("PROFILE_DIR", DEFAULT_PROFILE_DIR),
+    keep=int(os.getenv("PROFILE_KEEP", DEFAULT_PROFILE_KEEP)),
+    sample_rate=float(os.getenv("PROFILE_SAMPLE_RATE", 1.0)),
+)
+
+# --- Readiness ---
+# /ready returns 503 until this replica is warm: the Superset pool is open, the admin token has been
+# fetched (upstream mode) and, with READY_AFTER_PREWARM, the pre-warmed guest tokens have been minted
+# (successfully or not; failures are retried by the renewal scheduler). /live only says the process
+# is serving. Point the load balancer / Kubernetes readinessProbe at /ready and livenessProbe at /live.
+READY_AFTER_PREWARM = os.getenv("READY_AFTER_PREWARM", "True").lower() in ['true', '1', 'yes']
+readiness = ReadinessGate()
+readiness.require("superset_pool")
+if GUEST_TOKEN_MODE == "upstream":
+    readiness.require("admin_token")
+if PREWARM_GUEST_TOKENS and READY_AFTER_PREWARM:
+    readiness.require("guest_token_warm_up")
+register_callback("embedding_ready", "1 once this replica has finished its startup work.", lambda: int(readiness.ready))
+
+
+def _log_startup_config() -> None:
+    # Logged once per process from the lifespan, not at import (which tooling and reloaders repeat).
+    logger.info("SUPERSET_RLS_ROLE_NAME (base guest role): %s", SUPERSET_RLS_ROLE_NAME)
+    logger.info("Allowed CORS requests from: %s", FRONTEND_URL)
+    logger.info("Guest token mode: %s", GUEST_TOKEN_MODE)
+    if shared_token_store:
+        logger.info("Shared token store enabled (%s).", REDIS_URL.split('@')[-1])
+    if chart_warmer:
+        logger.info("Chart cache warm-up enabled (concurrency %d).", CHART_WARMUP_CONCURRENCY)
+    _log_tenant_config(tenant_config)
+
+
+async def _wait_for_guest_token_warm_up() -> None:
+    await guest_token_scheduler.wait_warmed_up()
+    readiness.done("guest_token_warm_up")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    _log_startup_config()
+    await superset_client.start()
+    if chart_warmer:
+        await chart_warmer.client.start()
+    readiness.done("superset_pool")
+    # The rest runs in the background so /live answers at once; /ready waits for it.
+    # Local minting never calls Superset, so there is no admin token to keep warm.
+    admin_token_task = asyncio.create_task(_admin_token_refresher()) if GUEST_TOKEN_MODE == "upstream" else None
+    if PREWARM_GUEST_TOKENS:
+        register_prewarmed_guest_tokens()
+    if tenant_config_watcher:
+        tenant_config_watcher.start()
+    # Always running: it also renews the tokens of tenants with an open /guest-token-stream.
+    guest_token_scheduler.start(warm_up=PREWARM_GUEST_TOKENS)
+    warm_up_task = asyncio.create_task(_wait_for_guest_token_warm_up())
+    try:
+        yield
+    finally:
+        warm_up_task.cancel()
+        with suppress(asyncio.CancelledError):
+            await warm_up_task
+        if tenant_config_watcher:
+            await tenant_config_watcher.stop()
+        await guest_token_scheduler.stop()
+        await guest_token_admission.close()
+        await guest_token_cache.cancel_pending()
+        if admin_token_task:
+            admin_token_task.cancel()
+            with suppress(asyncio.CancelledError):
+                await admin_token_task
+        await superset_client.close()
+        if chart_warmer:
+            await chart_warmer.close()
+        if shared_token_store:
+            await shared_token_store.close()
+        credential_store.close()
+
 # --- FastAPI App Setup ---
-app = FastAPI(title="Superset Embedding Middleware")
+app = FastAPI(title="Superset Embedding Middleware", lifespan=lifespan)
 
 origins = [FRONTEND_URL]
 app.add_middleware(
@@ -63,191 +371,418 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[REQUEST_ID_HEADER, "Server-Timing"],
 )
+# SSE streams stay open for minutes to hours and would swamp the latency histogram; they are
+# counted by the embedding_guest_token_stream_connections gauge instead.
+app.add_middleware(RequestMetricsMiddleware, skip_paths=("/metrics", "/live", "/ready", "/guest-token-stream"))
+# Outermost, so Server-Timing's total covers the other middleware too.
+app.add_middleware(RequestTimingMiddleware, profiler=request_profiler, timing_allow_origin=FRONTEND_URL)
+
+# --- Legacy HTML Pages ---
+# Jinja2 and the static file app are only needed by the legacy pages, so they are set up on first
+# use instead of at import (keeps them out of every replica's cold start).
+class _LazyStaticFiles:
+    """ASGI app that creates StaticFiles(directory) on its first request."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._app = None
 
-app.mount("/static", StaticFiles(directory="static"), name="static")
-templates = Jinja2Templates(directory="templates")
+    async def __call__(self, scope, receive, send):
+        if self._app is None:
+            from fastapi.staticfiles import StaticFiles
+            self._app = StaticFiles(directory=self.directory)
+        await self._app(scope, receive, send)
+
+app.mount("/static", _LazyStaticFiles("static"), name="static")
+
+_templates = None
+
+def get_templates():
+    global _templates
+    if _templates is None:
+        from fastapi.templating import Jinja2Templates
+        _templates = Jinja2Templates(directory="templates")
+    return _templates
 
 # --- Models ---
 class LoginRequest(BaseModel):
     # Use a generic 'username' field which can be admin or manufacturer
     username: str
     password: str
+    include_token: bool = False  # Also return the user's guest token, minted while the password is checked
+    dashboard_id: Optional[str] = None  # Dashboard for include_token; defaults to the tenant config's default
+
+class GuestTokenRequestItem(BaseModel):
+    # Exactly one of 'manufacturer' (RLS token) or 'full_access' must be given
+    dashboard_id: Optional[str] = None  # Defaults to the tenant config's default dashboard
+    manufacturer: Optional[str] = None
+    full_access: bool = False
+    user_id: str = "default_full_user"  # Identifier for full-access tokens
+
+class GuestTokenBatchRequest(BaseModel):
+    requests: List[GuestTokenRequestItem]
 
 # --- Helper Functions ---
-# get_superset_tokens remains the same
+# Admin access/CSRF token, shared by all requests in this worker. `expires` is the JWT's own `exp`.
 superset_token_cache: Dict[str, Any] = {"access_token": None, "csrf_token": None, "expires": 0}
-def get_superset_tokens() -> Dict[str, str]:
-    current_time = time.time()
+# Serializes logins so that concurrent callers share one in-flight login instead of stampeding Superset.
+superset_login_lock = asyncio.Lock()
+
+ADMIN_TOKEN_MIN_VALIDITY = 60        # A cached token must be valid at least this long to be handed out
+ADMIN_TOKEN_REFRESH_LEAD = int(os.getenv("ADMIN_TOKEN_REFRESH_LEAD", 300))  # Renew this many seconds before exp
+ADMIN_TOKEN_FALLBACK_TTL = 3300      # Used only if the access token carries no `exp` claim
+ADMIN_TOKEN_RETRY_MIN, ADMIN_TOKEN_RETRY_MAX = 5, 60
+
+
+def _cached_superset_tokens(min_validity: float = ADMIN_TOKEN_MIN_VALIDITY) -> Optional[Dict[str, str]]:
     if (superset_token_cache.get("access_token") and
             superset_token_cache.get("csrf_token") and
-            superset_token_cache.get("expires", 0) > current_time + 60):
-        logger.info("Using cached Superset API tokens (access & csrf).")
+            superset_token_cache.get("expires", 0) > time.time() + min_validity):
         return {
             "access_token": superset_token_cache["access_token"],
             "csrf_token": superset_token_cache["csrf_token"]
         }
+    return None
+
+
+@timed("admin_token")
+async def get_superset_tokens() -> Dict[str, str]:
+    tokens = _cached_superset_tokens()
+    if tokens:
+        logger.debug("Using cached Superset API tokens (access & csrf).")
+        return tokens
+
+    async with superset_login_lock:
+        # Another caller may have completed the login while we were waiting for the lock.
+        tokens = _cached_superset_tokens()
+        if tokens:
+            return tokens
+        return await _obtain_superset_tokens(ADMIN_TOKEN_MIN_VALIDITY)
+
+
+async def refresh_superset_tokens() -> Dict[str, str]:
+    """Renews the admin tokens ahead of expiry unless a concurrent caller already did."""
+    async with superset_login_lock:
+        tokens = _cached_superset_tokens(min_validity=ADMIN_TOKEN_REFRESH_LEAD)
+        if tokens:
+            return tokens
+        return await _obtain_superset_tokens(ADMIN_TOKEN_REFRESH_LEAD)
 
+
+def _adopt_shared_admin_tokens(value: Dict[str, Any], min_validity: float) -> Optional[Dict[str, str]]:
+    """Copies admin tokens read from the shared store into this worker's cache if valid long enough."""
+    if not (value.get("access_token") and value.get("csrf_token")):
+        return None
+    if float(value.get("expires", 0)) <= time.time() + min_validity:
+        return None
+    superset_token_cache.update(access_token=value["access_token"], csrf_token=value["csrf_token"],
+                                expires=float(value["expires"]))
+    return {"access_token": value["access_token"], "csrf_token": value["csrf_token"]}
+
+
+async def _obtain_superset_tokens(min_validity: float) -> Dict[str, str]:
+    """Gets admin tokens from the shared store or by logging in. Callers must hold superset_login_lock.
+
+    With a shared store only one worker logs in at a time (distributed lock); the others wait
+    for its result instead of logging in themselves.
+    """
+    if shared_token_store is None:
+        return await _login_to_superset()
+
+    shared = await shared_token_store.get_json(SHARED_ADMIN_TOKEN_KEY)
+    tokens = _adopt_shared_admin_tokens(shared, min_validity) if shared else None
+    if tokens:
+        logger.info("Using Superset API tokens shared by another worker.")
+        return tokens
+
+    async with shared_token_store.lock(SHARED_ADMIN_TOKEN_KEY, ttl=ADMIN_LOGIN_LOCK_TTL) as acquired:
+        if acquired:
+            # The previous lock holder may have published fresh tokens while we were acquiring the lock.
+            shared = await shared_token_store.get_json(SHARED_ADMIN_TOKEN_KEY)
+            tokens = _adopt_shared_admin_tokens(shared, min_validity) if shared else None
+            if tokens:
+                logger.info("Using Superset API tokens shared by another worker.")
+                return tokens
+            tokens = await _login_to_superset()
+            await shared_token_store.set_json(SHARED_ADMIN_TOKEN_KEY, dict(superset_token_cache),
+                                              ttl=superset_token_cache["expires"] - time.time())
+            return tokens
+
+    logger.info("Another worker is logging in to Superset; waiting for its tokens.")
+    shared = await shared_token_store.wait_for_json(
+        SHARED_ADMIN_TOKEN_KEY, timeout=ADMIN_LOGIN_LOCK_TTL,
+        accept=lambda value: _adopt_shared_admin_tokens(value, min_validity) is not None)
+    if shared:
+        return _adopt_shared_admin_tokens(shared, min_validity)
+    logger.warning("Timed out waiting for shared Superset API tokens; logging in directly.")
+    return await _login_to_superset()
+
+
+@timed("admin_login")
+async def _login_to_superset() -> Dict[str, str]:
+    """Logs in to the Superset API and stores the access/CSRF tokens. Callers must hold superset_login_lock."""
     logger.info("Attempting Superset API login to get access token (for CSRF extraction)...")
-    api_login_url = f"{SUPERSET_URL}/api/v1/security/login"
     login_payload = {"username": SUPERSET_ADMIN_USER, "password": SUPERSET_ADMIN_PASSWORD, "provider": "db"}
     try:
-        with requests.Session() as session:
-            response = session.post(api_login_url, json=login_payload, timeout=10)
-            logger.info(f"Superset Login API Response Status: {response.status_code}")
-            logger.debug(f"Superset Login Response Text: {response.text}")
-            response.raise_for_status()
-            data = response.json()
-            access_token = data.get("access_token")
-            if not access_token:
-                logger.error("Failed to get access_token from Superset API login response.")
-                raise HTTPException(status_code=500, detail="Failed to authenticate with Superset API (access_token missing)")
-
-            try:
-                decoded_token = jwt.decode(access_token, options={"verify_signature": False}, algorithms=["HS256"])
-                csrf_token = decoded_token.get("csrf")
-                if not csrf_token:
-                     logger.error("CSRF claim not found within the decoded access token JWT.")
-                     raise HTTPException(status_code=500, detail="CSRF claim missing in access token")
-                logger.info("Successfully extracted CSRF token from access token JWT.")
-
-            except jwt.DecodeError as e:
-                 logger.error(f"Failed to decode access token JWT: {e}")
-                 raise HTTPException(status_code=500, detail="Failed to decode access token")
-            except Exception as e:
-                 logger.exception(f"Unexpected error during JWT decoding or CSRF extraction: {e}")
-                 raise HTTPException(status_code=500, detail="Error extracting CSRF token from access token")
-
-            cache_duration = 3300
-            superset_token_cache["access_token"] = access_token
-            superset_token_cache["csrf_token"] = csrf_token
-            superset_token_cache["expires"] = current_time + cache_duration
-            logger.info(f"Successfully obtained and cached new Superset API tokens (access & jwt-csrf, valid approx {cache_duration // 60} mins).")
-            return {"access_token": access_token, "csrf_token": csrf_token}
-
-    except requests.exceptions.Timeout:
-        logger.error(f"Timeout connecting to Superset API for login at {api_login_url}")
-        raise HTTPException(status_code=504, detail="Timeout connecting to Superset API login.")
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Network error connecting to Superset API for login: {e}")
-        raise HTTPException(status_code=503, detail=f"Could not connect to Superset API login: {e}")
-    except requests.exceptions.HTTPError as e:
-        detail = f"Superset API login failed ({e.response.status_code})"
+        data = await superset_client.post_json("/api/v1/security/login", login_payload,
+                                               timeout=10, label="Superset Login API")
+        access_token = data.get("access_token")
+        if not access_token:
+            logger.error("Failed to get access_token from Superset API login response.")
+            raise HTTPException(status_code=500, detail="Failed to authenticate with Superset API (access_token missing)")
+
         try:
-            superset_error = e.response.json().get("message", e.response.text)
-            detail += f": {superset_error}"
-        except ValueError:
-             detail += f": {e.response.text}"
-        logger.error(detail)
-        raise HTTPException(status_code=e.response.status_code, detail=detail)
+            decoded_token = jwt.decode(access_token, options={"verify_signature": False}, algorithms=["HS256"])
+            csrf_token = decoded_token.get("csrf")
+            if not csrf_token:
+                 logger.error("CSRF claim not found within the decoded access token JWT.")
+                 raise HTTPException(status_code=500, detail="CSRF claim missing in access token")
+            logger.info("Successfully extracted CSRF token from access token JWT.")
+
+        except jwt.DecodeError as e:
+             logger.error("Failed to decode access token JWT: %s", e)
+             raise HTTPException(status_code=500, detail="Failed to decode access token")
+
+        exp = decoded_token.get("exp")
+        expires = float(exp) if isinstance(exp, (int, float)) else time.time() + ADMIN_TOKEN_FALLBACK_TTL
+        superset_token_cache["access_token"] = access_token
+        superset_token_cache["csrf_token"] = csrf_token
+        superset_token_cache["expires"] = expires
+        ADMIN_TOKEN_REFRESHES.inc("success")
+        logger.info("Successfully obtained and cached new Superset API tokens (access & jwt-csrf, valid approx %d mins).",
+                    int(expires - time.time()) // 60)
+        return {"access_token": access_token, "csrf_token": csrf_token}
+
+    except HTTPException:
+        ADMIN_TOKEN_REFRESHES.inc("failure")
+        raise
     except Exception as e:
+        ADMIN_TOKEN_REFRESHES.inc("failure")
         logger.exception("Unexpected error during Superset API authentication / CSRF extraction.")
         raise HTTPException(status_code=500, detail="Unexpected error during Superset authentication / CSRF extraction.")
 
 
-# _fetch_guest_token_base remains the same
-async def _fetch_guest_token_base(payload: Dict[str, Any]) -> str:
+async def _admin_token_refresher() -> None:
+    """Background task: keeps the admin tokens renewed so request handlers never wait on a login."""
+    retry_delay = ADMIN_TOKEN_RETRY_MIN
+    while True:
+        try:
+            await refresh_superset_tokens()
+            readiness.done("admin_token")
+            retry_delay = ADMIN_TOKEN_RETRY_MIN
+            delay = superset_token_cache["expires"] - time.time() - ADMIN_TOKEN_REFRESH_LEAD
+            # Never spin: if the token's lifetime is shorter than the lead, renew at half its remaining life.
+            if delay <= 0:
+                delay = max((superset_token_cache["expires"] - time.time()) / 2, ADMIN_TOKEN_RETRY_MIN)
+        except asyncio.CancelledError:
+            raise
+        except HTTPException as e:
+            logger.error("Background Superset admin token refresh failed (%s): %s. Retrying in %ss.",
+                         e.status_code, e.detail, retry_delay)
+            readiness.fail("admin_token", f"login failed ({e.status_code}), retrying")
+            delay = retry_delay
+            retry_delay = min(retry_delay * 2, ADMIN_TOKEN_RETRY_MAX)
+        except Exception:
+            logger.exception("Unexpected error in background Superset admin token refresh. Retrying in %ss.", retry_delay)
+            readiness.fail("admin_token", "login failed, retrying")
+            delay = retry_delay
+            retry_delay = min(retry_delay * 2, ADMIN_TOKEN_RETRY_MAX)
+        await asyncio.sleep(delay)
+
+
+async def _admin_api_headers() -> Dict[str, str]:
+    tokens = await get_superset_tokens()
+    return {"Authorization": f"Bearer {tokens['access_token']}", "X-CSRFToken": tokens["csrf_token"]}
+
+
+async def _fetch_guest_token_base(guest_request: GuestTokenRequest) -> str:
     try:
-        tokens = get_superset_tokens()
+        tokens = await get_superset_tokens()
         access_token = tokens["access_token"]
         csrf_token = tokens["csrf_token"]
     except HTTPException as e:
-         logger.error(f"Failed to obtain necessary tokens for guest token fetch: {e.detail}")
+         logger.error("Failed to obtain necessary tokens for guest token fetch: %s", e.detail)
          raise e
 
-    guest_token_url = f"{SUPERSET_URL}/api/v1/security/guest_token/"
     headers = {
         "Authorization": f"Bearer {access_token}",
         "X-CSRFToken": csrf_token,
         "Content-Type": "application/json",
         "Accept": "application/json",
     }
+    request_id = current_request_id()
+    if request_id:
+        headers[REQUEST_ID_HEADER] = request_id
 
-    logger.info(f"Attempting to fetch guest token from: {guest_token_url}")
-    logger.debug(f"Using Admin Token: Bearer {access_token[:10]}...")
-    logger.debug(f"Using JWT-CSRF Token: {csrf_token[:10]}...")
-    logger.info(f"Guest Token Request Payload: {payload}")
+    logger.info("Attempting to fetch guest token from Superset guest token API.", extra=SAMPLED)
+    # Rendered (redacted) by the log writer thread, and only when DEBUG is enabled.
+    logger.debug("Guest Token Request Payload: %s", Redacted(guest_request.payload))
 
     try:
-        response = requests.post(guest_token_url, headers=headers, json=payload, timeout=15)
-        logger.info(f"Superset Guest Token API Response Status: {response.status_code}")
-        logger.debug(f"Superset Guest Token API Response Text: {response.text[:500]}")
-        response.raise_for_status()
-
-        data = response.json()
+        # The body was serialized once when the tenant config was compiled.
+        with phase("guest_token_api"):
+            data = await superset_client.post_json("/api/v1/security/guest_token/", guest_request.body, timeout=15,
+                                                   headers=headers, label="Superset Guest Token API")
         guest_token = data.get("token")
         if not guest_token:
             logger.error("Guest token key 'token' not found in successful Superset API response.")
             raise HTTPException(status_code=500, detail="Guest token missing in Superset response body")
 
-        logger.info("Successfully obtained guest token.")
+        logger.info("Successfully obtained guest token.", extra=SAMPLED)
         return guest_token
 
-    except requests.exceptions.Timeout:
-        logger.error(f"Timeout connecting to Superset API for guest token at {guest_token_url}")
-        raise HTTPException(status_code=504, detail="Timeout connecting to Superset API guest token.")
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Network error connecting to Superset API for guest token: {e}")
-        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=f"Could not connect to Superset API for guest token: {e}")
-    except requests.exceptions.HTTPError as e:
-        detail_message = f"Superset API guest token request failed ({e.response.status_code})"
-        try:
-            superset_error = e.response.json().get("message", e.response.text)
-            if isinstance(superset_error, dict):
-                 field_errors = [f"{field}: {', '.join(msgs)}" for field, msgs in superset_error.items()]
-                 detail_message += f": {'; '.join(field_errors)}"
-            else:
-                 detail_message += f": {superset_error}"
-        except ValueError:
-             detail_message += f": {e.response.text}"
-        logger.error(f"Raising HTTPException for guest token failure: {detail_message}")
-        raise HTTPException(status_code=e.response.status_code, detail=detail_message)
+    except HTTPException as e:
+        logger.error("Raising HTTPException for guest token failure: %s", e.detail)
+        raise
     except Exception as e:
         logger.exception("Unexpected error fetching Superset guest token.")
         raise HTTPException(status_code=500, detail="Unexpected error fetching guest token.")
 
 
-# fetch_superset_guest_token_rls remains the same
-async def fetch_superset_guest_token_rls(manufacturer: str) -> str:
-    """Fetches a guest token with RLS applied based on the Manufacturer column."""
-    logger.info(f"Fetching RLS guest token for Manufacturer: '{manufacturer}'")
-    rls_clause = f"\"{RLS_COLUMN_NAME}\" = '{manufacturer}'"
-    logger.info(f"Constructed RLS clause: {rls_clause}")
-
-    rls_rule = {"clause": rls_clause}
-    if RLS_DATASET_ID is not None and isinstance(RLS_DATASET_ID, int):
-        rls_rule["dataset_id"] = RLS_DATASET_ID
-        logger.info(f"Applying RLS rule to specific dataset ID: {RLS_DATASET_ID}")
-
-    safe_manufacturer_part = "".join(c if c.isalnum() else '_' for c in manufacturer)[:30]
-    guest_username = f"guest_mfr_{safe_manufacturer_part}_{int(time.time())}"
-
-    payload = {
-        "user": {
-            "username": guest_username,
-            "first_name": "Embedded Mfr",
-            "last_name": f"User ({manufacturer[:20]})",
-        },
-        "resources": [{"type": "dashboard", "id": SUPERSET_DASHBOARD_ID}],
-        "rls": [rls_rule]
-    }
-    return await _fetch_guest_token_base(payload)
-
-
-# fetch_superset_guest_token_full remains the same
-async def fetch_superset_guest_token_full(user_identifier: str = "full_access") -> str:
-    logger.info(f"Fetching FULL access guest token for identifier: {user_identifier}")
-    guest_username = f"guest_full_{user_identifier}_{int(time.time())}"
-    payload = {
-        "user": {
-            "username": guest_username,
-            "first_name": "Embedded Full",
-            "last_name": f"User ({user_identifier[:20]})" # Include identifier in name
-        },
-        "resources": [{"type": "dashboard", "id": SUPERSET_DASHBOARD_ID}],
-        "rls": []
+def _mint_guest_token_locally(payload: Dict[str, Any]) -> str:
+    """Signs a guest token with the same claims Superset's create_guest_access_token produces.
+
+    Superset's parse_jwt_guest_token verifies the signature, `aud` and `exp`, then requires
+    `type == "guest"` and reads `user`, `resources` and `rls_rules`. Unlike the upstream API,
+    this does not check that the requested dashboards are embeddable.
+    """
+    now = time.time()
+    claims = {
+        "user": payload["user"],
+        "resources": payload["resources"],
+        "rls_rules": payload["rls"],
+        "iat": now,
+        "exp": now + GUEST_TOKEN_JWT_EXP_SECONDS,
+        "aud": GUEST_TOKEN_JWT_AUDIENCE,
+        "type": "guest",
     }
-    return await _fetch_guest_token_base(payload)
+    return jwt.encode(claims, GUEST_TOKEN_JWT_SECRET, algorithm=GUEST_TOKEN_JWT_ALGO)
+
+
+async def _mint_guest_token(guest_request: GuestTokenRequest) -> str:
+    """Mints a guest token using the configured GUEST_TOKEN_MODE."""
+    if GUEST_TOKEN_MODE == "local":
+        return _mint_guest_token_locally(guest_request.payload)
+    return await _fetch_guest_token_base(guest_request)
+
+
+async def _mint_guest_token_shared(guest_request: GuestTokenRequest) -> str:
+    """Mints a guest token, first reusing one another worker already minted into the shared store."""
+    if shared_token_store is None or GUEST_TOKEN_MODE == "local":
+        return await _mint_guest_token(guest_request)
+
+    name = shared_token_store.guest_token_key(guest_request.key)
+    shared = await shared_token_store.get_json(name)
+    # Only adopt tokens that will not be due for renewal straight away.
+    if shared and (shared.get("exp") or 0) - GUEST_TOKEN_CACHE_SAFETY_MARGIN > time.time() + GUEST_TOKEN_RENEW_LEAD:
+        return shared["token"]
+
+    token = await _mint_guest_token(guest_request)
+    exp = token_expiry(token)
+    if exp is not None:
+        await shared_token_store.set_json(name, {"token": token, "exp": exp},
+                                          ttl=exp - GUEST_TOKEN_STALE_MARGIN - time.time())
+    return token
+
+
+def _admission_tenant(identity: str) -> str:
+    """The rate-limit bucket of a guest token identity.
+
+    Full-access ids and manufacturer names come from the query string, so only configured
+    manufacturers get a bucket of their own; every full-access request shares one bucket, and so
+    do unconfigured manufacturer names. Rotating the id therefore adds no capacity.
+    """
+    if identity.startswith("full:"):
+        return "full"
+    if identity[len("mfr:"):] in tenant_config.policies:
+        return identity
+    return "mfr:unconfigured"
+
+
+async def _fetch_guest_token_cached(guest_request: GuestTokenRequest, client: Optional[str] = None) -> str:
+    """Returns a cached guest token for (dashboard, identity, RLS rules), minting one on a miss.
+
+    `client` is the caller's address; a request that would start a mint is rate limited per tenant
+    and per client. Internal callers (pre-warm, renewal) pass None and are not limited.
+    """
+    key = guest_request.key
+    if client is not None and RATE_LIMIT_ENABLED and guest_token_cache.needs_mint(key):
+        with phase("rate_limit_wait"):
+            await guest_token_admission.acquire(_admission_tenant(guest_request.identity), client)
+    upstream_unavailable = GUEST_TOKEN_MODE == "upstream" and superset_client.breaker.is_open
+    return await guest_token_cache.get_or_mint(key, lambda: _mint_guest_token_shared(guest_request),
+                                               upstream_unavailable=upstream_unavailable)
+
+
+def build_rls_guest_token_request(manufacturer: str, dashboard_id: Optional[str] = None) -> GuestTokenRequest:
+    """Returns the precompiled guest token request for an RLS token restricted to one manufacturer."""
+    return tenant_config.rls_request(manufacturer, dashboard_id)
+
+
+def build_full_guest_token_request(user_identifier: str, dashboard_id: Optional[str] = None) -> GuestTokenRequest:
+    """Returns the guest token request for a full-access token (precompiled for configured admins)."""
+    return tenant_config.full_request(user_identifier, dashboard_id)
+
+
+async def fetch_superset_guest_token_rls(manufacturer: str, dashboard_id: Optional[str] = None,
+                                        client: Optional[str] = None) -> str:
+    """Fetches a guest token with RLS applied based on the Manufacturer column."""
+    logger.info("Fetching RLS guest token for Manufacturer: '%s'", manufacturer, extra=SAMPLED)
+    guest_request = build_rls_guest_token_request(manufacturer, dashboard_id)
+    token = await _fetch_guest_token_cached(guest_request, client)
+    if chart_warmer:
+        chart_warmer.schedule(guest_request.identity, guest_request.payload["resources"][0]["id"], token)
+    return token
+
+
+async def fetch_superset_guest_token_full(user_identifier: str = "full_access", dashboard_id: Optional[str] = None,
+                                         client: Optional[str] = None) -> str:
+    logger.info("Fetching FULL access guest token for identifier: %s", user_identifier, extra=SAMPLED)
+    return await _fetch_guest_token_cached(build_full_guest_token_request(user_identifier, dashboard_id), client)
+
+
+async def fetch_guest_token_for_role(username: str, role: str, dashboard_id: Optional[str] = None,
+                                     client: Optional[str] = None) -> str:
+    """Fetches the guest token a logged-in user gets: full access for the admin, RLS for a manufacturer."""
+    if role == ROLE_ADMIN:
+        return await fetch_superset_guest_token_full(username, dashboard_id, client)
+    return await fetch_superset_guest_token_rls(username, dashboard_id, client)
+
+
+# Keys registered for pre-warming, so a tenant config reload can drop tenants that were removed.
+_prewarmed_keys: set = set()
+
+def register_prewarmed_guest_tokens() -> None:
+    """Registers the RLS token of every configured manufacturer, plus the admins' full-access tokens, for warm-up and renewal."""
+    requests_to_warm = tenant_config.prewarm_requests(only=PREWARM_TENANTS)
+    keys = {guest_request.key for guest_request in requests_to_warm}
+    for key in _prewarmed_keys - keys:
+        guest_token_scheduler.unregister(key)
+    for guest_request in requests_to_warm:
+        if guest_request.key not in _prewarmed_keys:
+            guest_token_scheduler.register(guest_request.key,
+                                           lambda guest_request=guest_request: _mint_guest_token_shared(guest_request))
+    _prewarmed_keys.clear()
+    _prewarmed_keys.update(keys)
+    logger.info("Registered %d guest tokens for pre-warming and scheduled renewal.", len(requests_to_warm))
+
+
+def apply_tenant_config(config: TenantConfig) -> None:
+    """Swaps in a reloaded tenant config. Cached tokens of unchanged tenants stay valid (their cache keys are unchanged)."""
+    global tenant_config
+    previous = tenant_config
+    tenant_config = config
+    credential_store.replace(config.credentials)
+    _log_tenant_config(config)
+    if PREWARM_GUEST_TOKENS:
+        register_prewarmed_guest_tokens()
+    logger.info("Tenant config reloaded: %s -> %s", previous.version, config.version)
+
+
+tenant_config_watcher = (TenantConfigWatcher(TENANTS_FILE, _load_tenant_config, apply_tenant_config,
+                                             interval=TENANTS_RELOAD_INTERVAL) if TENANTS_FILE else None)
 
 
 # --- API Endpoints ---
@@ -256,118 +791,319 @@ async def fetch_superset_guest_token_full(user_identifier: str = "full_access")
 @app.get("/", response_class=HTMLResponse, include_in_schema=False)
 async def get_login_page_html(request: Request):
     logger.warning("Serving legacy login HTML page. Authentication may differ from React app.")
-    return templates.TemplateResponse("login.html", {"request": request})
+    return get_templates().TemplateResponse("login.html", {"request": request})
 
 @app.get("/dashboard", response_class=HTMLResponse, include_in_schema=False)
 async def get_dashboard_page_rls_html(request: Request, manufacturer: Optional[str] = None):
     if not manufacturer:
          logger.warning("Legacy RLS Dashboard page accessed without manufacturer. Redirecting to legacy login.")
          return RedirectResponse(url="/", status_code=status.HTTP_303_SEE_OTHER)
-    logger.warning(f"Serving legacy RLS dashboard HTML page for manufacturer: {manufacturer}. Template compatibility not guaranteed.")
-    context = {"request": request, "dashboard_id": SUPERSET_DASHBOARD_ID, "superset_url": SUPERSET_URL, "manufacturer": manufacturer}
-    return templates.TemplateResponse("dashboard.html", context)
+    logger.warning("Serving legacy RLS dashboard HTML page for manufacturer: %s. Template compatibility not guaranteed.",
+                   manufacturer)
+    context = {"request": request, "dashboard_id": tenant_config.default_dashboard_id, "superset_url": SUPERSET_URL, "manufacturer": manufacturer}
+    return get_templates().TemplateResponse("dashboard.html", context)
 
 @app.get("/dashboard-full", response_class=HTMLResponse, include_in_schema=False)
 async def get_dashboard_page_full_html(request: Request):
     logger.info("Serving legacy FULL access dashboard HTML page.")
-    context = {"request": request, "dashboard_id": SUPERSET_DASHBOARD_ID, "superset_url": SUPERSET_URL}
-    return templates.TemplateResponse("dashboard_full.html", context)
+    context = {"request": request, "dashboard_id": tenant_config.default_dashboard_id, "superset_url": SUPERSET_URL}
+    return get_templates().TemplateResponse("dashboard_full.html", context)
 
 
 # --- API Endpoints for React Frontend ---
 
+# --- Request Helpers ---
+def client_address(request: Request) -> str:
+    return request.client.host if request.client else "unknown"
+
+
+# --- Session Helpers ---
+def get_session(request: Request) -> Optional[Session]:
+    """Returns the caller's session from the session cookie or an 'Authorization: Bearer' header, if valid."""
+    token = request.cookies.get(session_manager.cookie_name)
+    authorization = request.headers.get("Authorization", "")
+    if authorization.startswith("Bearer "):
+        token = authorization[len("Bearer "):]
+    return session_manager.verify(token) if token else None
+
+
+def authorize_guest_token_request(session: Optional[Session], manufacturer: Optional[str] = None) -> None:
+    """Checks that the session may obtain an RLS token for `manufacturer`, or a full-access token if it is None."""
+    if session is None:
+        if REQUIRE_SESSION:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Login required")
+        return
+    if session.role == ROLE_ADMIN:
+        return
+    if manufacturer is None or manufacturer != session.username:
+        logger.warning("User '%s' denied guest token for %s", session.username, manufacturer or "full access")
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not allowed to access this dashboard view")
+
+
 # --- UPDATED Login Endpoint ---
 @app.post("/login", status_code=status.HTTP_200_OK)
-async def handle_login(login_data: LoginRequest):
-    """Handles user login attempt for Admin or Manufacturer."""
+@timed("handler")
+async def handle_login(login_data: LoginRequest, request: Request, response: Response):
+    """Handles user login attempt for Admin or Manufacturer.
+
+    Issues a session (cookie and 'session_token'). With include_token, the user's guest token is
+    returned as well; its mint starts before the password check finishes and is dropped if it fails.
+    """
     username = login_data.username
     password = login_data.password
-    logger.info(f"API Login attempt for username: '{username}'")
-
-    # --- Check if it's the Admin User ---
-    if username == ADMIN_CREDENTIALS.get("username"):
-        # IMPORTANT: Use secure password comparison in production
-        if password == ADMIN_CREDENTIALS.get("password"):
-            logger.info(f"API Login successful for Admin user: '{username}'")
-            # Return admin user type and identifier
-            return {
-                "message": "Login successful",
-                "user_type": "admin",
-                "user_identifier": username # Use the admin username as identifier
-            }
+    logger.info("API Login attempt for username: '%s'", username, extra=SAMPLED)
+
+    speculative_mint: Optional[asyncio.Task] = None
+    expected_role = credential_store.role_of(username)
+    if login_data.include_token and expected_role is not None:
+        speculative_mint = asyncio.create_task(fetch_guest_token_for_role(username, expected_role, login_data.dashboard_id,
+                                                                         client_address(request)))
+        speculative_mint.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+    # Hash verification runs on a thread pool; the role tells Admin and Manufacturer apart.
+    with phase("password_check"):
+        role = await credential_store.verify(username, password)
+    if role is None:
+        if speculative_mint:
+            speculative_mint.cancel()  # Only stops waiting; a mint already under way still fills the cache
+        if username in credential_store:
+            logger.warning("API Login failed for user: '%s' - Invalid password", username)
         else:
-            logger.warning(f"API Login failed for Admin user: '{username}' - Invalid password")
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid Username or Password",
-            )
+            logger.warning("API Login failed: User '%s' not found as Admin or Manufacturer.", username)
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid Username or Password",
+        )
 
-    # --- If not Admin, check if it's a Manufacturer ---
+    session_token, session_expires_at = session_manager.issue(username, role)
+    response.set_cookie(session_manager.cookie_name, session_token, max_age=int(session_manager.ttl),
+                        httponly=True, samesite="lax", secure=session_manager.cookie_secure)
+
+    if role == ROLE_ADMIN:
+        logger.info("API Login successful for Admin user: '%s'", username)
+        # Return admin user type and identifier
+        result = {
+            "message": "Login successful",
+            "user_type": "admin",
+            "user_identifier": username # Use the admin username as identifier
+        }
     else:
-        expected_password = MANUFACTURER_PASSWORDS.get(username) # username is manufacturer name here
-
-        if expected_password is None:
-            logger.warning(f"API Login failed: User '{username}' not found as Admin or Manufacturer.")
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid Username or Password",
-            )
-
-        # IMPORTANT: Use secure password comparison in production
-        if password == expected_password:
-            logger.info(f"API Login successful for Manufacturer: '{username}'")
-            # Return manufacturer user type and identifier (manufacturer name)
-            return {
-                "message": "Login successful",
-                "user_type": "manufacturer",
-                "user_identifier": username # Use manufacturer name as identifier
-            }
-        else:
-            logger.warning(f"API Login failed for Manufacturer: '{username}' - Invalid password")
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid Username or Password",
-            )
+        logger.info("API Login successful for Manufacturer: '%s'", username, extra=SAMPLED)
+        # Return manufacturer user type and identifier (manufacturer name)
+        result = {
+            "message": "Login successful",
+            "user_type": "manufacturer",
+            "user_identifier": username # Use manufacturer name as identifier
+        }
+    result["session_token"] = session_token
+    result["session_expires_at"] = session_expires_at
+
+    if login_data.include_token:
+        # A failed mint does not fail the login; the frontend falls back to the token endpoints.
+        try:
+            token = await (speculative_mint or fetch_guest_token_for_role(username, role, login_data.dashboard_id,
+                                                                                 client_address(request)))
+            result["token"] = token
+            result["token_expires_at"] = token_expiry(token)
+        except HTTPException as e:
+            logger.error("Guest token for '%s' not issued with login: %s - %s", username, e.status_code, e.detail)
+            result["token"] = None
+            result["token_error"] = e.detail
+        except Exception:
+            logger.exception("Unexpected error minting guest token with login for '%s'", username)
+            result["token"] = None
+            result["token_error"] = "Internal server error generating guest token"
+    return result
+
+@app.post("/logout", status_code=status.HTTP_200_OK)
+async def handle_logout(response: Response):
+    """Clears the session cookie. Session tokens are stateless and stay valid until they expire."""
+    response.delete_cookie(session_manager.cookie_name)
+    return {"message": "Logged out"}
 
 # --- RLS Token Endpoint (Unchanged, called by React for manufacturers) ---
 @app.get("/get-guest-token-rls")
-async def get_guest_token_rls_endpoint(manufacturer: str):
+@timed("handler")
+async def get_guest_token_rls_endpoint(request: Request, manufacturer: str, dashboard_id: Optional[str] = None,
+                                       session: Optional[Session] = Depends(get_session)):
     """Provides an RLS-secured guest token for the specified manufacturer."""
     if not manufacturer:
         logger.error("API RLS Guest token requested without manufacturer.")
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Manufacturer name is required for RLS token")
-    logger.info(f"API Received request for RLS guest token for manufacturer: '{manufacturer}'")
+    authorize_guest_token_request(session, manufacturer)
+    logger.info("API Received request for RLS guest token for manufacturer: '%s'", manufacturer, extra=SAMPLED)
     try:
-        token = await fetch_superset_guest_token_rls(manufacturer)
+        token = await fetch_superset_guest_token_rls(manufacturer, dashboard_id, client_address(request))
         return {"token": token}
     except HTTPException as e:
-        logger.error(f"HTTPException propagated from RLS token fetch for '{manufacturer}': {e.status_code} - {e.detail}")
+        logger.error("HTTPException propagated from RLS token fetch for '%s': %s - %s", manufacturer, e.status_code, e.detail)
         raise e
     except Exception as e:
-        logger.exception(f"Unexpected error in get_guest_token_rls_endpoint for manufacturer '{manufacturer}'")
+        logger.exception("Unexpected error in get_guest_token_rls_endpoint for manufacturer '%s'", manufacturer)
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Internal server error generating RLS guest token")
 
 # --- Full Access Token Endpoint (Unchanged, called by React for admin) ---
 @app.get("/get-guest-token-full")
-async def get_guest_token_full_endpoint(user_id: str = "default_full_user"):
+@timed("handler")
+async def get_guest_token_full_endpoint(request: Request, user_id: str = "default_full_user", dashboard_id: Optional[str] = None,
+                                        session: Optional[Session] = Depends(get_session)):
     """Provides a guest token with full dashboard access (permissions defined by GUEST_ROLE_NAME)."""
-    logger.info(f"API Received request for FULL access guest token for user: {user_id}")
+    authorize_guest_token_request(session)
+    logger.info("API Received request for FULL access guest token for user: %s", user_id, extra=SAMPLED)
     try:
-        token = await fetch_superset_guest_token_full(user_identifier=user_id)
+        token = await fetch_superset_guest_token_full(user_identifier=user_id, dashboard_id=dashboard_id,
+                                                      client=client_address(request))
         return {"token": token}
     except HTTPException as e:
-        logger.error(f"HTTPException propagated from FULL token fetch for {user_id}: {e.status_code} - {e.detail}")
+        logger.error("HTTPException propagated from FULL token fetch for %s: %s - %s", user_id, e.status_code, e.detail)
         raise e
     except Exception as e:
-        logger.exception(f"Unexpected error in get_guest_token_full_endpoint for user {user_id}")
+        logger.exception("Unexpected error in get_guest_token_full_endpoint for user %s", user_id)
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Internal server error generating full access guest token")
 
+# --- Batch Guest Token Endpoint (several dashboards and/or tenants in one round trip) ---
+async def _resolve_batch_item(item: GuestTokenRequestItem, semaphore: asyncio.Semaphore,
+                              session: Optional[Session], client: str) -> Dict[str, Any]:
+    result: Dict[str, Any] = {
+        "dashboard_id": item.dashboard_id or tenant_config.default_dashboard_id,
+        "manufacturer": item.manufacturer,
+        "full_access": item.full_access,
+    }
+    try:
+        if bool(item.manufacturer) == item.full_access:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Each request needs exactly one of 'manufacturer' or 'full_access'")
+        authorize_guest_token_request(session, item.manufacturer)
+        async with semaphore:
+            if item.full_access:
+                result["token"] = await fetch_superset_guest_token_full(item.user_id, item.dashboard_id, client)
+            else:
+                result["token"] = await fetch_superset_guest_token_rls(item.manufacturer, item.dashboard_id, client)
+    except HTTPException as e:
+        result["error"] = {"status_code": e.status_code, "detail": e.detail}
+    except Exception:
+        logger.exception("Unexpected error resolving batch guest token item: %s", result)
+        result["error"] = {"status_code": status.HTTP_500_INTERNAL_SERVER_ERROR, "detail": "Internal server error generating guest token"}
+    return result
+
+@app.post("/guest-tokens")
+@timed("handler")
+async def get_guest_tokens_batch_endpoint(batch: GuestTokenBatchRequest, request: Request,
+                                          session: Optional[Session] = Depends(get_session)):
+    """Resolves several guest tokens concurrently. Results are returned in request order, each with a 'token' or an 'error'."""
+    if session is None and REQUIRE_SESSION:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Login required")
+    if not batch.requests:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="At least one guest token request is required")
+    if len(batch.requests) > GUEST_TOKEN_BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"At most {GUEST_TOKEN_BATCH_MAX_ITEMS} guest token requests per batch")
+    logger.info("API Received batch request for %d guest tokens", len(batch.requests), extra=SAMPLED)
+    semaphore = asyncio.Semaphore(GUEST_TOKEN_BATCH_CONCURRENCY)
+    results = await asyncio.gather(*(_resolve_batch_item(item, semaphore, session, client_address(request)) for item in batch.requests))
+    return {"results": results}
+
+# --- Guest Token Stream (Server-Sent Events) ---
+def _sse_event(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def _token_event(token: str) -> str:
+    return _sse_event("token", {"token": token, "exp": token_expiry(token)})
+
+@app.get("/guest-token-stream")
+@timed("handler")
+async def get_guest_token_stream(request: Request, manufacturer: Optional[str] = None, full_access: bool = False,
+                                 user_id: str = "default_full_user", dashboard_id: Optional[str] = None,
+                                 session: Optional[Session] = Depends(get_session)):
+    """Streams the current guest token, then each renewed one shortly before the previous one expires.
+
+    Renewals come from the shared renewal scheduler, so every connection for the same tenant receives
+    the same token and an idle connection costs one parked coroutine and a one-slot queue.
+    """
+    if bool(manufacturer) == full_access:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Exactly one of 'manufacturer' or 'full_access' is required")
+    authorize_guest_token_request(session, manufacturer)
+    if full_access:
+        guest_request = build_full_guest_token_request(user_id, dashboard_id)
+    else:
+        guest_request = build_rls_guest_token_request(manufacturer, dashboard_id)
+    key, identity = guest_request.key, guest_request.identity
+    # Resolve the first token before the response starts, so failures are reported as plain HTTP errors.
+    token = await _fetch_guest_token_cached(guest_request, client_address(request))
+    queue = guest_token_scheduler.subscribe(key, lambda: _mint_guest_token_shared(guest_request))
+    logger.info("Guest token stream opened for %s (%d open)", identity, guest_token_scheduler.subscriber_count)
+
+    async def events():
+        try:
+            yield f"retry: 5000\n{_token_event(token)}"
+            latest = guest_token_cache.get(key)
+            if latest is not None and latest != token:
+                yield _token_event(latest)  # Renewed while this stream was being set up
+            while True:
+                try:
+                    renewed = await asyncio.wait_for(queue.get(), timeout=GUEST_TOKEN_STREAM_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield _token_event(renewed)
+        finally:
+            guest_token_scheduler.unsubscribe(key, queue)
+            logger.info("Guest token stream closed for %s", identity)
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# --- Guest Token Cache Statistics ---
+@app.get("/guest-token-cache/stats")
+async def get_guest_token_cache_stats():
+    """Reports guest-token cache size and hit/miss counters, plus pre-warm renewal counters."""
+    return {**guest_token_cache.stats(), "renewal": guest_token_scheduler.stats()}
+
+# --- Health Endpoint ---
+@app.get("/health")
+async def get_health():
+    """Reports Superset circuit-breaker state, admin token validity and guest-token cache health."""
+    breaker = superset_client.breaker.snapshot()
+    admin_valid_for = max(superset_token_cache.get("expires", 0) - time.time(), 0)
+    degraded = GUEST_TOKEN_MODE == "upstream" and breaker["state"] != CircuitBreaker.CLOSED
+    return {
+        "status": "degraded" if degraded else "ok",
+        "guest_token_mode": GUEST_TOKEN_MODE,
+        "superset_circuit": breaker,
+        "superset_adaptive_timeouts": superset_client.adaptive_timeout.snapshot(),
+        "admin_token_valid_for": round(admin_valid_for),
+        "guest_token_cache": {k: guest_token_cache.stats()[k] for k in ("entries", "hit_ratio", "stale_served")},
+        "shared_token_store": shared_token_store.stats() if shared_token_store else None,
+        "credential_store": credential_store.stats(),
+        "tenant_config": tenant_config.describe(),
+        "rate_limit": guest_token_admission.stats() if RATE_LIMIT_ENABLED else None,
+        "chart_warmup": chart_warmer.stats() if chart_warmer else None,
+        "logging": logging_runtime.stats(),
+    }
+
+# --- Probes ---
+@app.get("/live", include_in_schema=False)
+async def get_live():
+    """Liveness: the process is up and its event loop is serving. Touches no upstream or cache."""
+    return {"status": "alive"}
+
+@app.get("/ready", include_in_schema=False)
+async def get_ready():
+    """Readiness: 200 once startup work (pool, admin token, pre-warmed tokens) is done, 503 until then."""
+    body = json.dumps(readiness.snapshot())
+    return Response(content=body, media_type="application/json",
+                    status_code=status.HTTP_200_OK if readiness.ready else status.HTTP_503_SERVICE_UNAVAILABLE)
+
+# --- Prometheus Metrics ---
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """Exposes this worker's metrics in Prometheus text format."""
+    return Response(content=REGISTRY.render(), media_type=METRICS_CONTENT_TYPE)
+
 # --- Run Instruction ---
 if __name__ == "__main__":
     import uvicorn
     port = int(os.getenv("PORT", 8000))
     host = os.getenv("HOST", "0.0.0.0")
     reload_flag = bool(os.getenv("RELOAD", "False").lower() in ['true', '1', 'yes'])
-    logger.info(f"Starting FastAPI development server on http://{host}:{port}")
-    logger.info(f"Auto-reload {'enabled' if reload_flag else 'disabled'}.")
+    logger.info("Starting FastAPI development server on http://%s:%s", host, port)
+    logger.info("Auto-reload %s.", "enabled" if reload_flag else "disabled")
     uvicorn.run("main:app", host=host, port=port, reload=reload_flag)
\ No newline at end of file
@@ -0,0 +1,180 @@
+# embedding_app/metrics.py
+# Minimal Prometheus instrumentation for the middleware.
+#
+# Each uvicorn worker runs a single asyncio event loop, so metric updates never race and need no
+# locks: recording is a dict lookup plus an in-place increment. Values are per worker process.
+import time
+from bisect import bisect_left
+from typing import Dict, List, Tuple, Callable, Sequence, Optional
+
+# --- Defaults ---
+# Latency buckets in seconds, from sub-millisecond cache hits up to the upstream timeouts.
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 15.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class _Metric:
+    type_name = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labelvalues: str, amount: float = 1) -> None:
+        self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def value(self, *labelvalues: str) -> float:
+        return self._values.get(labelvalues, 0)
+
+    def render(self) -> List[str]:
+        return [f"{self.name}{_labels(self.labelnames, k)} {_format_value(v)}" for k, v in self._values.items()]
+
+
+class Gauge(Counter):
+    type_name = "gauge"
+
+    def dec(self, *labelvalues: str, amount: float = 1) -> None:
+        self._values[labelvalues] = self._values.get(labelvalues, 0) - amount
+
+    def set(self, value: float, *labelvalues: str) -> None:
+        self._values[labelvalues] = value
+
+
+class CallbackMetric(_Metric):
+    """A gauge or counter whose value is read from a callback at scrape time (e.g. cache statistics)."""
+
+    def __init__(self, name: str, documentation: str, callback: Callable[[], float], type_name: str = "gauge"):
+        super().__init__(name, documentation)
+        self.callback = callback
+        self.type_name = type_name
+
+    def render(self) -> List[str]:
+        return [f"{self.name} {_format_value(self.callback())}"]
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [per-bucket counts (non-cumulative, last slot is +Inf), sum, count]
+        self._values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, *labelvalues: str) -> None:
+        series = self._values.get(labelvalues)
+        if series is None:
+            series = self._values[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = []
+        for key, (counts, total, count) in self._values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.header())
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# --- Middleware Metrics ---
+HTTP_REQUEST_DURATION = REGISTRY.register(Histogram(
+    "embedding_http_request_duration_seconds", "Latency of middleware HTTP requests by route.",
+    ("method", "route", "status")))
+UPSTREAM_REQUEST_DURATION = REGISTRY.register(Histogram(
+    "embedding_upstream_request_duration_seconds", "Latency of Superset API calls by endpoint and status.",
+    ("endpoint", "status")))
+UPSTREAM_IN_FLIGHT = REGISTRY.register(Gauge(
+    "embedding_upstream_in_flight", "Superset API calls currently in flight."))
+ADMIN_TOKEN_REFRESHES = REGISTRY.register(Counter(
+    "embedding_admin_token_refresh_total", "Superset admin logins performed, by result.", ("result",)))
+
+
+def register_callback(name: str, documentation: str, callback: Callable[[], float], type_name: str = "gauge") -> None:
+    """Exposes a value owned elsewhere (e.g. a counter attribute) without touching its hot path."""
+    REGISTRY.register(CallbackMetric(name, documentation, callback, type_name))
+
+
+class RequestMetricsMiddleware:
+    """ASGI middleware recording request latency per route template (e.g. /get-guest-token-rls)."""
+
+    def __init__(self, app, skip_paths: Sequence[str] = ("/metrics",)):
+        self.app = app
+        self.skip_paths = frozenset(skip_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.skip_paths:
+            await self.app(scope, receive, send)
+            return
+
+        status_holder: List[Optional[int]] = [None]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status_holder[0] = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            route_path = getattr(route, "path", None) or "unmatched"
+            HTTP_REQUEST_DURATION.observe(time.perf_counter() - started, scope["method"], route_path,
+                                          str(status_holder[0] or 500))
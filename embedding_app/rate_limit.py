@@ -0,0 +1,196 @@
+# embedding_app/rate_limit.py
+# Admission control for guest-token requests that would call Superset.
+#
+# Three token buckets must all have a token before a request is admitted: one per tenant
+# (manufacturer / full-access identity), one per client IP and one global. Requests over a limit
+# wait in a bounded queue that is served round-robin across tenants, so one noisy tenant cannot
+# starve the others; when the queue is full or a request has waited too long it is rejected with 429.
+import time
+import asyncio
+import logging
+from collections import OrderedDict, deque
+from typing import Optional, Dict, Deque, Tuple
+
+from fastapi import HTTPException, status
+
+
+logger = logging.getLogger(__name__)
+
+# --- Limiter Defaults (rates are requests per second; 0 disables that bucket) ---
+DEFAULT_TENANT_RATE, DEFAULT_TENANT_BURST = 2.0, 10
+DEFAULT_CLIENT_RATE, DEFAULT_CLIENT_BURST = 5.0, 20
+DEFAULT_GLOBAL_RATE, DEFAULT_GLOBAL_BURST = 50.0, 100
+DEFAULT_MAX_QUEUE = 200         # Requests waiting for admission, across all tenants
+DEFAULT_MAX_WAIT = 10.0         # Seconds a request may wait before it is rejected
+DEFAULT_MAX_BUCKETS = 10000     # Per-tenant / per-client buckets kept (least recently used are dropped)
+
+
+class TokenBucket:
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def delay(self, now: float) -> float:
+        """Refills the bucket and returns how long until one token is available (0 if one is now)."""
+        # `now` may predate a bucket created after it was read; never refill by a negative interval.
+        self.tokens = min(self.burst, self.tokens + max(0.0, now - self.updated) * self.rate)
+        self.updated = now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self) -> None:
+        self.tokens -= 1
+
+
+class _BucketMap:
+    """LRU-bounded buckets keyed by tenant or client. A dropped bucket comes back full."""
+
+    def __init__(self, rate: float, burst: float, max_buckets: int):
+        self.rate = rate
+        self.burst = burst
+        self.max_buckets = max_buckets
+        self._buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+
+    def get(self, name: str) -> Optional[TokenBucket]:
+        if self.rate <= 0:
+            return None
+        bucket = self._buckets.get(name)
+        if bucket is None:
+            bucket = self._buckets[name] = TokenBucket(self.rate, self.burst)
+            while len(self._buckets) > self.max_buckets:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(name)
+        return bucket
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+Waiter = Tuple["asyncio.Future[None]", str]  # (admission future, client)
+
+
+class AdmissionController:
+    def __init__(self,
+                 tenant_rate: float = DEFAULT_TENANT_RATE, tenant_burst: float = DEFAULT_TENANT_BURST,
+                 client_rate: float = DEFAULT_CLIENT_RATE, client_burst: float = DEFAULT_CLIENT_BURST,
+                 global_rate: float = DEFAULT_GLOBAL_RATE, global_burst: float = DEFAULT_GLOBAL_BURST,
+                 max_queue: int = DEFAULT_MAX_QUEUE, max_wait: float = DEFAULT_MAX_WAIT,
+                 max_buckets: int = DEFAULT_MAX_BUCKETS):
+        self._tenants = _BucketMap(tenant_rate, tenant_burst, max_buckets)
+        self._clients = _BucketMap(client_rate, client_burst, max_buckets)
+        self._global = TokenBucket(global_rate, global_burst) if global_rate > 0 else None
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        # Per-tenant FIFO of waiters; dict order is the round-robin order of tenants.
+        self._queues: Dict[str, Deque[Waiter]] = {}
+        self._queued = 0
+        self._wakeup: Optional[asyncio.Event] = None
+        self._dispatcher: Optional["asyncio.Task[None]"] = None
+        self.admitted = 0
+        self.admitted_after_wait = 0
+        self.rejected_queue_full = 0
+        self.rejected_timeout = 0
+
+    def _delay(self, tenant: str, client: str, now: float) -> float:
+        buckets = [b for b in (self._tenants.get(tenant), self._clients.get(client), self._global) if b is not None]
+        delay = max((b.delay(now) for b in buckets), default=0.0)
+        if delay == 0:
+            for bucket in buckets:
+                bucket.take()
+        return delay
+
+    async def acquire(self, tenant: str, client: str) -> None:
+        """Returns once the request may proceed; raises HTTP 429 if the queue is full or the wait too long."""
+        if not self._queues and self._delay(tenant, client, time.monotonic()) == 0:
+            self.admitted += 1
+            return
+        if self._queued >= self.max_queue:
+            self.rejected_queue_full += 1
+            logger.warning("Admission queue full; rejecting guest token request for '%s' from %s", tenant, client)
+            raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                                detail="Too many guest token requests, please retry shortly",
+                                headers={"Retry-After": "1"})
+
+        future: "asyncio.Future[None]" = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(tenant, deque()).append((future, client))
+        self._queued += 1
+        self._ensure_dispatcher()
+        try:
+            await asyncio.wait_for(future, timeout=self.max_wait)
+        except asyncio.TimeoutError:
+            self.rejected_timeout += 1
+            logger.warning("Guest token request for '%s' from %s waited %ss for admission; rejecting",
+                           tenant, client, self.max_wait)
+            raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                                detail="Too many guest token requests, please retry shortly",
+                                headers={"Retry-After": str(max(int(self.max_wait), 1))})
+        self.admitted += 1
+        self.admitted_after_wait += 1
+
+    def _ensure_dispatcher(self) -> None:
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        self._wakeup.set()
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch())
+
+    async def _dispatch(self) -> None:
+        """Admits queued requests one per tenant per pass, sleeping until the soonest bucket refills."""
+        while self._queued:
+            self._wakeup.clear()
+            now = time.monotonic()
+            soonest = None
+            admitted_any = False
+            for tenant in list(self._queues):
+                queue = self._queues[tenant]
+                while queue and queue[0][0].done():  # Timed out or caller went away
+                    queue.popleft()
+                    self._queued -= 1
+                if not queue:
+                    del self._queues[tenant]
+                    continue
+                future, client = queue[0]
+                delay = self._delay(tenant, client, now)
+                if delay:
+                    soonest = delay if soonest is None else min(soonest, delay)
+                    continue
+                queue.popleft()
+                self._queued -= 1
+                future.set_result(None)
+                admitted_any = True
+                # Move the tenant to the back of the round-robin order.
+                del self._queues[tenant]
+                if queue:
+                    self._queues[tenant] = queue
+            if admitted_any or soonest is None:
+                await asyncio.sleep(0)  # Let admitted requests run before the next pass
+                continue
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=soonest)
+            except asyncio.TimeoutError:
+                pass
+
+    async def close(self) -> None:
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            try:
+                await self._dispatcher
+            except asyncio.CancelledError:
+                pass
+            self._dispatcher = None
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "admitted": self.admitted,
+            "admitted_after_wait": self.admitted_after_wait,
+            "rejected_queue_full": self.rejected_queue_full,
+            "rejected_timeout": self.rejected_timeout,
+            "queued": self._queued,
+            "queued_tenants": len(self._queues),
+            "tenant_buckets": len(self._tenants),
+            "client_buckets": len(self._clients),
+        }
@@ -0,0 +1,50 @@
+# embedding_app/readiness.py
+# Readiness gate for autoscaled replicas.
+#
+# A new replica should not take traffic until it is warm: upstream pool open, admin token fetched
+# and (optionally) hot tenants' guest tokens minted. Startup steps are registered with `require`
+# and completed with `done` as the lifespan's background startup work finishes; /ready reports 503
+# until every step is done. Readiness latches: a replica that was ready stays ready (a later Superset
+# outage shows in /health, and taking every replica out of rotation at once would not help).
+import time
+import logging
+from typing import Dict, Any
+
+logger = logging.getLogger(__name__)
+
+
+class ReadinessGate:
+    def __init__(self):
+        self.created = time.monotonic()
+        self._pending: Dict[str, str] = {}     # step -> status detail
+        self._completed: Dict[str, float] = {}  # step -> seconds after creation
+        self.ready_after: float = 0.0
+
+    def require(self, step: str) -> None:
+        if step not in self._completed:
+            self._pending[step] = "pending"
+
+    def done(self, step: str) -> None:
+        if self._pending.pop(step, None) is None:
+            return
+        self._completed[step] = time.monotonic() - self.created
+        if not self._pending:
+            self.ready_after = self._completed[step]
+            logger.info("Replica ready %.2fs after start (%s)", self.ready_after,
+                        ", ".join(f"{name} {at:.2f}s" for name, at in self._completed.items()))
+
+    def fail(self, step: str, detail: str) -> None:
+        """Records why a step is still pending; it stays required."""
+        if step in self._pending:
+            self._pending[step] = detail
+
+    @property
+    def ready(self) -> bool:
+        return not self._pending
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "ready": self.ready,
+            "pending": dict(self._pending),
+            "completed": {name: round(at, 3) for name, at in self._completed.items()},
+        }
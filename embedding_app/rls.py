@@ -0,0 +1,146 @@
+# embedding_app/rls.py
+# Compiles a declarative tenant RLS policy into the guest token `rls` rule list.
+#
+# A policy is a list of conditions, each restricting one column to a set of allowed values,
+# optionally only on some datasets:
+#   [{"column": "Manufacturer", "values": ["Cipla Ltd", "Lupin Ltd"]},
+#    {"column": "Region", "values": ["North"], "datasets": [12, 14]}]
+#
+# Superset reads a rule's dataset from its `dataset` key, ANDs every rule that applies to a
+# dataset, and applies rules without a `dataset` to all datasets. The compiler therefore emits at
+# most one rule per dataset (plus one global rule): conditions on the same column and dataset are
+# intersected, equality on one value becomes `=`, several values become one `IN (...)` list, and
+# the per-column predicates are ANDed together. Identifiers and literals are always quoted, and
+# output is sorted so that equal policies compile to identical rules (and identical cache keys).
+import json
+import math
+import hashlib
+import logging
+from typing import Optional, Dict, Any, List, Tuple, Union, NamedTuple, Sequence
+
+logger = logging.getLogger(__name__)
+
+Value = Union[str, int, float]
+RlsRule = Dict[str, Any]
+
+MAX_MEMOIZED_POLICIES = 4096
+
+
+class RlsCondition(NamedTuple):
+    column: str
+    values: Tuple[Value, ...]
+    datasets: Optional[Tuple[int, ...]]  # None applies the condition to every dataset
+
+
+class CompiledRls(NamedTuple):
+    version: str                # Hash of the normalized policy
+    rules: Tuple[RlsRule, ...]  # Shared between callers; never mutate
+
+
+def quote_identifier(name: str) -> str:
+    """Quotes a SQL identifier, doubling embedded double quotes."""
+    return '"' + name.replace('"', '""') + '"'
+
+
+def quote_literal(value: Value) -> str:
+    """Renders a SQL literal: numbers as-is, strings quoted with quotes doubled (O'Brien -> 'O''Brien')."""
+    if isinstance(value, bool):
+        raise ValueError("Boolean RLS values are not supported")
+    if isinstance(value, (int, float)):
+        if not math.isfinite(value):
+            raise ValueError(f"Non-finite RLS value: {value!r}")
+        return repr(value)
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def _sort_key(value: Value) -> Tuple[int, float, str]:
+    return (0, float(value), "") if isinstance(value, (int, float)) else (1, 0.0, str(value))
+
+
+def parse_policy(raw: Sequence[Dict[str, Any]]) -> Tuple[RlsCondition, ...]:
+    """Validates a policy from config and returns it in normalized (sorted, de-duplicated) form."""
+    conditions = []
+    for item in raw:
+        column = item.get("column")
+        if not column or not isinstance(column, str):
+            raise ValueError(f"RLS condition without a column: {item!r}")
+        if "values" in item:
+            values = item["values"]
+        elif "value" in item:
+            values = [item["value"]]
+        else:
+            raise ValueError(f"RLS condition for column '{column}' has no 'values'")
+        if not isinstance(values, (list, tuple)) or not values:
+            raise ValueError(f"RLS values for column '{column}' must be a non-empty list, got {values!r}")
+        for value in values:
+            if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+                raise ValueError(f"Unsupported RLS value for column '{column}': {value!r}")
+            if isinstance(value, float) and not math.isfinite(value):
+                raise ValueError(f"Non-finite RLS value for column '{column}': {value!r}")
+        datasets = item.get("datasets")
+        if datasets is not None:
+            if not all(isinstance(d, int) and not isinstance(d, bool) for d in datasets):
+                raise ValueError(f"RLS datasets for column '{column}' must be integer ids")
+            datasets = tuple(sorted(set(datasets)))
+        conditions.append(RlsCondition(column, tuple(sorted(set(values), key=_sort_key)), datasets))
+    return tuple(sorted(conditions,
+                        key=lambda c: (c.column, c.datasets or (), [_sort_key(v) for v in c.values])))
+
+
+def policy_version(conditions: Tuple[RlsCondition, ...]) -> str:
+    return hashlib.sha256(json.dumps(conditions).encode()).hexdigest()[:16]
+
+
+def _predicate(column: str, values: Sequence[Value]) -> str:
+    if not values:
+        return "1 = 0"  # Conflicting or empty conditions: nothing is visible
+    if len(values) == 1:
+        return f"{quote_identifier(column)} = {quote_literal(values[0])}"
+    return f"{quote_identifier(column)} IN ({', '.join(quote_literal(v) for v in values)})"
+
+
+def _compile_group(conditions: List[RlsCondition]) -> str:
+    allowed: Dict[str, set] = {}
+    for condition in conditions:
+        values = set(condition.values)
+        previous = allowed.get(condition.column)
+        allowed[condition.column] = previous & values if previous is not None else values
+    predicates = [_predicate(column, sorted(values, key=_sort_key))
+                  for column, values in sorted(allowed.items())]
+    return predicates[0] if len(predicates) == 1 else " AND ".join(f"({p})" for p in predicates)
+
+
+_memo: Dict[str, CompiledRls] = {}
+
+
+def compile_policy(conditions: Tuple[RlsCondition, ...]) -> CompiledRls:
+    """Compiles a normalized policy into guest token rules, memoized by policy version."""
+    version = policy_version(conditions)
+    compiled = _memo.get(version)
+    if compiled is not None:
+        return compiled
+
+    global_conditions = [c for c in conditions if c.datasets is None]
+    per_dataset: Dict[int, List[RlsCondition]] = {}
+    for condition in conditions:
+        for dataset_id in condition.datasets or ():
+            per_dataset.setdefault(dataset_id, []).append(condition)
+
+    rules: List[RlsRule] = []
+    if global_conditions:
+        rules.append({"clause": _compile_group(global_conditions)})
+    for dataset_id in sorted(per_dataset):
+        rules.append({"dataset": dataset_id, "clause": _compile_group(per_dataset[dataset_id])})
+
+    compiled = CompiledRls(version, tuple(rules))
+    if len(_memo) >= MAX_MEMOIZED_POLICIES:
+        _memo.clear()
+    _memo[version] = compiled
+    return compiled
+
+
+def single_column_policy(column: str, value: Value,
+                         dataset_id: Optional[int] = None) -> Tuple[RlsCondition, ...]:
+    """The policy of a tenant restricted to one value of one column (the config.py RLS_COLUMN_NAME setup)."""
+    return parse_policy([{"column": column, "values": [value],
+                          "datasets": [dataset_id] if isinstance(dataset_id, int) else None}])
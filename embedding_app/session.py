@@ -0,0 +1,60 @@
+# embedding_app/session.py
+# Signed login sessions, so guest-token requests after login are authorised without re-checking
+# the password. A session is an HS256 JWT carried in an HttpOnly cookie or an
+# "Authorization: Bearer" header and verified locally (no store lookup).
+import time
+import logging
+import secrets
+from typing import Optional, NamedTuple, Tuple
+
+import jwt
+
+logger = logging.getLogger(__name__)
+
+# --- Defaults ---
+DEFAULT_SESSION_TTL = 8 * 3600
+DEFAULT_COOKIE_NAME = "embedding_session"
+SESSION_TOKEN_TYPE = "embedding_session"
+
+
+class Session(NamedTuple):
+    username: str
+    role: str
+    expires_at: float
+
+
+class SessionManager:
+    """Issues and verifies session tokens.
+
+    Without a configured secret a random per-process one is used; sessions then only validate on
+    the worker that issued them, so set SESSION_SECRET when running several workers.
+    """
+
+    def __init__(self, secret: Optional[str] = None, ttl: float = DEFAULT_SESSION_TTL,
+                 cookie_name: str = DEFAULT_COOKIE_NAME, cookie_secure: bool = False):
+        if not secret:
+            logger.warning("SESSION_SECRET not set; using a random per-process session secret.")
+            secret = secrets.token_urlsafe(32)
+        self._secret = secret
+        self.ttl = ttl
+        self.cookie_name = cookie_name
+        self.cookie_secure = cookie_secure
+
+    def issue(self, username: str, role: str) -> Tuple[str, float]:
+        """Returns a signed session token for `username` and its expiry (epoch seconds)."""
+        now = int(time.time())
+        expires_at = now + int(self.ttl)
+        token = jwt.encode({"sub": username, "role": role, "iat": now, "exp": expires_at,
+                            "type": SESSION_TOKEN_TYPE}, self._secret, algorithm="HS256")
+        return token, expires_at
+
+    def verify(self, token: str) -> Optional[Session]:
+        """Returns the session encoded in `token`, or None if it is invalid, expired or not a session token."""
+        try:
+            claims = jwt.decode(token, self._secret, algorithms=["HS256"])
+        except jwt.PyJWTError as e:
+            logger.debug("Rejected session token: %r", e)
+            return None
+        if claims.get("type") != SESSION_TOKEN_TYPE or "sub" not in claims or "role" not in claims:
+            return None
+        return Session(claims["sub"], claims["role"], claims["exp"])
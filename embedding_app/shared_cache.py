@@ -0,0 +1,172 @@
+# embedding_app/shared_cache.py
+# Optional cross-worker (L2) token store backed by Redis.
+#
+# Each uvicorn worker keeps its own in-process caches (L1). When REDIS_URL is set, admin and guest
+# tokens are also shared through Redis so that logins and mints do not scale with the worker count.
+# REDIS_URL=memory:// selects an in-process stand-in, for tests and local runs without Redis.
+import json
+import time
+import uuid
+import asyncio
+import hashlib
+import logging
+from contextlib import asynccontextmanager
+from typing import Optional, Dict, Any, AsyncIterator
+
+logger = logging.getLogger(__name__)
+
+# Deletes the lock only if it still holds our token, so an expired lock taken over by another
+# worker is never released by the previous owner.
+RELEASE_LOCK_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+
+class InMemoryRedis:
+    """In-process stand-in for the subset of redis.asyncio.Redis used by SharedTokenStore."""
+
+    def __init__(self):
+        self._data: Dict[str, tuple] = {}  # key -> (value, expires_at or None)
+
+    def _live(self, key: str) -> Optional[str]:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        value, expires_at = item
+        if expires_at is not None and expires_at <= time.time():
+            del self._data[key]
+            return None
+        return value
+
+    async def get(self, key: str) -> Optional[str]:
+        return self._live(key)
+
+    async def set(self, key: str, value: str, ex: Optional[float] = None, px: Optional[int] = None,
+                  nx: bool = False) -> Optional[bool]:
+        if nx and self._live(key) is not None:
+            return None
+        ttl = ex if ex is not None else (px / 1000 if px is not None else None)
+        self._data[key] = (value, time.time() + ttl if ttl is not None else None)
+        return True
+
+    async def delete(self, *keys: str) -> int:
+        return sum(1 for key in keys if self._data.pop(key, None) is not None)
+
+    async def eval(self, script: str, numkeys: int, *args: str) -> int:
+        if script != RELEASE_LOCK_SCRIPT:
+            raise NotImplementedError("InMemoryRedis only supports the lock release script")
+        key, token = args[0], args[1]
+        if self._live(key) == token:
+            del self._data[key]
+            return 1
+        return 0
+
+    async def ping(self) -> bool:
+        return True
+
+    async def aclose(self) -> None:
+        self._data.clear()
+
+
+def create_redis_client(url: str):
+    """Returns a redis.asyncio client for `url`, or the in-memory stand-in for memory://."""
+    if url.startswith("memory://"):
+        return InMemoryRedis()
+    try:
+        import redis.asyncio as redis_asyncio
+    except ImportError:
+        raise ImportError("REDIS_URL is set but the 'redis' package (>=4.2) is not installed")
+    return redis_asyncio.from_url(url, decode_responses=True, socket_timeout=1.0, socket_connect_timeout=1.0)
+
+
+class SharedTokenStore:
+    """Thin JSON/lock layer over Redis. Redis errors are logged and treated as misses, never raised."""
+
+    def __init__(self, client, prefix: str = "embedding:"):
+        self.client = client
+        self.prefix = prefix
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    def _key(self, name: str) -> str:
+        return f"{self.prefix}{name}"
+
+    @staticmethod
+    def guest_token_key(cache_key: Any) -> str:
+        digest = hashlib.sha256(json.dumps(cache_key, separators=(",", ":")).encode()).hexdigest()
+        return f"guest:{digest}"
+
+    async def get_json(self, name: str) -> Optional[Dict[str, Any]]:
+        try:
+            raw = await self.client.get(self._key(name))
+        except Exception as e:
+            self.errors += 1
+            logger.warning("Shared token store read failed for '%s': %r", name, e)
+            return None
+        if raw is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        try:
+            return json.loads(raw)
+        except ValueError:
+            return None
+
+    async def set_json(self, name: str, value: Dict[str, Any], ttl: float) -> None:
+        if ttl <= 0:
+            return
+        try:
+            await self.client.set(self._key(name), json.dumps(value), px=int(ttl * 1000))
+        except Exception as e:
+            self.errors += 1
+            logger.warning("Shared token store write failed for '%s': %r", name, e)
+
+    @asynccontextmanager
+    async def lock(self, name: str, ttl: float) -> AsyncIterator[bool]:
+        """Tries once to take a distributed lock; yields whether it was acquired.
+
+        The lock expires after `ttl` seconds even if the holder dies. If Redis is unreachable the
+        lock is reported as acquired, so callers degrade to per-worker behaviour instead of stalling.
+        """
+        key, token = self._key(f"lock:{name}"), uuid.uuid4().hex
+        try:
+            acquired = bool(await self.client.set(key, token, px=int(ttl * 1000), nx=True))
+        except Exception as e:
+            self.errors += 1
+            logger.warning("Shared token store lock '%s' unavailable: %r", name, e)
+            yield True
+            return
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                try:
+                    await self.client.eval(RELEASE_LOCK_SCRIPT, 1, key, token)
+                except Exception as e:
+                    self.errors += 1
+                    logger.warning("Shared token store lock '%s' release failed: %r", name, e)
+
+    async def wait_for_json(self, name: str, timeout: float, accept, poll_interval: float = 0.1) -> Optional[Dict[str, Any]]:
+        """Polls `name` until `accept(value)` is true or `timeout` elapses (used while another worker holds a lock)."""
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            await asyncio.sleep(poll_interval)
+            value = await self.get_json(name)
+            if value is not None and accept(value):
+                return value
+        return None
+
+    async def close(self) -> None:
+        close = getattr(self.client, "aclose", None) or getattr(self.client, "close", None)
+        if close is not None:
+            try:
+                await close()
+            except Exception as e:
+                logger.warning("Error closing shared token store: %r", e)
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "errors": self.errors}
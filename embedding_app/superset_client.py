@@ -0,0 +1,300 @@
+# embedding_app/superset_client.py
+import asyncio
+import json
+import logging
+import random
+import time
+from typing import Optional, Dict, Any, Union
+
+import aiohttp
+from fastapi import HTTPException, status
+
+from metrics import UPSTREAM_REQUEST_DURATION, UPSTREAM_IN_FLIGHT
+from timing import phase
+from log_setup import SAMPLED
+
+logger = logging.getLogger(__name__)
+
+# --- Connection Pool Defaults ---
+DEFAULT_POOL_LIMIT = 100           # Total keep-alive connections to Superset
+DEFAULT_POOL_LIMIT_PER_HOST = 50   # Superset is a single host, so this is the effective cap
+DEFAULT_KEEPALIVE_TIMEOUT = 30     # Seconds an idle pooled connection is kept open
+
+# --- Resilience Defaults ---
+DEFAULT_MAX_RETRIES = 2            # Extra attempts after a timeout, connection error or 502/503/504
+DEFAULT_BACKOFF_BASE = 0.2         # Seconds; retry n sleeps uniform(0, min(cap, base * 2**n)) ("full jitter")
+DEFAULT_BACKOFF_CAP = 2.0
+DEFAULT_FAILURE_THRESHOLD = 5      # Consecutive failures that open the circuit
+DEFAULT_RECOVERY_TIMEOUT = 30      # Seconds the circuit stays open before a half-open probe
+DEFAULT_MIN_TIMEOUT = 2.0          # Adaptive timeouts never drop below this many seconds
+
+RETRYABLE_STATUSES = frozenset({502, 503, 504})
+
+
+class CircuitOpenError(HTTPException):
+    """Raised without contacting Superset while the circuit breaker is open."""
+
+    def __init__(self, retry_after: float):
+        super().__init__(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                         detail=f"Superset API unavailable (circuit open, retry in {retry_after:.0f}s)")
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker: closed -> open -> half_open (one probe) -> closed."""
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+                 recovery_timeout: float = DEFAULT_RECOVERY_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self._probe_in_flight = False
+
+    @property
+    def is_open(self) -> bool:
+        """True while calls are being rejected (open and not yet due for a probe)."""
+        return self.state == self.OPEN and time.time() - self.opened_at < self.recovery_timeout
+
+    def retry_after(self) -> float:
+        return max(self.recovery_timeout - (time.time() - self.opened_at), 0)
+
+    def before_call(self) -> None:
+        """Raises CircuitOpenError if the call must not go upstream."""
+        if self.state == self.CLOSED:
+            return
+        if self.state == self.OPEN:
+            if self.is_open:
+                raise CircuitOpenError(self.retry_after())
+            self.state = self.HALF_OPEN
+            self._probe_in_flight = False
+        if self._probe_in_flight:
+            raise CircuitOpenError(self.retry_after())
+        self._probe_in_flight = True
+
+    def record_success(self) -> None:
+        if self.state != self.CLOSED:
+            logger.info("Superset circuit breaker closed: upstream recovered.")
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self._probe_in_flight = False
+
+    def release_probe(self) -> None:
+        """Frees the half-open probe slot after a call that ended without a verdict (e.g. cancelled)."""
+        self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        self.consecutive_failures += 1
+        self._probe_in_flight = False
+        if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                self.times_opened += 1
+                logger.error("Superset circuit breaker opened after %d consecutive failures.", self.consecutive_failures)
+            self.state = self.OPEN
+            self.opened_at = time.time()
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "state": self.OPEN if self.is_open else (self.HALF_OPEN if self.state != self.CLOSED else self.CLOSED),
+            "consecutive_failures": self.consecutive_failures,
+            "times_opened": self.times_opened,
+            "retry_after": round(self.retry_after(), 1) if self.state == self.OPEN else 0,
+        }
+
+
+class AdaptiveTimeout:
+    """Per-endpoint timeout derived from observed latency (smoothed mean + 4x mean deviation, as TCP's RTO).
+
+    The caller's timeout is the ceiling; until enough samples exist the ceiling is used as-is.
+    """
+
+    def __init__(self, min_timeout: float = DEFAULT_MIN_TIMEOUT, warmup_samples: int = 10):
+        self.min_timeout = min_timeout
+        self.warmup_samples = warmup_samples
+        self._stats: Dict[str, list] = {}  # endpoint -> [smoothed latency, mean deviation, samples]
+
+    def observe(self, endpoint: str, latency: float) -> None:
+        stats = self._stats.get(endpoint)
+        if stats is None:
+            self._stats[endpoint] = [latency, latency / 2, 1]
+            return
+        srtt, rttvar, samples = stats
+        rttvar = 0.75 * rttvar + 0.25 * abs(srtt - latency)
+        srtt = 0.875 * srtt + 0.125 * latency
+        self._stats[endpoint] = [srtt, rttvar, samples + 1]
+
+    def timeout_for(self, endpoint: str, ceiling: float) -> float:
+        stats = self._stats.get(endpoint)
+        if stats is None or stats[2] < self.warmup_samples:
+            return ceiling
+        return min(max(stats[0] + 4 * stats[1], self.min_timeout), ceiling)
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        return {endpoint: {"smoothed_latency": round(srtt, 4), "timeout": round(self.timeout_for(endpoint, float("inf")), 3)}
+                for endpoint, (srtt, _, samples) in self._stats.items() if samples >= self.warmup_samples}
+
+
+class SupersetClient:
+    """Shared async client for the Superset REST API, backed by one keep-alive connection pool.
+
+    Create one instance per process, call `start()` on app startup and `close()` on shutdown.
+    """
+
+    def __init__(self, base_url: str,
+                 pool_limit: int = DEFAULT_POOL_LIMIT,
+                 pool_limit_per_host: int = DEFAULT_POOL_LIMIT_PER_HOST,
+                 keepalive_timeout: float = DEFAULT_KEEPALIVE_TIMEOUT,
+                 max_retries: int = DEFAULT_MAX_RETRIES,
+                 breaker: Optional[CircuitBreaker] = None,
+                 adaptive_timeout: Optional[AdaptiveTimeout] = None):
+        self.base_url = base_url.rstrip('/')
+        self.pool_limit = pool_limit
+        self.pool_limit_per_host = pool_limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.max_retries = max_retries
+        self.breaker = breaker or CircuitBreaker()
+        self.adaptive_timeout = adaptive_timeout or AdaptiveTimeout()
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    async def start(self) -> None:
+        if self._session is not None and not self._session.closed:
+            return
+        connector = aiohttp.TCPConnector(
+            limit=self.pool_limit,
+            limit_per_host=self.pool_limit_per_host,
+            keepalive_timeout=self.keepalive_timeout,
+            ttl_dns_cache=300,
+        )
+        self._session = aiohttp.ClientSession(connector=connector, raise_for_status=False)
+        logger.info("Superset client pool opened for %s (limit=%d, per_host=%d).", self.base_url, self.pool_limit,
+                    self.pool_limit_per_host)
+
+    async def close(self) -> None:
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+            logger.info("Superset client pool closed.")
+        self._session = None
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            raise RuntimeError("SupersetClient used before start() or after close().")
+        return self._session
+
+    async def post_json(self, path: str, payload: Union[Dict[str, Any], bytes], timeout: float,
+                        headers: Optional[Dict[str, str]] = None,
+                        label: str = "Superset API") -> Dict[str, Any]:
+        """POSTs a JSON payload (a dict, or bytes already serialized) and returns the decoded JSON body.
+
+        See `_request` for error mapping, retries and timeouts.
+        """
+        return await self._request("POST", path, payload, timeout, headers, label)
+
+    async def get_json(self, path: str, timeout: float, headers: Optional[Dict[str, str]] = None,
+                       label: str = "Superset API") -> Dict[str, Any]:
+        """GETs `path` and returns the decoded JSON body. See `_request`."""
+        return await self._request("GET", path, None, timeout, headers, label)
+
+    async def _request(self, method: str, path: str, payload: Union[Dict[str, Any], bytes, None], timeout: float,
+                       headers: Optional[Dict[str, str]], label: str) -> Dict[str, Any]:
+        """Sends one API call with retries and returns the decoded JSON body.
+
+        Network failures and non-2xx responses are mapped to HTTPException
+        (504 on timeout, 503 on connection errors or open circuit, upstream status otherwise).
+        Timeouts, connection errors and 502/503/504 are retried with jittered exponential backoff;
+        `timeout` is the per-attempt ceiling, lowered adaptively once the endpoint's latency is known.
+        """
+        attempt = 0
+        while True:
+            self.breaker.before_call()
+            try:
+                data = await self._request_once(method, path, payload,
+                                                self.adaptive_timeout.timeout_for(path.split("?", 1)[0], timeout),
+                                                headers, label)
+            except HTTPException as e:
+                if e.status_code < 500:
+                    # The request itself was rejected; Superset is healthy.
+                    self.breaker.record_success()
+                    raise
+                self.breaker.record_failure()
+                if e.status_code not in RETRYABLE_STATUSES or attempt >= self.max_retries or self.breaker.is_open:
+                    raise
+                delay = random.uniform(0, min(DEFAULT_BACKOFF_CAP, DEFAULT_BACKOFF_BASE * 2 ** attempt))
+                attempt += 1
+                logger.warning("%s attempt %d failed (%s); retrying in %.2fs.", label, attempt, e.status_code, delay)
+                await asyncio.sleep(delay)
+                continue
+            except Exception:
+                # Unexpected errors (e.g. an undecodable body) count against upstream like a 5xx.
+                self.breaker.record_failure()
+                raise
+            except BaseException:
+                # Cancelled (e.g. on shutdown): no verdict on upstream, but a half-open probe must
+                # not stay "in flight" forever or every later call is rejected.
+                self.breaker.release_probe()
+                raise
+            self.breaker.record_success()
+            return data
+
+    async def _request_once(self, method: str, path: str, payload: Union[Dict[str, Any], bytes, None], timeout: float,
+                            headers: Optional[Dict[str, str]], label: str) -> Dict[str, Any]:
+        url = f"{self.base_url}{path}"
+        # Query strings (e.g. chart data form_data) do not make a separate endpoint for timeouts and metrics.
+        path = path.split("?", 1)[0]
+        result = "error"
+        started = time.perf_counter()
+        UPSTREAM_IN_FLIGHT.inc()
+        try:
+            body = {} if payload is None else {"data": payload} if isinstance(payload, bytes) else {"json": payload}
+            async with self.session.request(method, url, headers=headers, timeout=aiohttp.ClientTimeout(total=timeout),
+                                            **body) as response:
+                result = str(response.status)
+                text = await response.text()
+                self.adaptive_timeout.observe(path, time.perf_counter() - started)
+                logger.info("%s Response Status: %s", label, response.status,
+                            extra=SAMPLED if response.status < 400 else None)
+                logger.debug("%s Response Text: %.500s", label, text)
+                if response.status >= 400:
+                    raise HTTPException(status_code=response.status,
+                                        detail=_format_upstream_error(label, response.status, text))
+                try:
+                    with phase("json"):
+                        return await response.json(content_type=None)
+                except ValueError:
+                    logger.error("%s returned a non-JSON body.", label)
+                    raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY,
+                                        detail=f"{label} returned an invalid response body")
+
+        except HTTPException:
+            raise
+        except asyncio.TimeoutError:
+            result = "timeout"
+            # Count the timeout as a slow sample so the adaptive timeout backs off rather than tightening.
+            self.adaptive_timeout.observe(path, timeout)
+            logger.error("Timeout connecting to %s at %s (after %.1fs)", label, url, timeout)
+            raise HTTPException(status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+                                detail=f"Timeout connecting to {label}.")
+        except aiohttp.ClientError as e:
+            logger.error("Network error connecting to %s: %s", label, e)
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                                detail=f"Could not connect to {label}: {e}")
+        finally:
+            UPSTREAM_IN_FLIGHT.dec()
+            UPSTREAM_REQUEST_DURATION.observe(time.perf_counter() - started, path, result)
+
+
+def _format_upstream_error(label: str, status_code: int, text: str) -> str:
+    """Builds an error detail string from a Superset error response body."""
+    detail = f"{label} request failed ({status_code})"
+    try:
+        superset_error = json.loads(text).get("message", text)
+    except (ValueError, AttributeError):
+        return f"{detail}: {text}"
+    if isinstance(superset_error, dict):
+        field_errors = [f"{field}: {', '.join(msgs) if isinstance(msgs, list) else msgs}"
+                        for field, msgs in superset_error.items()]
+        return f"{detail}: {'; '.join(field_errors)}"
+    return f"{detail}: {superset_error}"
@@ -0,0 +1,241 @@
+# embedding_app/tenant_config.py
+# Tenant configuration (logins, RLS column / dataset, embeddable dashboards) and the guest-token
+# request templates compiled from it.
+#
+# A TenantConfig is an immutable snapshot. It is built once from config.py / .env, or from a
+# TENANTS_FILE that is watched and reloaded: a reload builds a complete new snapshot and swaps it
+# in with a single assignment, so a request always sees either the old or the new config.
+#
+# TENANTS_FILE (JSON) uses the credentials-file layout plus optional RLS and dashboard sections:
+#   {
+#     "users": [{"username": "admin", "role": "admin", "password_hash": "pbkdf2_sha256$..."},
+#               {"username": "Cipla Ltd", "role": "manufacturer", "password_hash": "...",
+#                "rls_value": "Cipla Ltd"},             <- optional, defaults to the username
+#               {"username": "Group Co", "role": "manufacturer", "password_hash": "...",
+#                "rls": [{"column": "Manufacturer", "values": ["Cipla Ltd", "Lupin Ltd"]},
+#                        {"column": "Region", "values": ["North"], "datasets": [12]}]}],
+#     "rls": {"column": "Manufacturer", "dataset_id": null},  <- default policy: column = rls_value
+#     "dashboards": {"default": "<uuid>", "allowed": ["<uuid>", ...]}
+#   }
+import os
+import json
+import asyncio
+import hashlib
+import logging
+from typing import Optional, Dict, Any, List, Tuple, Callable, NamedTuple, Iterable
+
+from fastapi import HTTPException, status
+
+from credentials import Credential, ROLE_ADMIN, ROLE_MANUFACTURER
+from rls import RlsCondition, compile_policy, parse_policy, single_column_policy
+from token_cache import CacheKey, make_cache_key
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RELOAD_INTERVAL = 2.0  # Seconds between checks of TENANTS_FILE for changes
+
+
+class GuestTokenRequest(NamedTuple):
+    """Everything needed to mint or look up one guest token, computed once per tenant and dashboard."""
+    identity: str
+    key: CacheKey
+    payload: Dict[str, Any]  # Shared between requests; never mutate
+    body: bytes              # `payload` pre-serialized as the guest_token API request body
+
+
+def _compile(identity: str, payload: Dict[str, Any]) -> GuestTokenRequest:
+    key = make_cache_key(payload["resources"][0]["id"], identity, payload["rls"])
+    return GuestTokenRequest(identity, key, payload, json.dumps(payload, separators=(",", ":")).encode())
+
+
+def compile_rls_request(manufacturer: str, dashboard_id: str, policy: Tuple[RlsCondition, ...]) -> GuestTokenRequest:
+    """Builds the guest token request for an RLS token restricted by the manufacturer's policy."""
+    rules = [dict(rule) for rule in compile_policy(policy).rules]
+
+    # Stable per manufacturer (no timestamp) so that minted tokens can be reused from the cache.
+    safe_manufacturer_part = "".join(c if c.isalnum() else '_' for c in manufacturer)[:30]
+    payload = {
+        "user": {
+            "username": f"guest_mfr_{safe_manufacturer_part}",
+            "first_name": "Embedded Mfr",
+            "last_name": f"User ({manufacturer[:20]})",
+        },
+        "resources": [{"type": "dashboard", "id": dashboard_id}],
+        "rls": rules,
+    }
+    return _compile(f"mfr:{manufacturer}", payload)
+
+
+def compile_full_request(user_identifier: str, dashboard_id: str) -> GuestTokenRequest:
+    """Builds the guest token request for a full-access token."""
+    payload = {
+        "user": {
+            "username": f"guest_full_{user_identifier}",
+            "first_name": "Embedded Full",
+            "last_name": f"User ({user_identifier[:20]})",
+        },
+        "resources": [{"type": "dashboard", "id": dashboard_id}],
+        "rls": [],
+    }
+    return _compile(f"full:{user_identifier}", payload)
+
+
+class TenantConfig:
+    """One consistent snapshot of the tenant configuration, with precompiled request templates.
+
+    Templates exist for every configured manufacturer (RLS) and admin (full access) on every
+    embeddable dashboard. Identities outside the config (e.g. arbitrary full-access user ids)
+    are compiled per request.
+    """
+
+    def __init__(self, credentials: Dict[str, Credential], rls_column: str, rls_dataset_id: Optional[int],
+                 default_dashboard_id: str, dashboard_ids: Iterable[str],
+                 rls_values: Optional[Dict[str, str]] = None,
+                 policies: Optional[Dict[str, Tuple[RlsCondition, ...]]] = None, source: str = "config.py"):
+        self.credentials = credentials
+        self.rls_column = rls_column
+        self.rls_dataset_id = rls_dataset_id
+        self.default_dashboard_id = default_dashboard_id
+        self.dashboard_ids = frozenset(dashboard_ids) | {default_dashboard_id}
+        self.rls_values = rls_values or {}
+        self.source = source
+        self.manufacturers = tuple(u for u, c in credentials.items() if c.role == ROLE_MANUFACTURER)
+        self.admins = tuple(u for u, c in credentials.items() if c.role == ROLE_ADMIN)
+        # Explicit per-tenant policies; everyone else is restricted to rls_column = rls_value (or username).
+        self.policies = {m: (policies or {}).get(m) or self.default_policy(self.rls_values.get(m) or m)
+                         for m in self.manufacturers}
+        self._rls: Dict[Tuple[str, str], GuestTokenRequest] = {
+            (m, d): compile_rls_request(m, d, self.policies[m])
+            for m in self.manufacturers for d in self.dashboard_ids
+        }
+        self._full: Dict[Tuple[str, str], GuestTokenRequest] = {
+            (a, d): compile_full_request(a, d) for a in self.admins for d in self.dashboard_ids
+        }
+        # Changes whenever anything that ends up in a token does; logins alone do not count.
+        fingerprint = json.dumps([sorted(self.dashboard_ids), default_dashboard_id, sorted(self.admins),
+                                  sorted((m, compile_policy(p).version) for m, p in self.policies.items())])
+        self.version = hashlib.sha256(fingerprint.encode()).hexdigest()[:12]
+
+    def default_policy(self, value: str) -> Tuple[RlsCondition, ...]:
+        return single_column_policy(self.rls_column, value, self.rls_dataset_id)
+
+    def resolve_dashboard_id(self, dashboard_id: Optional[str]) -> str:
+        """Returns the dashboard to embed, defaulting to the default dashboard. Rejects dashboards not configured as embeddable."""
+        if not dashboard_id:
+            return self.default_dashboard_id
+        if dashboard_id not in self.dashboard_ids:
+            logger.warning("Guest token requested for unconfigured dashboard: '%s'", dashboard_id)
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Dashboard '{dashboard_id}' is not available for embedding")
+        return dashboard_id
+
+    def rls_request(self, manufacturer: str, dashboard_id: Optional[str] = None) -> GuestTokenRequest:
+        dashboard_id = self.resolve_dashboard_id(dashboard_id)
+        template = self._rls.get((manufacturer, dashboard_id))
+        if template is not None:
+            return template
+        return compile_rls_request(manufacturer, dashboard_id, self.default_policy(manufacturer))
+
+    def full_request(self, user_identifier: str, dashboard_id: Optional[str] = None) -> GuestTokenRequest:
+        dashboard_id = self.resolve_dashboard_id(dashboard_id)
+        return self._full.get((user_identifier, dashboard_id)) or compile_full_request(user_identifier, dashboard_id)
+
+    def prewarm_requests(self, only: Optional[Iterable[str]] = None) -> List[GuestTokenRequest]:
+        """The default-dashboard token of every configured manufacturer and admin, or only of the users in `only`."""
+        selected = set(only) if only is not None else None
+        return ([self._rls[(m, self.default_dashboard_id)] for m in self.manufacturers if selected is None or m in selected] +
+                [self._full[(a, self.default_dashboard_id)] for a in self.admins if selected is None or a in selected])
+
+    def describe(self) -> Dict[str, Any]:
+        return {"source": self.source, "version": self.version, "manufacturers": len(self.manufacturers),
+                "admins": len(self.admins), "rls_column": self.rls_column, "rls_dataset_id": self.rls_dataset_id,
+                "dashboards": sorted(self.dashboard_ids)}
+
+
+def load_tenant_file(path: str, default_dashboard_id: str, dashboard_ids: Iterable[str]) -> TenantConfig:
+    """Parses and validates TENANTS_FILE. Dashboards fall back to the .env settings when the file has none."""
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    credentials: Dict[str, Credential] = {}
+    rls_values: Dict[str, str] = {}
+    policies: Dict[str, Tuple[RlsCondition, ...]] = {}
+    for user in data["users"]:
+        if user["role"] not in (ROLE_ADMIN, ROLE_MANUFACTURER):
+            raise ValueError(f"Unknown role '{user['role']}' for user '{user['username']}'")
+        credentials[user["username"]] = Credential(user["role"], user["password_hash"])
+        if user.get("rls_value"):
+            rls_values[user["username"]] = user["rls_value"]
+        if user.get("rls"):
+            policies[user["username"]] = parse_policy(user["rls"])
+    if not any(c.role == ROLE_ADMIN for c in credentials.values()):
+        raise ValueError("Tenant file defines no admin user")
+
+    rls = data.get("rls", {})
+    rls_column = rls.get("column")
+    if not rls_column:
+        raise ValueError("Tenant file is missing rls.column")
+    rls_dataset_id = rls.get("dataset_id")
+    if rls_dataset_id is not None and not isinstance(rls_dataset_id, int):
+        raise ValueError("rls.dataset_id must be an integer or null")
+
+    dashboards = data.get("dashboards", {})
+    default_dashboard_id = dashboards.get("default") or default_dashboard_id
+    if "allowed" in dashboards:
+        dashboard_ids = dashboards["allowed"]
+    return TenantConfig(credentials, rls_column, rls_dataset_id, default_dashboard_id, dashboard_ids,
+                        rls_values=rls_values, policies=policies, source=path)
+
+
+class TenantConfigWatcher:
+    """Polls a file's mtime/size and calls `on_reload` with a freshly loaded config when it changes.
+
+    Loading runs in a worker thread. A file that fails to load or validate is logged and ignored,
+    leaving the current config in place.
+    """
+
+    def __init__(self, path: str, load: Callable[[], TenantConfig], on_reload: Callable[[TenantConfig], None],
+                 interval: float = DEFAULT_RELOAD_INTERVAL):
+        self.path = path
+        self._load = load
+        self._on_reload = on_reload
+        self.interval = interval
+        self._signature = self._stat()
+        self._task: Optional["asyncio.Task[None]"] = None
+        self.reloads = 0
+        self.reload_failures = 0
+
+    def _stat(self) -> Optional[Tuple[int, int]]:
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.interval)
+            signature = self._stat()
+            if signature is None or signature == self._signature:
+                continue
+            self._signature = signature
+            try:
+                config = await loop.run_in_executor(None, self._load)
+            except Exception as e:
+                self.reload_failures += 1
+                logger.error("Tenant config reload from %s failed; keeping the current config: %r", self.path, e)
+                continue
+            self.reloads += 1
+            self._on_reload(config)
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
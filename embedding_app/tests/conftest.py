@@ -0,0 +1,45 @@
+# embedding_app/tests/conftest.py
+# The app modules import each other as top-level modules (uvicorn runs from embedding_app), and
+# main.py reads its configuration from the environment at import; set enough of it here.
+import os
+import sys
+from pathlib import Path
+
+APP_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(APP_DIR))
+
+os.environ.setdefault("SUPERSET_URL", "http://127.0.0.1:8088")
+os.environ.setdefault("SUPERSET_DASHBOARD_ID", "test-dashboard")
+os.environ.setdefault("SESSION_SECRET", "test-session-secret-of-at-least-32-bytes")
+
+
+import pytest  # noqa: E402
+
+
+@pytest.fixture
+def minted(monkeypatch):
+    """Replaces guest token minting in main with a stub; returns the identities minted, in order.
+
+    The stub's tokens are "token:<identity>", except for identities listed in `minted.fail`, which
+    raise HTTP 502 like an upstream failure. Gives main a fresh guest token cache and no rate limit.
+    """
+    import main
+    from fastapi import HTTPException
+    from token_cache import GuestTokenCache
+
+    class Minted(list):
+        fail: set
+
+    calls = Minted()
+    calls.fail = set()
+
+    async def fake_mint(guest_request):
+        calls.append(guest_request.identity)
+        if guest_request.identity in calls.fail:
+            raise HTTPException(status_code=502, detail="Superset guest token API failed")
+        return f"token:{guest_request.identity}"
+
+    monkeypatch.setattr(main, "_mint_guest_token_shared", fake_mint)
+    monkeypatch.setattr(main, "guest_token_cache", GuestTokenCache())
+    monkeypatch.setattr(main, "RATE_LIMIT_ENABLED", False)
+    return calls
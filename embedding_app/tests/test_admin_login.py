@@ -0,0 +1,80 @@
+# embedding_app/tests/test_admin_login.py
+# Single-flight admin login in one worker: concurrent callers that find no valid admin token share one
+# call to /api/v1/security/login against a stub Superset client, and the token's own `exp` sets its lifetime.
+import time
+import asyncio
+
+import jwt
+import pytest
+
+import main
+
+SIGNING_KEY = "test-signing-key-of-at-least-32-bytes"
+
+
+class StubSupersetClient:
+    def __init__(self, expires_in: float = 3600):
+        self.expires_in = expires_in
+        self.logins = 0
+
+    async def post_json(self, path, payload, **kwargs):
+        assert path == "/api/v1/security/login"
+        self.logins += 1
+        await asyncio.sleep(0.1)
+        claims = {"csrf": f"csrf-{self.logins}", "exp": int(time.time() + self.expires_in)}
+        return {"access_token": jwt.encode(claims, SIGNING_KEY, algorithm="HS256")}
+
+
+@pytest.fixture
+def superset(monkeypatch):
+    client = StubSupersetClient()
+    monkeypatch.setattr(main, "superset_client", client)
+    monkeypatch.setattr(main, "shared_token_store", None)
+    monkeypatch.setattr(main, "superset_token_cache", {"access_token": None, "csrf_token": None, "expires": 0})
+    monkeypatch.setattr(main, "superset_login_lock", asyncio.Lock())
+    return client
+
+
+def test_concurrent_callers_share_one_login(superset):
+    async def run():
+        return await asyncio.gather(*(main.get_superset_tokens() for _ in range(20)))
+
+    results = asyncio.run(run())
+
+    assert superset.logins == 1
+    assert all(tokens == results[0] for tokens in results)
+    assert results[0]["csrf_token"] == "csrf-1"
+
+
+def test_cached_token_is_reused_until_close_to_exp(superset):
+    async def run():
+        first = await main.get_superset_tokens()
+        second = await main.get_superset_tokens()
+        main.superset_token_cache["expires"] = time.time() + main.ADMIN_TOKEN_MIN_VALIDITY - 1
+        third = await main.get_superset_tokens()
+        return first, second, third
+
+    first, second, third = asyncio.run(run())
+
+    assert first == second
+    assert third["csrf_token"] == "csrf-2"
+    assert superset.logins == 2
+
+
+def test_token_lifetime_comes_from_its_exp_claim(superset):
+    superset.expires_in = 900
+    asyncio.run(main.get_superset_tokens())
+
+    assert main.superset_token_cache["expires"] == pytest.approx(time.time() + 900, abs=5)
+
+
+def test_refresh_renews_only_inside_the_lead_window(superset):
+    async def run():
+        await main.get_superset_tokens()
+        await main.refresh_superset_tokens()  # Valid for an hour: well outside the lead window
+        main.superset_token_cache["expires"] = time.time() + main.ADMIN_TOKEN_REFRESH_LEAD - 1
+        await asyncio.gather(*(main.refresh_superset_tokens() for _ in range(5)))
+
+    asyncio.run(run())
+
+    assert superset.logins == 2
@@ -0,0 +1,109 @@
+# embedding_app/tests/test_chart_warmup.py
+# Chart cache warm-up against the local Superset stand-in (bench/fake_superset.py) served on a
+# free port in a background thread.
+import sys
+import time
+import socket
+import asyncio
+import threading
+from pathlib import Path
+
+import jwt
+import pytest
+import uvicorn
+
+from superset_client import SupersetClient, CircuitBreaker
+from chart_warmup import ChartCacheWarmer
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "bench"))
+import fake_superset  # noqa: E402
+
+DASHBOARD = "0b7e6f3c-2f1a-4c55-9a5e-3d1c8a6f0e11"
+CHARTS = 6
+
+
+@pytest.fixture(scope="module")
+def stand_in():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(fake_superset.app, host="127.0.0.1", port=port, log_level="warning",
+                                           ws="none"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    deadline = time.time() + 10
+    while not server.started and time.time() < deadline:
+        time.sleep(0.02)
+    yield f"http://127.0.0.1:{port}"
+    server.should_exit = True
+    thread.join(5)
+
+
+@pytest.fixture
+def superset(stand_in, monkeypatch):
+    monkeypatch.setattr(fake_superset, "LATENCY_MS", 0)
+    monkeypatch.setattr(fake_superset, "JITTER_MS", 0)
+    monkeypatch.setattr(fake_superset, "QUERY_MS", 50)
+    monkeypatch.setattr(fake_superset, "CHARTS_PER_DASHBOARD", CHARTS)
+    for name in fake_superset.call_counts:
+        fake_superset.call_counts[name] = 0
+    fake_superset.data_cache.clear()
+    return stand_in
+
+
+def guest_token(manufacturer: str) -> str:
+    return jwt.encode({"rls_rules": [{"clause": f"\"Manufacturer\" = '{manufacturer}'"}], "aud": "superset",
+                       "type": "guest", "exp": time.time() + 300}, fake_superset.SECRET, algorithm="HS256")
+
+
+async def admin_headers():
+    return {"Authorization": "Bearer admin-token"}
+
+
+def run_warmer(url: str, scenario, **options):
+    async def run():
+        warmer = ChartCacheWarmer(SupersetClient(url, max_retries=0, breaker=CircuitBreaker()), admin_headers,
+                                  **options)
+        await warmer.client.start()
+        try:
+            result = scenario(warmer)
+            await asyncio.gather(*list(warmer._jobs.values()))
+            return result, warmer.stats()
+        finally:
+            await warmer.close()
+    return asyncio.run(run())
+
+
+def test_duplicate_schedules_for_a_tenant_and_dashboard_run_once(superset):
+    scheduled, stats = run_warmer(superset, lambda w: [w.schedule("Cipla Ltd", DASHBOARD, guest_token("Cipla Ltd"))
+                                                       for _ in range(3)])
+    assert scheduled == [True, False, False]
+    assert stats["deduplicated"] == 2
+    assert stats["charts_warmed"] == CHARTS
+    assert fake_superset.call_counts["chart_data"] == CHARTS
+
+
+def test_plan_is_fetched_once_and_reused_across_tenants(superset):
+    tenants = ["Cipla Ltd", "Lupin Ltd", "Sun Pharma"]
+    _, stats = run_warmer(superset, lambda w: [w.schedule(t, DASHBOARD, guest_token(t)) for t in tenants])
+    # embedded_dashboard + dashboard charts + one chart detail per chart, shared by every tenant
+    assert fake_superset.call_counts["dashboard"] == 2 + CHARTS
+    assert stats["dashboards"] == 1
+    assert stats["charts_warmed"] == CHARTS * len(tenants)
+
+
+def test_chart_queries_stay_within_the_concurrency_limit(superset):
+    tenants = ["Cipla Ltd", "Lupin Ltd", "Sun Pharma"]
+    _, stats = run_warmer(superset, lambda w: [w.schedule(t, DASHBOARD, guest_token(t)) for t in tenants],
+                          concurrency=2)
+    assert stats["charts_warmed"] == CHARTS * len(tenants)
+    assert fake_superset.call_counts["chart_data_max_in_flight"] == 2
+
+
+def test_full_queue_drops_work_without_raising(superset):
+    scheduled, stats = run_warmer(superset, lambda w: [w.schedule(t, DASHBOARD, guest_token(t))
+                                                       for t in ("Cipla Ltd", "Lupin Ltd", "Sun Pharma")],
+                                  max_jobs=1)
+    assert scheduled == [True, False, False]
+    assert stats["dropped"] == 2
+    assert stats["charts_warmed"] == CHARTS
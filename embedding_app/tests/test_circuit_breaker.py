@@ -0,0 +1,35 @@
+# embedding_app/tests/test_circuit_breaker.py
+# A half-open probe that ends in anything but an HTTPException must not leave the breaker stuck.
+import asyncio
+
+import pytest
+
+from superset_client import SupersetClient, CircuitBreaker
+
+
+def half_open_client(request_once) -> SupersetClient:
+    client = SupersetClient("http://superset.invalid", max_retries=0,
+                            breaker=CircuitBreaker(failure_threshold=1, recovery_timeout=0))
+    client.breaker.record_failure()  # Opens; recovery_timeout=0 makes the next call the probe
+    client._request_once = request_once
+    return client
+
+
+async def ok(*args):
+    return {"ok": True}
+
+
+@pytest.mark.parametrize("error", [UnicodeDecodeError("utf-8", b"\xff", 0, 1, "invalid start byte"),
+                                   asyncio.CancelledError()])
+def test_probe_ending_in_unexpected_error_frees_the_breaker(error):
+    async def failing(*args):
+        raise error
+
+    async def run():
+        client = half_open_client(failing)
+        with pytest.raises(type(error)):
+            await client._request("GET", "/api/v1/x", None, 5, None, "test")
+        client._request_once = ok
+        return await client._request("GET", "/api/v1/x", None, 5, None, "test"), client.breaker.state
+
+    assert asyncio.run(run()) == ({"ok": True}, CircuitBreaker.CLOSED)
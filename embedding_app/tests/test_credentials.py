@@ -0,0 +1,93 @@
+# embedding_app/tests/test_credentials.py
+import asyncio
+
+import pytest
+
+import credentials
+from credentials import (CredentialStore, Credential, check_password, hash_password, credentials_from_config,
+                         ROLE_ADMIN, ROLE_MANUFACTURER)
+
+ITERATIONS = 1000  # Keeps the tests fast; the format and code path are the same as the default
+
+
+def verify(store, username, password):
+    return asyncio.run(store.verify(username, password))
+
+
+@pytest.fixture
+def store():
+    store = CredentialStore({"admin": Credential(ROLE_ADMIN, hash_password("s3cret", ITERATIONS)),
+                             "Cipla Ltd": Credential(ROLE_MANUFACTURER, hash_password("pw", ITERATIONS))},
+                            hash_workers=2)
+    yield store
+    store.close()
+
+
+def test_pbkdf2_round_trip():
+    stored = hash_password("correct horse", ITERATIONS)
+    assert stored.startswith(f"pbkdf2_sha256${ITERATIONS}$")
+    assert check_password("correct horse", stored)
+    assert not check_password("correct horse ", stored)
+    assert hash_password("correct horse", ITERATIONS) != stored  # Salted
+
+
+@pytest.mark.parametrize("stored", ["", "pbkdf2_sha256$", "pbkdf2_sha256$abc$def$ghi", "pbkdf2_sha256$1000$!!$!!",
+                                    "pbkdf2_sha256$0$AAAA$AAAA", "md5$abc", None])
+def test_malformed_stored_hash_returns_false(stored):
+    assert check_password("anything", stored) is False
+
+
+def test_verify_returns_the_role_only_for_the_right_password(store):
+    assert verify(store, "admin", "s3cret") == ROLE_ADMIN
+    assert verify(store, "Cipla Ltd", "pw") == ROLE_MANUFACTURER
+    assert verify(store, "admin", "wrong") is None
+    assert verify(store, "nobody", "s3cret") is None
+
+
+def test_malformed_hash_in_store_fails_the_login_without_raising():
+    store = CredentialStore({"admin": Credential(ROLE_ADMIN, "pbkdf2_sha256$not-a-hash")})
+    try:
+        assert verify(store, "admin", "anything") is None
+    finally:
+        store.close()
+
+
+def test_remembered_verification_is_dropped_when_the_stored_hash_changes(store):
+    assert verify(store, "admin", "s3cret") == ROLE_ADMIN
+    assert verify(store, "admin", "s3cret") == ROLE_ADMIN
+    assert store.cache_hits == 1
+
+    store.replace({"admin": Credential(ROLE_ADMIN, hash_password("rotated", ITERATIONS))})
+    assert verify(store, "admin", "s3cret") is None
+    assert verify(store, "admin", "rotated") == ROLE_ADMIN
+    assert store.cache_hits == 1
+
+
+def checked_hashes(monkeypatch):
+    seen = []
+    real = credentials.check_password
+
+    def spy(password, password_hash):
+        seen.append(password_hash.split("$")[:2])
+        return real(password, password_hash)
+
+    monkeypatch.setattr(credentials, "check_password", spy)
+    return seen
+
+
+def test_unknown_user_does_the_same_work_as_a_known_plain_text_user(monkeypatch):
+    seen = checked_hashes(monkeypatch)
+    store = CredentialStore(credentials_from_config({"username": "admin", "password": "pw"}, {"Cipla Ltd": "c"}))
+    try:
+        assert verify(store, "admin", "nope") is None
+        assert verify(store, "nobody", "nope") is None
+    finally:
+        store.close()
+    assert [h[0] for h in seen] == ["plain", "plain"]
+
+
+def test_unknown_user_does_the_same_work_as_a_known_hashed_user(store, monkeypatch):
+    seen = checked_hashes(monkeypatch)
+    assert verify(store, "admin", "nope") is None
+    assert verify(store, "nobody", "nope") is None
+    assert seen == [["pbkdf2_sha256", str(ITERATIONS)], ["pbkdf2_sha256", str(ITERATIONS)]]
@@ -0,0 +1,72 @@
+# embedding_app/tests/test_guest_token_batch.py
+# POST /guest-tokens: items are resolved independently, so one failing or forbidden item is reported
+# in its own result while the rest of the batch still gets tokens.
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+
+MANUFACTURER = "Cipla Ltd"
+OTHER_MANUFACTURER = "Lupin Ltd"
+THIRD_MANUFACTURER = "Sun Pharma"
+
+
+@pytest.fixture
+def client(minted):
+    return TestClient(main.app)
+
+
+def test_failed_item_does_not_fail_the_others(client, minted):
+    minted.fail.add(f"mfr:{OTHER_MANUFACTURER}")
+    response = client.post("/guest-tokens", json={"requests": [
+        {"manufacturer": MANUFACTURER},
+        {"manufacturer": OTHER_MANUFACTURER},
+        {"full_access": True, "user_id": "ops"},
+    ]})
+
+    assert response.status_code == 200
+    first, second, third = response.json()["results"]
+    assert first["token"] == f"token:mfr:{MANUFACTURER}"
+    assert "token" not in second and second["error"]["status_code"] == 502
+    assert third["token"] == "token:full:ops" and "error" not in third
+    assert len(minted) == 3
+
+
+def test_forbidden_and_invalid_items_are_reported_per_item(client, minted):
+    token, _ = main.session_manager.issue(MANUFACTURER, "manufacturer")
+    client.cookies.update({main.session_manager.cookie_name: token})
+    response = client.post("/guest-tokens", json={"requests": [
+        {"manufacturer": OTHER_MANUFACTURER},
+        {"manufacturer": MANUFACTURER},
+        {"full_access": True},
+        {"manufacturer": MANUFACTURER, "full_access": True},
+    ]})
+
+    assert response.status_code == 200
+    forbidden, own, full, invalid = response.json()["results"]
+    assert forbidden["error"]["status_code"] == 403
+    assert own == {"dashboard_id": main.tenant_config.default_dashboard_id, "manufacturer": MANUFACTURER,
+                   "full_access": False, "token": f"token:mfr:{MANUFACTURER}"}
+    assert full["error"]["status_code"] == 403
+    assert invalid["error"]["status_code"] == 400
+    assert minted == [f"mfr:{MANUFACTURER}"]
+
+
+def test_unexpected_error_in_one_item_is_isolated(client, minted, monkeypatch):
+    fetch_rls = main.fetch_superset_guest_token_rls
+
+    async def flaky_fetch(manufacturer, dashboard_id=None, client=None):
+        if manufacturer == THIRD_MANUFACTURER:
+            raise RuntimeError("boom")
+        return await fetch_rls(manufacturer, dashboard_id, client)
+
+    monkeypatch.setattr(main, "fetch_superset_guest_token_rls", flaky_fetch)
+    response = client.post("/guest-tokens", json={"requests": [
+        {"manufacturer": THIRD_MANUFACTURER},
+        {"manufacturer": MANUFACTURER},
+    ]})
+
+    assert response.status_code == 200
+    broken, ok = response.json()["results"]
+    assert broken["error"]["status_code"] == 500
+    assert ok["token"] == f"token:mfr:{MANUFACTURER}"
@@ -0,0 +1,69 @@
+# embedding_app/tests/test_local_guest_token.py
+# Locally signed guest tokens must be accepted by Superset's parse_jwt_guest_token, which does
+#   jwt.decode(token, GUEST_TOKEN_JWT_SECRET, algorithms=[GUEST_TOKEN_JWT_ALGO], audience=GUEST_TOKEN_JWT_AUDIENCE)
+# and then requires type == "guest" and reads `user`, `resources` and `rls_rules`.
+import time
+
+import jwt
+import pytest
+
+import main
+from rls import parse_policy
+from tenant_config import compile_rls_request
+
+SECRET = "test-guest-token-secret-of-32-bytes-or-more"
+
+
+@pytest.fixture
+def local_mode(monkeypatch):
+    monkeypatch.setattr(main, "GUEST_TOKEN_MODE", "local")
+    monkeypatch.setattr(main, "GUEST_TOKEN_JWT_SECRET", SECRET)
+    monkeypatch.setattr(main, "GUEST_TOKEN_JWT_ALGO", "HS256")
+    monkeypatch.setattr(main, "GUEST_TOKEN_JWT_AUDIENCE", "superset")
+    monkeypatch.setattr(main, "GUEST_TOKEN_JWT_EXP_SECONDS", 300)
+
+
+def parse_jwt_guest_token(token: str) -> dict:
+    """What Superset's SupersetSecurityManager.parse_jwt_guest_token does with the token."""
+    claims = jwt.decode(token, SECRET, algorithms=["HS256"], audience="superset")
+    if claims.get("type") != "guest":
+        raise ValueError("Not a guest token")
+    return claims
+
+
+def test_locally_minted_rls_token_parses_like_superset(local_mode):
+    policy = parse_policy([{"column": "Manufacturer", "values": ["Cipla Ltd", "Lupin Ltd"]},
+                           {"column": "Region", "values": ["North"], "datasets": [12]}])
+    guest_request = compile_rls_request("Cipla Lupin Group", "dash-uuid", policy)
+
+    claims = parse_jwt_guest_token(main._mint_guest_token_locally(guest_request.payload))
+
+    assert claims["type"] == "guest"
+    assert set(claims["user"]) == {"username", "first_name", "last_name"}
+    assert claims["user"]["username"] == "guest_mfr_Cipla_Lupin_Group"
+    assert claims["resources"] == [{"type": "dashboard", "id": "dash-uuid"}]
+    # GuestTokenRlsRule: {"dataset": <id>, "clause": <sql>}, without `dataset` for every dataset.
+    assert claims["rls_rules"] == [
+        {"clause": "\"Manufacturer\" IN ('Cipla Ltd', 'Lupin Ltd')"},
+        {"dataset": 12, "clause": "\"Region\" = 'North'"},
+    ]
+    for rule in claims["rls_rules"]:
+        assert set(rule) <= {"dataset", "clause"}
+    assert 0 < claims["exp"] - time.time() <= 300
+
+
+def test_locally_minted_full_token_has_no_rls_rules(local_mode):
+    guest_request = main.build_full_guest_token_request("admin")
+
+    claims = parse_jwt_guest_token(main._mint_guest_token_locally(guest_request.payload))
+
+    assert claims["rls_rules"] == []
+    assert claims["resources"] == [{"type": "dashboard", "id": main.SUPERSET_DASHBOARD_ID}]
+
+
+def test_token_signed_with_another_secret_is_rejected(local_mode, monkeypatch):
+    monkeypatch.setattr(main, "GUEST_TOKEN_JWT_SECRET", "another-guest-token-secret-of-32-bytes")
+    token = main._mint_guest_token_locally(main.build_full_guest_token_request("admin").payload)
+
+    with pytest.raises(jwt.InvalidSignatureError):
+        parse_jwt_guest_token(token)
@@ -0,0 +1,85 @@
+# embedding_app/tests/test_log_setup.py
+import io
+import json
+import logging
+
+import jwt
+
+from log_setup import (JsonFormatter, Redacted, RedactingFilter, SamplingFilter, SAMPLED, TEXT_FORMAT,
+                       redact_text)
+
+TOKEN = jwt.encode({"user": {"username": "guest"}, "type": "guest"}, "secret-of-at-least-32-bytes-long!!",
+                   algorithm="HS256")
+CLAUSE = "\"Manufacturer\" = 'Cipla Ltd'"
+
+
+def write(*args, msg="%s", exc=None, level=logging.INFO, fmt=None):
+    """Runs one record through the output side (RedactingFilter + formatter), returns what is written."""
+    stream = io.StringIO()
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(fmt or logging.Formatter(TEXT_FORMAT))
+    handler.addFilter(RedactingFilter())
+    record = logging.LogRecord("test", level, __file__, 1, msg, args, exc)
+    record.request_id = "-"
+    handler.handle(record)
+    return stream.getvalue()
+
+
+def test_jwts_bearer_tokens_and_secret_fields_are_masked():
+    text = redact_text(f'token {TOKEN} Authorization: Bearer abc.def-ghi '
+                       '{"password": "hunter2", "access_token": "xyz", \'refresh_token\': \'r\'} password=p4ss')
+    for secret in (TOKEN, "abc.def-ghi", "hunter2", "xyz", "'r'", "p4ss"):
+        assert secret not in text
+    assert "<jwt:redacted>" in text and "Bearer <redacted>" in text
+
+
+def test_secrets_in_args_are_masked_in_the_written_message():
+    out = write("guest", {"token": TOKEN}, msg="issued for %s: %s")
+    assert TOKEN not in out
+    assert "issued for guest" in out
+
+
+def test_redacted_payload_masks_rls_clauses_and_sensitive_keys():
+    payload = {"user": {"username": "guest_mfr_Cipla"}, "rls": [{"dataset": 12, "clause": CLAUSE}],
+               "password": "hunter2", "guest_token": TOKEN}
+    out = write(Redacted(payload), msg="payload %s")
+    assert "Cipla Ltd" not in out and "hunter2" not in out and TOKEN not in out
+    assert f"<redacted {len(CLAUSE)} chars>" in out
+    assert '"dataset": 12' in out and "guest_mfr_Cipla" in out
+
+
+def test_exception_text_is_masked():
+    try:
+        raise ValueError(f"bad token {TOKEN} for password='hunter2'")
+    except ValueError:
+        import sys
+        exc = sys.exc_info()
+    for fmt in (None, JsonFormatter()):
+        out = write(msg="failed", exc=exc, level=logging.ERROR, fmt=fmt)
+        assert "ValueError" in out
+        assert TOKEN not in out and "hunter2" not in out
+    assert json.loads(out)["exception"]
+
+
+def sampled(level, n, sampler):
+    kept = 0
+    for _ in range(n):
+        record = logging.LogRecord("test", level, __file__, 1, "token issued for %s", ("x",), None)
+        record.__dict__.update(SAMPLED)
+        kept += sampler.filter(record)
+    return kept
+
+
+def test_sampling_limits_info_lines_but_keeps_warnings_and_errors():
+    sampler = SamplingFilter(interval=60, burst=3)
+    assert sampled(logging.INFO, 10, sampler) == 3
+    assert sampler.suppressed == 7
+    assert sampled(logging.WARNING, 10, sampler) == 10
+    assert sampled(logging.ERROR, 10, sampler) == 10
+    assert sampler.suppressed == 7
+
+
+def test_unmarked_lines_are_never_sampled():
+    sampler = SamplingFilter(interval=60, burst=1)
+    records = [logging.LogRecord("test", logging.INFO, __file__, 1, "plain", None, None) for _ in range(5)]
+    assert all(sampler.filter(r) for r in records)
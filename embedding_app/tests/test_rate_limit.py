@@ -0,0 +1,65 @@
+# embedding_app/tests/test_rate_limit.py
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from rate_limit import AdmissionController
+
+
+def test_first_request_of_new_tenant_and_client_is_admitted_with_burst_1():
+    async def run():
+        controller = AdmissionController(tenant_rate=1, tenant_burst=1, client_rate=1, client_burst=1,
+                                         global_rate=0, max_queue=0)
+        for i in range(20):
+            await controller.acquire(f"tenant-{i}", f"10.0.0.{i}")  # max_queue=0: a queued request raises 429
+        return controller.admitted
+
+    assert asyncio.run(run()) == 20
+
+
+def test_second_request_within_burst_1_is_limited():
+    async def run():
+        controller = AdmissionController(tenant_rate=0.1, tenant_burst=1, client_rate=0, global_rate=0, max_queue=0)
+        await controller.acquire("tenant", "10.0.0.1")
+        await controller.acquire("tenant", "10.0.0.1")
+
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(run())
+    assert exc.value.status_code == 429
+
+
+def test_rotating_full_access_user_id_adds_no_capacity(monkeypatch):
+    import main
+    from token_cache import GuestTokenCache
+
+    minted = []
+
+    async def fake_mint(guest_request):
+        minted.append(guest_request.identity)
+        return f"token-{len(minted)}"
+
+    monkeypatch.setattr(main, "RATE_LIMIT_ENABLED", True)
+    monkeypatch.setattr(main, "guest_token_cache", GuestTokenCache())
+    monkeypatch.setattr(main, "_mint_guest_token_shared", fake_mint)
+    monkeypatch.setattr(main, "guest_token_admission",
+                        AdmissionController(tenant_rate=0.001, tenant_burst=2, client_rate=0, global_rate=0,
+                                            max_queue=0))
+
+    async def run():
+        for i in range(5):
+            await main._fetch_guest_token_cached(main.build_full_guest_token_request(f"rotated-{i}"), "10.0.0.1")
+
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(run())
+    assert exc.value.status_code == 429
+    assert minted == ["full:rotated-0", "full:rotated-1"]
+
+
+def test_configured_manufacturers_keep_their_own_buckets():
+    import main
+
+    manufacturer = main.tenant_config.manufacturers[0]
+    assert main._admission_tenant(f"mfr:{manufacturer}") == f"mfr:{manufacturer}"
+    assert main._admission_tenant("mfr:Not A Tenant 1") == main._admission_tenant("mfr:Not A Tenant 2")
+    assert main._admission_tenant("full:a") == main._admission_tenant("full:b")
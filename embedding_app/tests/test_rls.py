@@ -0,0 +1,75 @@
+# embedding_app/tests/test_rls.py
+import pytest
+
+import rls
+from rls import compile_policy, parse_policy, quote_identifier, quote_literal, single_column_policy
+
+
+def rules(raw):
+    return [dict(rule) for rule in compile_policy(parse_policy(raw)).rules]
+
+
+def test_identifiers_and_literals_are_quoted_with_embedded_quotes_doubled():
+    assert quote_identifier('Manu"facturer') == '"Manu""facturer"'
+    assert quote_literal("O'Brien") == "'O''Brien'"
+    assert quote_literal(12) == "12"
+    assert quote_literal(1.5) == "1.5"
+    assert rules([{"column": 'a"b', "values": ["x' OR '1'='1"]}]) == [{"clause": '"a""b" = \'x\'\' OR \'\'1\'\'=\'\'1\''}]
+
+
+@pytest.mark.parametrize("value", [True, float("nan"), float("inf"), float("-inf"), None, {"x": 1}])
+def test_unsupported_values_are_rejected(value):
+    with pytest.raises(ValueError, match="Manufacturer"):
+        parse_policy([{"column": "Manufacturer", "values": [value]}])
+
+
+@pytest.mark.parametrize("value", [True, float("nan"), float("inf")])
+def test_quote_literal_rejects_bool_and_non_finite(value):
+    with pytest.raises(ValueError):
+        quote_literal(value)
+
+
+@pytest.mark.parametrize("item", [{"column": "Manufacturer", "values": "Cipla"},
+                                  {"column": "Manufacturer", "values": {"a": 1}},
+                                  {"column": "Manufacturer", "values": []},
+                                  {"column": "Manufacturer"}])
+def test_values_must_be_a_non_empty_list(item):
+    with pytest.raises(ValueError, match="Manufacturer"):
+        parse_policy([item])
+
+
+def test_single_value_uses_equality_and_several_values_one_in_list():
+    assert rules([{"column": "M", "value": "A"}]) == [{"clause": "\"M\" = 'A'"}]
+    assert rules([{"column": "M", "values": ["B", "A", "B"]}]) == [{"clause": "\"M\" IN ('A', 'B')"}]
+    # Equality conditions on the same column collapse into the intersection, here a single IN list.
+    assert rules([{"column": "M", "values": ["A", "B", "C"]},
+                  {"column": "M", "values": ["B", "C", "D"]}]) == [{"clause": "\"M\" IN ('B', 'C')"}]
+
+
+def test_disjoint_conditions_on_one_column_allow_nothing():
+    assert rules([{"column": "M", "values": ["A"]}, {"column": "M", "values": ["B"]}]) == [{"clause": "1 = 0"}]
+
+
+def test_columns_are_anded():
+    assert rules([{"column": "M", "values": ["A"]}, {"column": "R", "values": [1, 2]}]) == \
+        [{"clause": "(\"M\" = 'A') AND (\"R\" IN (1, 2))"}]
+
+
+def test_dataset_conditions_are_grouped_per_dataset_under_the_dataset_key():
+    assert rules([{"column": "M", "values": ["A", "B"]},
+                  {"column": "R", "values": ["North"], "datasets": [14, 12]},
+                  {"column": "Y", "values": [2024], "datasets": [12]}]) == [
+        {"clause": "\"M\" IN ('A', 'B')"},
+        {"dataset": 12, "clause": "(\"R\" = 'North') AND (\"Y\" = 2024)"},
+        {"dataset": 14, "clause": "\"R\" = 'North'"},
+    ]
+    assert [dict(r) for r in compile_policy(single_column_policy("M", "A", 7)).rules] == \
+        [{"dataset": 7, "clause": "\"M\" = 'A'"}]
+
+
+def test_equal_policies_compile_once_and_share_the_result():
+    first = compile_policy(parse_policy([{"column": "M", "values": ["A", "B"]}, {"column": "R", "values": [1]}]))
+    second = compile_policy(parse_policy([{"column": "R", "values": [1]}, {"column": "M", "values": ["B", "A"]}]))
+    assert second is first
+    assert rls._memo[first.version] is first
+    assert compile_policy(parse_policy([{"column": "M", "values": ["A"]}])).version != first.version
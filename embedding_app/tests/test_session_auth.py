@@ -0,0 +1,87 @@
+# embedding_app/tests/test_session_auth.py
+# Authorization of the guest token endpoints by login session (cookie or Bearer header).
+import json
+import time
+
+import jwt
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+
+
+@pytest.fixture
+def client(minted):
+    return TestClient(main.app)
+
+
+@pytest.fixture
+def require_session(monkeypatch):
+    monkeypatch.setattr(main, "REQUIRE_SESSION", True)
+
+
+def session_cookie(username, role):
+    token, _ = main.session_manager.issue(username, role)
+    return {main.session_manager.cookie_name: token}
+
+
+MANUFACTURER = "Cipla Ltd"
+OTHER_MANUFACTURER = "Lupin Ltd"
+
+
+def test_manufacturer_session_gets_its_own_tenant_token(client):
+    client.cookies.update(session_cookie(MANUFACTURER, "manufacturer"))
+    response = client.get("/get-guest-token-rls", params={"manufacturer": MANUFACTURER})
+    assert response.status_code == 200
+    assert response.json() == {"token": f"token:mfr:{MANUFACTURER}"}
+
+
+def test_manufacturer_session_cannot_get_another_tenants_token(client, minted):
+    client.cookies.update(session_cookie(MANUFACTURER, "manufacturer"))
+    assert client.get("/get-guest-token-rls", params={"manufacturer": OTHER_MANUFACTURER}).status_code == 403
+    assert client.get("/get-guest-token-full").status_code == 403
+    assert minted == []
+
+
+def test_manufacturer_bearer_session_is_checked_too(client):
+    token, _ = main.session_manager.issue(MANUFACTURER, "manufacturer")
+    response = client.get("/get-guest-token-rls", params={"manufacturer": OTHER_MANUFACTURER},
+                          headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 403
+
+
+def test_admin_session_gets_any_token(client):
+    client.cookies.update(session_cookie("admin", "admin"))
+    assert client.get("/get-guest-token-rls", params={"manufacturer": OTHER_MANUFACTURER}).status_code == 200
+    assert client.get("/get-guest-token-full").status_code == 200
+
+
+def test_missing_session_is_rejected_when_required(client, minted, require_session):
+    assert client.get("/get-guest-token-rls", params={"manufacturer": MANUFACTURER}).status_code == 401
+    assert client.get("/get-guest-token-full").status_code == 401
+    assert minted == []
+
+
+def test_expired_session_is_rejected_when_required(client, require_session):
+    now = int(time.time())
+    expired = jwt.encode({"sub": MANUFACTURER, "role": "manufacturer", "iat": now - 7200, "exp": now - 3600,
+                          "type": "embedding_session"}, main.session_manager._secret, algorithm="HS256")
+    client.cookies.update({main.session_manager.cookie_name: expired})
+    assert client.get("/get-guest-token-rls", params={"manufacturer": MANUFACTURER}).status_code == 401
+
+
+def test_tampered_session_is_rejected(client, minted, require_session):
+    token, _ = main.session_manager.issue(MANUFACTURER, "manufacturer")
+    header, _, signature = token.split(".")
+    # Same signature, payload rewritten to claim the admin role.
+    forged_payload = jwt.utils.base64url_encode(
+        json.dumps({"sub": "admin", "role": "admin", "exp": int(time.time()) + 3600,
+                                "type": "embedding_session"}).encode()).decode()
+    client.cookies.update({main.session_manager.cookie_name: f"{header}.{forged_payload}.{signature}"})
+    assert client.get("/get-guest-token-full").status_code == 401
+    # Signed with another secret
+    other = jwt.encode({"sub": "admin", "role": "admin", "exp": int(time.time()) + 3600, "type": "embedding_session"},
+                       "not-the-session-secret-but-long-enough", algorithm="HS256")
+    client.cookies.update({main.session_manager.cookie_name: other})
+    assert client.get("/get-guest-token-full").status_code == 401
+    assert minted == []
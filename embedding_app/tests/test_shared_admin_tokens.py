@@ -0,0 +1,88 @@
+# embedding_app/tests/test_shared_admin_tokens.py
+# Admin token handoff between workers through the shared store, on the in-memory Redis stand-in:
+# one worker takes the login lock and logs in, the others wait for and adopt its tokens.
+import time
+import asyncio
+from contextlib import asynccontextmanager
+
+import pytest
+
+import main
+from shared_cache import SharedTokenStore, InMemoryRedis
+
+
+@pytest.fixture
+def shared_store(monkeypatch):
+    store = SharedTokenStore(InMemoryRedis(), prefix="test:")
+    monkeypatch.setattr(main, "shared_token_store", store)
+    monkeypatch.setattr(main, "superset_token_cache", {"access_token": None, "csrf_token": None, "expires": 0})
+    return store
+
+
+@pytest.fixture
+def logins(monkeypatch):
+    """Replaces the Superset login with a slow fake; returns the list of logins made."""
+    made = []
+
+    async def fake_login():
+        made.append(time.time())
+        await asyncio.sleep(0.3)
+        tokens = {"access_token": f"access-{len(made)}", "csrf_token": f"csrf-{len(made)}"}
+        main.superset_token_cache.update(tokens, expires=time.time() + 3600)
+        return tokens
+
+    monkeypatch.setattr(main, "_login_to_superset", fake_login)
+    return made
+
+
+def test_concurrent_workers_log_in_once_and_share_the_tokens(shared_store, logins):
+    async def run():
+        return await asyncio.gather(*(main._obtain_superset_tokens(60) for _ in range(4)))
+
+    results = asyncio.run(run())
+
+    assert len(logins) == 1
+    assert all(tokens == {"access_token": "access-1", "csrf_token": "csrf-1"} for tokens in results)
+
+
+def test_tokens_in_the_shared_store_are_adopted_without_login(shared_store, logins):
+    async def run():
+        await shared_store.set_json(main.SHARED_ADMIN_TOKEN_KEY,
+                                    {"access_token": "a", "csrf_token": "c", "expires": time.time() + 3600}, ttl=3600)
+        return await main._obtain_superset_tokens(60)
+
+    assert asyncio.run(run()) == {"access_token": "a", "csrf_token": "c"}
+    assert logins == []
+    assert main.superset_token_cache["access_token"] == "a"
+
+
+def test_login_lock_is_released_after_login(shared_store, logins):
+    async def run():
+        await main._obtain_superset_tokens(60)
+        assert await shared_store.client.get(shared_store._key(f"lock:{main.SHARED_ADMIN_TOKEN_KEY}")) is None
+        # Tokens about to expire are not adopted, so the next worker must log in itself.
+        await shared_store.set_json(main.SHARED_ADMIN_TOKEN_KEY,
+                                    {"access_token": "old", "csrf_token": "old", "expires": time.time() + 5}, ttl=5)
+        return await main._obtain_superset_tokens(60)
+
+    assert asyncio.run(run()) == {"access_token": "access-2", "csrf_token": "csrf-2"}
+    assert len(logins) == 2
+
+
+def test_tokens_published_before_the_lock_is_taken_are_adopted_without_login(shared_store, logins, monkeypatch):
+    # The previous holder publishes its tokens and releases the lock between this worker's first read
+    # of the store and its lock attempt, so the lock is free but a login is no longer needed.
+    take_lock = shared_store.lock
+
+    @asynccontextmanager
+    async def lock_after_publish(name, ttl):
+        await shared_store.set_json(main.SHARED_ADMIN_TOKEN_KEY,
+                                    {"access_token": "a", "csrf_token": "c", "expires": time.time() + 3600}, ttl=3600)
+        async with take_lock(name, ttl) as acquired:
+            assert acquired
+            yield acquired
+
+    monkeypatch.setattr(shared_store, "lock", lock_after_publish)
+
+    assert asyncio.run(main._obtain_superset_tokens(60)) == {"access_token": "a", "csrf_token": "c"}
+    assert logins == []
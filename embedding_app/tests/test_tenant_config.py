@@ -0,0 +1,101 @@
+# embedding_app/tests/test_tenant_config.py
+# TENANTS_FILE hot reload: a valid change swaps in a new precompiled snapshot, an invalid one
+# keeps the current snapshot, and the version only moves when token content changes.
+import os
+import json
+import asyncio
+
+import pytest
+
+import main
+from credentials import CredentialStore
+from tenant_config import TenantConfigWatcher, load_tenant_file
+
+DASHBOARD = "dash-default"
+
+
+def tenants(*manufacturers, column="Manufacturer", password="plain$pw", extra_rls=None):
+    users = [{"username": "admin", "role": "admin", "password_hash": "plain$admin"}]
+    users += [{"username": m, "role": "manufacturer", "password_hash": password} for m in manufacturers]
+    if extra_rls:
+        users[-1]["rls"] = extra_rls
+    return {"users": users, "rls": {"column": column, "dataset_id": None}}
+
+
+def write(path, data, tick=[0]):
+    path.write_text(json.dumps(data) if isinstance(data, dict) else data)
+    tick[0] += 1
+    os.utime(path, ns=(tick[0] * 10**9, tick[0] * 10**9))  # Distinct mtime even within one clock tick
+
+
+def load(path):
+    return load_tenant_file(str(path), DASHBOARD, [DASHBOARD])
+
+
+@pytest.fixture
+def live_config(tmp_path, monkeypatch):
+    """main's current config loaded from a temp TENANTS_FILE, with hot reload wired to apply_tenant_config."""
+    path = tmp_path / "tenants.json"
+    write(path, tenants("Cipla Ltd"))
+    config = load(path)
+    monkeypatch.setattr(main, "tenant_config", config)
+    monkeypatch.setattr(main, "credential_store", CredentialStore(config.credentials, hash_workers=1))
+    monkeypatch.setattr(main, "PREWARM_GUEST_TOKENS", False)
+    yield path
+    main.credential_store.close()
+
+
+def run_watcher(path, change, wait=0.3):
+    async def run():
+        watcher = TenantConfigWatcher(str(path), lambda: load(path), main.apply_tenant_config, interval=0.02)
+        watcher.start()
+        try:
+            change()
+            await asyncio.sleep(wait)
+        finally:
+            await watcher.stop()
+        return watcher
+    return asyncio.run(run())
+
+
+def test_valid_change_swaps_in_a_new_precompiled_config(live_config):
+    before = main.tenant_config
+    watcher = run_watcher(live_config, lambda: write(live_config, tenants("Cipla Ltd", "Lupin Ltd")))
+
+    assert watcher.reloads == 1 and watcher.reload_failures == 0
+    after = main.tenant_config
+    assert after is not before and after.version != before.version
+    assert after.manufacturers == ("Cipla Ltd", "Lupin Ltd")
+    assert after.rls_request("Lupin Ltd") is after.rls_request("Lupin Ltd")  # Precompiled template
+    assert after.rls_request("Lupin Ltd").payload["rls"] == [{"clause": "\"Manufacturer\" = 'Lupin Ltd'"}]
+    assert "Lupin Ltd" in main.credential_store
+
+
+@pytest.mark.parametrize("broken", ["{not json",
+                                    tenants("Cipla Ltd", extra_rls=[{"column": "Region", "values": "North"}]),
+                                    {"users": [{"username": "x", "role": "manufacturer", "password_hash": "plain$x"}],
+                                     "rls": {"column": "Manufacturer"}}])
+def test_invalid_file_keeps_the_current_config(live_config, broken):
+    before = main.tenant_config
+    watcher = run_watcher(live_config, lambda: write(live_config, broken))
+
+    assert watcher.reload_failures == 1 and watcher.reloads == 0
+    assert main.tenant_config is before
+
+
+def test_version_changes_only_when_token_content_changes(tmp_path):
+    path = tmp_path / "tenants.json"
+    write(path, tenants("Cipla Ltd"))
+    base = load(path).version
+
+    write(path, tenants("Cipla Ltd"))
+    assert load(path).version == base
+    write(path, tenants("Cipla Ltd", password="plain$rotated"))  # Logins alone do not change tokens
+    assert load(path).version == base
+
+    write(path, tenants("Cipla Ltd", column="Company"))
+    assert load(path).version != base
+    write(path, tenants("Cipla Ltd", extra_rls=[{"column": "Manufacturer", "values": ["Cipla Ltd", "Lupin Ltd"]}]))
+    assert load(path).version != base
+    write(path, tenants("Cipla Ltd", "Lupin Ltd"))
+    assert load(path).version != base
@@ -0,0 +1,113 @@
+# embedding_app/tests/test_token_cache.py
+# GuestTokenCache: LRU bound, expiry taken from the token's own `exp` minus the safety margin, and one
+# upstream mint per key however many callers miss at once.
+import time
+import asyncio
+
+import jwt
+
+from token_cache import GuestTokenCache, make_cache_key
+
+SIGNING_KEY = "test-signing-key-of-at-least-32-bytes"
+
+
+def make_token(expires_in: float) -> str:
+    return jwt.encode({"exp": int(time.time() + expires_in)}, SIGNING_KEY, algorithm="HS256")
+
+
+def key(identity: str):
+    return make_cache_key("dash", identity, [])
+
+
+def test_least_recently_used_entry_is_evicted_first():
+    cache = GuestTokenCache(max_entries=2)
+    cache.put(key("a"), make_token(600))
+    cache.put(key("b"), make_token(600))
+    assert cache.get(key("a")) is not None  # "a" is now more recently used than "b"
+
+    cache.put(key("c"), make_token(600))
+
+    assert cache.get(key("b")) is None
+    assert cache.get(key("a")) is not None and cache.get(key("c")) is not None
+    assert cache.evictions == 1 and len(cache) == 2
+
+
+def test_entry_is_fresh_until_exp_minus_the_safety_margin():
+    cache = GuestTokenCache(safety_margin=30)
+    token = make_token(600)
+    exp = jwt.decode(token, options={"verify_signature": False})["exp"]
+
+    assert cache.put(key("a"), token) == exp - 30
+    assert cache.expires_at(key("a")) == exp - 30
+    assert cache.get(key("a")) == token
+
+
+def test_token_expiring_within_the_safety_margin_is_not_cached():
+    cache = GuestTokenCache(safety_margin=30)
+    cache.put(key("a"), make_token(20))
+
+    assert cache.get(key("a")) is None
+    assert len(cache) == 0
+
+
+def test_concurrent_misses_share_a_single_mint():
+    cache = GuestTokenCache()
+    mints = []
+
+    async def mint():
+        mints.append(1)
+        await asyncio.sleep(0.1)
+        return make_token(600)
+
+    async def run():
+        return await asyncio.gather(*(cache.get_or_mint(key("a"), mint) for _ in range(10)))
+
+    tokens = asyncio.run(run())
+
+    assert len(mints) == 1
+    assert len(set(tokens)) == 1
+    stats = cache.stats()
+    assert (stats["misses"], stats["coalesced"], stats["hits"]) == (1, 9, 0)
+    assert stats["hit_ratio"] == 0.0
+
+
+def test_different_keys_mint_separately_and_later_lookups_are_hits():
+    cache = GuestTokenCache()
+    mints = []
+
+    def mint_for(identity):
+        async def mint():
+            mints.append(identity)
+            await asyncio.sleep(0.05)
+            return make_token(600)
+        return mint
+
+    async def run():
+        mint_a, mint_b = mint_for("a"), mint_for("b")
+        await asyncio.gather(*(cache.get_or_mint(key(i), m) for i, m in [("a", mint_a), ("b", mint_b)] * 3))
+        await cache.get_or_mint(key("a"), mint_a)
+
+    asyncio.run(run())
+
+    assert sorted(mints) == ["a", "b"]
+    assert (cache.misses, cache.coalesced, cache.hits) == (2, 4, 1)
+
+
+def test_failed_mint_is_shared_and_not_cached():
+    cache = GuestTokenCache()
+    mints = []
+
+    async def mint():
+        mints.append(1)
+        await asyncio.sleep(0.05)
+        raise RuntimeError("superset down")
+
+    async def run():
+        return await asyncio.gather(*(cache.get_or_mint(key("a"), mint) for _ in range(3)),
+                                    return_exceptions=True)
+
+    results = asyncio.run(run())
+
+    assert len(mints) == 1
+    assert all(isinstance(r, RuntimeError) for r in results)
+    assert len(cache) == 0
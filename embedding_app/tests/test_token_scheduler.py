@@ -0,0 +1,66 @@
+# embedding_app/tests/test_token_scheduler.py
+# Renewed tokens are pushed to subscribers (the /guest-token-stream path), and a subscriber's
+# ephemeral renewal job goes away with its last subscriber.
+import time
+import asyncio
+
+import jwt
+
+from token_cache import GuestTokenCache, make_cache_key
+from token_scheduler import TokenRenewalScheduler
+
+KEY = make_cache_key("dash", "mfr:Cipla Ltd", [])
+LIFETIME = 2  # Seconds; short enough that renewal comes due within the test
+
+
+def short_lived_minter():
+    minted = []
+
+    async def mint():
+        minted.append(time.time())
+        return jwt.encode({"n": len(minted), "exp": int(time.time()) + LIFETIME},
+                          "scheduler-test-secret-of-32-bytes-or-more", algorithm="HS256")
+    return mint, minted
+
+
+def scheduler() -> TokenRenewalScheduler:
+    cache = GuestTokenCache(safety_margin=0, stale_margin=0)
+    return TokenRenewalScheduler(cache, renew_lead=1, jitter=0)
+
+
+def test_renewal_is_pushed_to_subscriber_and_job_removed_on_disconnect():
+    async def run():
+        renewals = scheduler()
+        mint, minted = short_lived_minter()
+        first = await renewals.cache.get_or_mint(KEY, mint)  # As the stream endpoint does before subscribing
+        queue = renewals.subscribe(KEY, mint)
+        assert renewals.subscriber_count == 1 and KEY in renewals._ephemeral
+        renewals.start(warm_up=False)
+        try:
+            pushed = await asyncio.wait_for(queue.get(), timeout=LIFETIME + 3)
+            assert pushed != first
+            assert jwt.decode(pushed, options={"verify_signature": False})["n"] == 2
+            assert renewals.cache.get(KEY) == pushed
+
+            renewals.unsubscribe(KEY, queue)
+            assert renewals.subscriber_count == 0
+            assert KEY not in renewals._jobs and KEY not in renewals._ephemeral
+            mints_at_disconnect = len(minted)
+            await asyncio.sleep(LIFETIME + 0.5)
+            assert len(minted) == mints_at_disconnect  # No renewals once the subscriber is gone
+        finally:
+            await renewals.stop()
+
+    asyncio.run(run())
+
+
+def test_subscriber_of_a_registered_job_leaves_the_job_in_place():
+    async def run():
+        renewals = scheduler()
+        mint, _ = short_lived_minter()
+        renewals.register(KEY, mint)
+        queue = renewals.subscribe(KEY, mint)
+        renewals.unsubscribe(KEY, queue)
+        return KEY in renewals._jobs, renewals.subscriber_count
+
+    assert asyncio.run(run()) == (True, 0)
@@ -0,0 +1,204 @@
+# embedding_app/timing.py
+# Per-request timing breakdown, request ids and an opt-in profiler.
+#
+# RequestTimingMiddleware gives each HTTP request a RequestTiming held in a context variable.
+# Code on the request path records named phases with `phase()` / `timed()` (a no-op outside a
+# request, e.g. in background renewals). The phases are returned in a Server-Timing header, e.g.
+#   Server-Timing: admin_token;dur=0.1, guest_token_api;dur=84.2, handler;dur=85.0, total;dur=86.3
+# so browser dev tools show where a slow token went. Durations are wall-clock milliseconds; phases
+# may nest (admin_login runs inside admin_token) and repeat (desc="x3" for three batch mints).
+#
+# Each request also gets an id (a sane inbound X-Request-ID is kept, otherwise a new one), echoed
+# in the X-Request-ID response header and added to log records by RequestIdFilter.
+#
+# Profiling (PROFILE_MODE): "header" profiles requests sent with "X-Profile: 1", "all" profiles
+# a PROFILE_SAMPLE_RATE fraction of requests. Profiles of the slowest PROFILE_KEEP requests are
+# written to PROFILE_DIR as <duration_ms>ms_<request_id>.prof (open with python -m pstats or snakeviz).
+# cProfile sees the whole event loop thread, so one request is profiled at a time, and its profile
+# includes whatever else the loop ran meanwhile.
+import os
+import re
+import time
+import uuid
+import heapq
+import random
+import asyncio
+import cProfile
+import logging
+import functools
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional, Dict, List, Tuple, Callable, Iterator
+
+logger = logging.getLogger(__name__)
+
+# --- Defaults ---
+REQUEST_ID_HEADER = "X-Request-ID"
+PROFILE_HEADER = "X-Profile"
+DEFAULT_PROFILE_KEEP = 10
+DEFAULT_PROFILE_DIR = "profiles"
+PROFILE_MODES = ("off", "header", "all")
+
+_VALID_REQUEST_ID = re.compile(r"^[A-Za-z0-9._\-]{1,64}$")
+
+
+class RequestTiming:
+    __slots__ = ("request_id", "started", "phases")
+
+    def __init__(self, request_id: str):
+        self.request_id = request_id
+        self.started = time.perf_counter()
+        self.phases: Dict[str, List[float]] = {}  # name -> [total seconds, count]
+
+    def add(self, name: str, seconds: float) -> None:
+        entry = self.phases.get(name)
+        if entry is None:
+            self.phases[name] = [seconds, 1]
+        else:
+            entry[0] += seconds
+            entry[1] += 1
+
+    def server_timing(self) -> str:
+        parts = []
+        for name, (seconds, count) in self.phases.items():
+            desc = f';desc="x{count}"' if count > 1 else ""
+            parts.append(f"{name};dur={seconds * 1000:.1f}{desc}")
+        parts.append(f"total;dur={(time.perf_counter() - self.started) * 1000:.1f}")
+        return ", ".join(parts)
+
+
+_current: ContextVar[Optional[RequestTiming]] = ContextVar("request_timing", default=None)
+
+
+def current_request_id() -> Optional[str]:
+    timing = _current.get()
+    return timing.request_id if timing else None
+
+
+@contextmanager
+def phase(name: str) -> Iterator[None]:
+    """Records the time spent in the block under `name` for the current request (if any)."""
+    timing = _current.get()
+    if timing is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timing.add(name, time.perf_counter() - started)
+
+
+def timed(name: str) -> Callable:
+    """Decorator form of `phase` for coroutine functions (endpoint signatures are preserved for FastAPI)."""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with phase(name):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class RequestIdFilter(logging.Filter):
+    """Adds `request_id` ("-" outside a request) to every record, for use in log formats."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = current_request_id() or "-"
+        return True
+
+
+class ProfileKeeper:
+    """Decides which requests to profile and keeps the profiles of the slowest `keep` on disk."""
+
+    def __init__(self, mode: str = "off", directory: str = DEFAULT_PROFILE_DIR,
+                 keep: int = DEFAULT_PROFILE_KEEP, sample_rate: float = 1.0):
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"Invalid PROFILE_MODE '{mode}' (expected one of {', '.join(PROFILE_MODES)})")
+        self.mode = mode
+        self.directory = directory
+        self.keep = max(keep, 1)
+        self.sample_rate = sample_rate
+        self._active = False
+        self._kept: List[Tuple[float, str]] = []  # min-heap of (duration, path)
+        self.profiled = 0
+        if mode != "off":
+            os.makedirs(directory, exist_ok=True)
+            logger.warning("Request profiling enabled (mode=%s); slowest %d profiles go to %s/", mode, keep, directory)
+
+    def should_profile(self, headers: Dict[bytes, bytes]) -> bool:
+        if self.mode == "off" or self._active:
+            return False
+        if b"text/event-stream" in headers.get(b"accept", b""):
+            return False  # Streams stay open for minutes; their profile would say nothing about latency
+        if self.mode == "header":
+            return headers.get(PROFILE_HEADER.lower().encode()) == b"1"
+        return random.random() < self.sample_rate
+
+    def start(self) -> cProfile.Profile:
+        self._active = True
+        profiler = cProfile.Profile()
+        profiler.enable()
+        return profiler
+
+    async def finish(self, profiler: cProfile.Profile, seconds: float, request_id: str) -> None:
+        profiler.disable()
+        self._active = False
+        self.profiled += 1
+        if len(self._kept) >= self.keep and seconds <= self._kept[0][0]:
+            return
+        path = os.path.join(self.directory, f"{seconds * 1000:09.1f}ms_{request_id}.prof")
+        evicted = None
+        if len(self._kept) >= self.keep:
+            evicted = heapq.heapreplace(self._kept, (seconds, path))[1]
+        else:
+            heapq.heappush(self._kept, (seconds, path))
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self._write, profiler, path, evicted)
+
+    @staticmethod
+    def _write(profiler: cProfile.Profile, path: str, evicted: Optional[str]) -> None:
+        try:
+            profiler.dump_stats(path)
+            if evicted:
+                os.remove(evicted)
+        except OSError as e:
+            logger.error("Could not write request profile %s: %r", path, e)
+
+
+class RequestTimingMiddleware:
+    """ASGI middleware: request id, Server-Timing header and optional profiling for each HTTP request."""
+
+    def __init__(self, app, profiler: Optional[ProfileKeeper] = None, timing_allow_origin: Optional[str] = None):
+        self.app = app
+        self.profiler = profiler
+        self.timing_allow_origin = timing_allow_origin
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        request_id = headers.get(REQUEST_ID_HEADER.lower().encode(), b"").decode("latin-1")
+        if not _VALID_REQUEST_ID.match(request_id):
+            request_id = uuid.uuid4().hex
+        timing = RequestTiming(request_id)
+        token = _current.set(timing)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                extra = [(REQUEST_ID_HEADER.encode(), request_id.encode()),
+                         (b"server-timing", timing.server_timing().encode())]
+                if self.timing_allow_origin:
+                    extra.append((b"timing-allow-origin", self.timing_allow_origin.encode()))
+                message = {**message, "headers": list(message.get("headers", [])) + extra}
+            await send(message)
+
+        profiler = self.profiler.start() if self.profiler and self.profiler.should_profile(headers) else None
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            if profiler is not None:
+                await self.profiler.finish(profiler, time.perf_counter() - timing.started, request_id)
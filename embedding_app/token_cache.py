@@ -0,0 +1,215 @@
+# embedding_app/token_cache.py
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Optional, Dict, Any, Tuple, List, Callable, Awaitable
+
+import jwt
+
+logger = logging.getLogger(__name__)
+
+# --- Cache Defaults ---
+DEFAULT_MAX_ENTRIES = 1024
+DEFAULT_SAFETY_MARGIN = 30      # Seconds before the token's own `exp` at which an entry is dropped
+DEFAULT_STALE_MARGIN = 5       # Stale entries may still be served until this many seconds before `exp`
+DEFAULT_STALE_GRACE = 1.0       # How long a caller holding a stale entry waits for a refresh before using it
+DEFAULT_FALLBACK_TTL = 240      # Used only when a token carries no readable `exp` claim
+
+CacheKey = Tuple[str, str, Tuple[Tuple[str, str], ...]]
+
+
+def normalize_rls_rules(rules: List[Dict[str, Any]]) -> Tuple[Tuple[str, str], ...]:
+    """Returns an order-independent, hashable form of a guest-token `rls` list."""
+    return tuple(sorted(
+        (str(rule.get("dataset", "")), " ".join(str(rule.get("clause", "")).split()))
+        for rule in rules
+    ))
+
+
+def make_cache_key(dashboard_id: str, identity: str, rules: List[Dict[str, Any]]) -> CacheKey:
+    """Builds the cache key for a guest token: (dashboard id, identity, normalized RLS rules)."""
+    return (str(dashboard_id), identity, normalize_rls_rules(rules))
+
+
+def token_expiry(token: str) -> Optional[float]:
+    """Reads the `exp` claim from a JWT without verifying it. Returns None if absent or unreadable."""
+    try:
+        claims = jwt.decode(token, options={"verify_signature": False, "verify_exp": False,
+                                            "verify_aud": False})
+    except jwt.PyJWTError:
+        return None
+    exp = claims.get("exp")
+    return float(exp) if isinstance(exp, (int, float)) else None
+
+
+class GuestTokenCache:
+    """Bounded LRU cache of minted guest tokens.
+
+    Each entry is fresh until the token's own `exp` minus `safety_margin`, and may then be served
+    stale (while a refresh runs in the background) until `exp` minus `stale_margin`. Concurrent
+    misses for the same key share a single mint instead of each calling Superset.
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES,
+                 safety_margin: float = DEFAULT_SAFETY_MARGIN,
+                 stale_margin: float = DEFAULT_STALE_MARGIN,
+                 stale_grace: float = DEFAULT_STALE_GRACE,
+                 fallback_ttl: float = DEFAULT_FALLBACK_TTL):
+        self.max_entries = max_entries
+        self.safety_margin = safety_margin
+        self.stale_margin = min(stale_margin, safety_margin)
+        self.stale_grace = stale_grace
+        self.fallback_ttl = fallback_ttl
+        # key -> (token, fresh until, usable-when-stale until)
+        self._entries: "OrderedDict[CacheKey, Tuple[str, float, float]]" = OrderedDict()
+        self._inflight: Dict[CacheKey, "asyncio.Future[str]"] = {}
+        self._tasks: set = set()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0  # Misses that joined a mint already in flight instead of starting one
+        self.stale_served = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: CacheKey) -> Optional[str]:
+        """Returns the token for `key` if it is still fresh."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        token, fresh_until, stale_until = entry
+        now = time.time()
+        if fresh_until <= now:
+            if stale_until <= now:
+                del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return token
+
+    def needs_mint(self, key: CacheKey) -> bool:
+        """True if a request for `key` would start a new mint (no fresh entry and none in flight)."""
+        return key not in self._inflight and self.get(key) is None
+
+    def get_stale(self, key: CacheKey) -> Optional[str]:
+        """Returns the token for `key` if it is past its fresh window but has not yet expired."""
+        entry = self._entries.get(key)
+        if entry is None or entry[2] <= time.time():
+            return None
+        return entry[0]
+
+    def put(self, key: CacheKey, token: str) -> float:
+        """Stores a token and returns the time until which the entry is fresh."""
+        exp = token_expiry(token)
+        now = time.time()
+        if exp is None:
+            exp = now + self.fallback_ttl + self.safety_margin
+        fresh_until, stale_until = exp - self.safety_margin, exp - self.stale_margin
+        if fresh_until <= now:
+            logger.warning("Guest token expires within the safety margin; not caching it.")
+            return fresh_until
+        self._entries[key] = (token, fresh_until, stale_until)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+        return fresh_until
+
+    async def get_or_mint(self, key: CacheKey, mint: Callable[[], Awaitable[str]],
+                          upstream_unavailable: bool = False) -> str:
+        """Returns a cached token for `key`, minting (once, even under concurrency) on a miss.
+
+        If only a stale entry exists, it is returned immediately when `upstream_unavailable` is set,
+        or when the refresh fails or takes longer than `stale_grace`; the refresh keeps running
+        in the background and replaces the entry when it completes.
+        """
+        token = self.get(key)
+        if token is not None:
+            self.hits += 1
+            return token
+
+        stale = self.get_stale(key)
+        pending = self._inflight.get(key)
+        if pending is None:
+            self.misses += 1
+            pending = self._start_mint(key, mint)
+        else:
+            self.coalesced += 1
+        if stale is None:
+            return await asyncio.shield(pending)
+
+        # A still-valid stale token is available: prefer a fresh one, but never wait long for it.
+        if not upstream_unavailable:
+            try:
+                return await asyncio.wait_for(asyncio.shield(pending), timeout=self.stale_grace)
+            except asyncio.TimeoutError:
+                logger.warning("Guest token refresh is slow; serving stale token while it completes.")
+            except Exception as e:
+                logger.warning("Guest token refresh failed (%r); serving stale token.", e)
+        self.stale_served += 1
+        return stale
+
+    async def refresh(self, key: CacheKey, mint: Callable[[], Awaitable[str]]) -> str:
+        """Mints a replacement token for `key` even if a valid one is cached, sharing any in-flight mint."""
+        pending = self._inflight.get(key) or self._start_mint(key, mint)
+        return await asyncio.shield(pending)
+
+    def _start_mint(self, key: CacheKey, mint: Callable[[], Awaitable[str]]) -> "asyncio.Future[str]":
+        """Starts minting `key` in a background task and registers it as the in-flight mint for that key.
+
+        The task is not tied to any one caller, so a caller that disconnects or stops waiting
+        (e.g. after being served a stale token) does not cancel the mint for everyone else.
+        """
+        future: "asyncio.Future[str]" = asyncio.get_running_loop().create_future()
+        # Nobody may be left waiting on a background refresh; don't warn about an unretrieved error.
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._inflight[key] = future
+
+        async def run() -> None:
+            try:
+                token = await mint()
+                self.put(key, token)
+                future.set_result(token)
+            except asyncio.CancelledError:
+                future.cancel()
+                raise
+            except Exception as e:
+                future.set_exception(e)
+            finally:
+                self._inflight.pop(key, None)
+
+        task = asyncio.ensure_future(run())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return future
+
+    def expires_at(self, key: CacheKey) -> Optional[float]:
+        """Returns when the cached entry for `key` stops being fresh, or None if there is no entry."""
+        entry = self._entries.get(key)
+        return entry[1] if entry else None
+
+    async def cancel_pending(self) -> None:
+        """Cancels in-flight mints; called on shutdown before the Superset client is closed."""
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def invalidate(self, key: CacheKey) -> None:
+        self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "stale_served": self.stale_served,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
@@ -0,0 +1,225 @@
+# embedding_app/token_scheduler.py
+import asyncio
+import heapq
+import logging
+import random
+import time
+from typing import Dict, List, Set, Tuple, Callable, Awaitable, Optional
+
+from fastapi import HTTPException
+
+from token_cache import GuestTokenCache, CacheKey
+
+logger = logging.getLogger(__name__)
+
+# --- Scheduler Defaults ---
+DEFAULT_CONCURRENCY = 4     # Upstream mints in flight at once during warm-up and renewal
+DEFAULT_RENEW_LEAD = 60     # Seconds before a cache entry expires that renewal is due
+DEFAULT_JITTER = 0.2        # Renew up to this fraction of a token's lifetime earlier, to spread load
+RETRY_MIN, RETRY_MAX = 5, 120
+
+MintFn = Callable[[], Awaitable[str]]
+
+
+class TokenRenewalScheduler:
+    """Pre-warms a known set of guest tokens into the cache and renews each one before it expires.
+
+    Jobs are registered once (key + mint coroutine factory). A single background loop keeps them
+    in a heap ordered by due time; renewals run with bounded concurrency and a random lead so that
+    tokens minted together at startup do not all come due together afterwards.
+
+    Subscribers (e.g. SSE connections) get each renewed token pushed onto a one-slot queue that
+    always holds only the latest token. Subscribing to an unregistered key registers it until
+    its last subscriber leaves.
+    """
+
+    def __init__(self, cache: GuestTokenCache,
+                 concurrency: int = DEFAULT_CONCURRENCY,
+                 renew_lead: float = DEFAULT_RENEW_LEAD,
+                 jitter: float = DEFAULT_JITTER):
+        self.cache = cache
+        self.renew_lead = renew_lead
+        self.jitter = jitter
+        self._concurrency = concurrency
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._jobs: Dict[CacheKey, MintFn] = {}
+        self._failures: Dict[CacheKey, int] = {}
+        self._heap: List[Tuple[float, CacheKey]] = []
+        self._due: Dict[CacheKey, float] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._warmed_up = asyncio.Event()  # Set once start()'s warm-up (if any) has finished
+        self._task: Optional["asyncio.Task[None]"] = None
+        self._pending: set = set()
+        self._subscribers: Dict[CacheKey, Set["asyncio.Queue[str]"]] = {}
+        self._ephemeral: Set[CacheKey] = set()  # Jobs registered only for their subscribers
+        self.renewals = 0
+        self.renewal_failures = 0
+
+    def register(self, key: CacheKey, mint: MintFn) -> None:
+        """Adds a token to keep warm. Unless already cached, it is minted on the next warm_up() or loop iteration."""
+        self._jobs[key] = mint
+        self._ephemeral.discard(key)
+        self._schedule(key, time.time() if self.cache.expires_at(key) is None else self._next_due(key))
+
+    def unregister(self, key: CacheKey) -> None:
+        """Stops renewing `key` (once its last subscriber leaves, if it has any).
+
+        Any heap entry left for it is skipped when it comes due.
+        """
+        if self._subscribers.get(key):
+            self._ephemeral.add(key)
+            return
+        self._jobs.pop(key, None)
+        self._due.pop(key, None)
+        self._failures.pop(key, None)
+        self._ephemeral.discard(key)
+
+    def subscribe(self, key: CacheKey, mint: MintFn) -> "asyncio.Queue[str]":
+        """Returns a queue receiving every renewed token for `key`, registering the job if needed."""
+        if key not in self._jobs:
+            self._ephemeral.add(key)
+            self._jobs[key] = mint
+            self._schedule(key, self._next_due(key))
+        queue: "asyncio.Queue[str]" = asyncio.Queue(maxsize=1)
+        self._subscribers.setdefault(key, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, key: CacheKey, queue: "asyncio.Queue[str]") -> None:
+        subscribers = self._subscribers.get(key)
+        if subscribers is None:
+            return
+        subscribers.discard(queue)
+        if not subscribers:
+            del self._subscribers[key]
+            if key in self._ephemeral:
+                self.unregister(key)
+
+    def _publish(self, key: CacheKey, token: str) -> None:
+        for queue in self._subscribers.get(key, ()):
+            if queue.full():
+                queue.get_nowait()  # A subscriber only ever needs the latest token
+            queue.put_nowait(token)
+
+    @property
+    def subscriber_count(self) -> int:
+        return sum(len(s) for s in self._subscribers.values())
+
+    def _schedule(self, key: CacheKey, due: float) -> None:
+        self._due[key] = due
+        heapq.heappush(self._heap, (due, key))
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def _next_due(self, key: CacheKey) -> float:
+        now = time.time()
+        expires_at = self.cache.expires_at(key)
+        if expires_at is None:
+            return now + RETRY_MIN
+        lifetime = max(expires_at - now, 0)
+        due = expires_at - self.renew_lead - random.uniform(0, self.jitter * lifetime)
+        # Tokens shorter-lived than the lead are renewed at half their remaining life.
+        return max(due, now + lifetime / 2, now + 1)
+
+    async def _renew(self, key: CacheKey, force: bool) -> bool:
+        mint = self._jobs.get(key)
+        if mint is None:
+            return False
+        async with self._semaphore:
+            try:
+                if force:
+                    token = await self.cache.refresh(key, mint)
+                else:
+                    token = await self.cache.get_or_mint(key, mint)
+            except HTTPException as e:
+                return self._on_failure(key, f"{e.status_code}: {e.detail}")
+            except Exception as e:
+                logger.exception("Unexpected error renewing guest token.")
+                return self._on_failure(key, repr(e))
+        if key not in self._jobs:
+            return True  # Unregistered while the renewal was in flight
+        self._failures.pop(key, None)
+        self.renewals += 1
+        self._schedule(key, self._next_due(key))
+        if force:
+            self._publish(key, token)
+        return True
+
+    def _on_failure(self, key: CacheKey, reason: str) -> bool:
+        if key not in self._jobs:
+            return False
+        failures = self._failures.get(key, 0) + 1
+        self._failures[key] = failures
+        self.renewal_failures += 1
+        delay = min(RETRY_MIN * 2 ** (failures - 1), RETRY_MAX) * random.uniform(0.8, 1.2)
+        logger.warning("Guest token renewal failed for %s (%s); retrying in %.0fs.", key[1], reason, delay)
+        self._schedule(key, time.time() + delay)
+        return False
+
+    async def warm_up(self) -> int:
+        """Mints every registered token that is not already cached. Returns how many succeeded."""
+        self._ensure_primitives()
+        started = time.perf_counter()
+        results = await asyncio.gather(*(self._renew(key, force=False) for key in list(self._jobs)))
+        ok = sum(1 for r in results if r)
+        logger.info("Guest token warm-up: %d/%d tokens ready in %.2fs.", ok, len(results), time.perf_counter() - started)
+        return ok
+
+    async def _run(self) -> None:
+        while True:
+            self._wakeup.clear()
+            now = time.time()
+            while self._heap and self._heap[0][0] <= now:
+                due, key = heapq.heappop(self._heap)
+                if self._due.get(key) != due:
+                    continue  # Superseded by a later schedule for the same key
+                del self._due[key]
+                task = asyncio.create_task(self._renew(key, force=True))
+                self._pending.add(task)
+                task.add_done_callback(self._pending.discard)
+            timeout = (self._heap[0][0] - now) if self._heap else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def _ensure_primitives(self) -> None:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self._concurrency)
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+
+    async def _warm_up_and_run(self, warm_up: bool) -> None:
+        if warm_up:
+            await self.warm_up()
+        self._warmed_up.set()
+        await self._run()
+
+    async def wait_warmed_up(self) -> None:
+        await self._warmed_up.wait()
+
+    def start(self, warm_up: bool = True) -> None:
+        """Starts the background loop, optionally warming every registered token first."""
+        self._ensure_primitives()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._warm_up_and_run(warm_up))
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for task in list(self._pending):
+            task.cancel()
+        await asyncio.gather(*self._pending, return_exceptions=True)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "jobs": len(self._jobs),
+            "renewals": self.renewals,
+            "renewal_failures": self.renewal_failures,
+            "failing": len(self._failures),
+            "subscribers": self.subscriber_count,
+        }
@@ -14,8 +14,8 @@ function App() {
   const navigate = useNavigate();
   const location = useLocation();
 
-  // handleLoginSuccess remains the same
-  const handleLoginSuccess = (type, identifier) => {
+  // initialToken is the guest token returned by /login; it is handed to the dashboard via route state
+  const handleLoginSuccess = (type, identifier, initialToken = null) => {
     localStorage.setItem('isLoggedIn', 'true');
     localStorage.setItem('userType', type);
     localStorage.setItem('userIdentifier', identifier);
@@ -23,17 +23,20 @@ function App() {
     setUserType(type);
     setUserIdentifier(identifier);
 
+    const state = initialToken ? { initialToken } : undefined;
     if (type === 'admin') {
-      navigate('/dashboard/full');
+      navigate('/dashboard/full', { state });
     } else if (type === 'manufacturer') {
-      navigate(`/dashboard/rls/${encodeURIComponent(identifier)}`);
+      navigate(`/dashboard/rls/${encodeURIComponent(identifier)}`, { state });
     } else {
       navigate('/login');
     }
   };
 
-  // handleLogout remains the same
+  // handleLogout also clears the backend session cookie
   const handleLogout = () => {
+    fetch(`${import.meta.env.VITE_API_BASE_URL}/logout`, { method: 'POST', credentials: 'include' })
+      .catch((err) => console.error('Logout request failed:', err));
     localStorage.removeItem('isLoggedIn');
     localStorage.removeItem('userType');
     localStorage.removeItem('userIdentifier');
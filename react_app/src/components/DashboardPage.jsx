@@ -3,7 +3,7 @@
 // The logic correctly adapts based on the 'mode' prop and URL parameters.
 
 import React, { useEffect, useState, useRef, useCallback } from 'react';
-import { useParams } from 'react-router-dom';
+import { useParams, useLocation } from 'react-router-dom';
 import './DashboardPage.css';
 
 const API_BASE_URL = import.meta.env.VITE_API_BASE_URL;
@@ -11,10 +11,15 @@ const SUPERSET_URL = import.meta.env.VITE_SUPERSET_URL;
 const DASHBOARD_ID = import.meta.env.VITE_SUPERSET_DASHBOARD_ID;
 
 const EMBED_DELAY_MS = 50;
+// A token handed over by the login response is only used if it is still valid for this long
+const INITIAL_TOKEN_MIN_VALIDITY_S = 30;
 
 function DashboardPage({ mode }) {
   // Get manufacturer from route parameters (only relevant for mode='rls')
   const { manufacturer } = useParams();
+  const location = useLocation();
+  // Guest token returned together with the login response, if any (saves one round trip)
+  const initialTokenRef = useRef(location.state?.initialToken || null);
   const [guestToken, setGuestToken] = useState(null);
   const [error, setError] = useState(null);
   const [isLoadingToken, setIsLoadingToken] = useState(true);
@@ -22,12 +27,23 @@ function DashboardPage({ mode }) {
   const dashboardContainerRef = useRef(null);
   const embedInstanceRef = useRef(null);
   const embedTimeoutRef = useRef(null);
+  // Latest token pushed by /guest-token-stream; kept in a ref so renewals don't re-embed the dashboard
+  const latestTokenRef = useRef(null);
 
   const fetchToken = useCallback(async () => {
     setIsLoadingToken(true);
     setError(null);
     setGuestToken(null);
 
+    const initialToken = initialTokenRef.current;
+    initialTokenRef.current = null; // Only the first load can use it
+    if (initialToken && initialToken.expiresAt - Date.now() / 1000 > INITIAL_TOKEN_MIN_VALIDITY_S) {
+      console.log(`[${mode}] Using guest token issued with login.`);
+      setGuestToken(initialToken.token);
+      setIsLoadingToken(false);
+      return;
+    }
+
     let tokenUrl = '';
     if (mode === 'rls') {
       if (!manufacturer) { // Check for manufacturer param for RLS mode
@@ -51,7 +67,8 @@ function DashboardPage({ mode }) {
     console.log(`[${mode}] Requesting token from: ${tokenUrl}`); // Log URL being called
 
     try {
-      const response = await fetch(tokenUrl);
+      // The session cookie from /login authorizes the token request
+      const response = await fetch(tokenUrl, { credentials: 'include' });
       if (!response.ok) {
         let errorDetail = `Failed to fetch guest token (${response.status})`;
         try { const errorData = await response.json(); errorDetail = errorData.detail || errorDetail; } catch (e) { /* Ignore */ }
@@ -76,6 +93,29 @@ function DashboardPage({ mode }) {
     fetchToken();
   }, [fetchToken]); // fetchToken dependency includes mode and manufacturer
 
+  // Effect to subscribe to renewed tokens once the first token is available
+  useEffect(() => {
+    latestTokenRef.current = guestToken;
+    if (!guestToken) return undefined;
+
+    let streamUrl = '';
+    if (mode === 'rls') {
+      streamUrl = `${API_BASE_URL}/guest-token-stream?manufacturer=${encodeURIComponent(manufacturer)}`;
+    } else {
+      const userId = localStorage.getItem('userIdentifier') || 'react_full_user_fallback';
+      streamUrl = `${API_BASE_URL}/guest-token-stream?full_access=true&user_id=${encodeURIComponent(userId)}`;
+    }
+    // The browser reconnects automatically if the stream drops; the backend resends the current token
+    const source = new EventSource(streamUrl, { withCredentials: true });
+    source.addEventListener('token', (event) => {
+      const data = JSON.parse(event.data);
+      latestTokenRef.current = data.token;
+      console.log(`[${mode}] Received guest token from stream, expires at ${new Date(data.exp * 1000).toISOString()}.`);
+    });
+    source.onerror = () => console.warn(`[${mode}] Guest token stream interrupted; the browser will reconnect.`);
+    return () => source.close();
+  }, [guestToken, mode, manufacturer]);
+
   // Effect to handle embedding AND cleanup
   useEffect(() => {
     console.log(`[${mode}] Embedding effect triggered. Token: ${guestToken ? 'Available' : 'Not Available'}, Container Ref: ${dashboardContainerRef.current ? 'Ready' : 'Not Ready'}`);
@@ -113,7 +153,8 @@ function DashboardPage({ mode }) {
             id: DASHBOARD_ID,
             supersetDomain: SUPERSET_URL,
             mountPoint: dashboardContainerRef.current,
-            fetchGuestToken: () => Promise.resolve(guestToken), // Use the fetched token
+            // The SDK calls this again when its token is about to expire; hand back the latest streamed token
+            fetchGuestToken: () => Promise.resolve(latestTokenRef.current || guestToken),
             dashboardUiConfig: { hideTitle: true },
           };
           console.log(`[${mode}] Embedding with config:`, JSON.stringify({ ...embedConfig, mountPoint: 'HTMLElement', fetchGuestToken: 'Function' }));
@@ -33,15 +33,17 @@ function LoginPage({ onLoginSuccess }) {
         headers: {
           'Content-Type': 'application/json',
         },
-        // Send generic username and password
-        body: JSON.stringify({ username: username, password: password }),
+        credentials: 'include', // Receive the session cookie used by the token endpoints
+        // Send generic username and password; include_token returns the guest token in the same response
+        body: JSON.stringify({ username: username, password: password, include_token: true }),
       });
 
       if (response.ok) {
         const data = await response.json();
         console.log(`Login successful for ${data.user_type}:`, data.user_identifier);
-        // Pass back both type and identifier
-        onLoginSuccess(data.user_type, data.user_identifier);
+        // Pass back type, identifier and (if it was issued) the guest token for the first dashboard load
+        const initialToken = data.token ? { token: data.token, expiresAt: data.token_expires_at } : null;
+        onLoginSuccess(data.user_type, data.user_identifier, initialToken);
       } else {
         const errorData = await response.json();
         setError(errorData.detail || `Login failed: ${response.statusText}`);
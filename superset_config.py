@@ -27,9 +27,32 @@ GUEST_TOKEN_JWT_SECRET = os.environ.get(
     "SUPERSET_GUEST_TOKEN_JWT_SECRET",
     SECRET_KEY # Use main key for dev
 )
+# Pinned so that guest tokens signed by the embedding app (GUEST_TOKEN_MODE=local) verify here.
+# Keep these in sync with GUEST_TOKEN_JWT_AUDIENCE / GUEST_TOKEN_JWT_EXP_SECONDS in embedding_app/.env
+GUEST_TOKEN_JWT_AUDIENCE = os.environ.get("SUPERSET_GUEST_TOKEN_JWT_AUDIENCE", "superset")
+GUEST_TOKEN_JWT_EXP_SECONDS = int(os.environ.get("SUPERSET_GUEST_TOKEN_JWT_EXP_SECONDS", 300))
 
 GUEST_ROLE_NAME = "Gamma"
 
+# --- Caching (Redis service from docker-compose.yml) ---
+# Chart query results are cached per RLS clause, so each tenant's results persist across workers
+# and restarts; embedding_app's optional chart warm-up (CHART_WARMUP_ENABLED) fills this cache.
+# Database 0 is left to embedding_app's shared token store.
+REDIS_HOST = os.environ.get("REDIS_HOST", "redis")
+REDIS_PORT = int(os.environ.get("REDIS_PORT", 6379))
+CACHE_CONFIG = {
+    "CACHE_TYPE": "RedisCache",
+    "CACHE_DEFAULT_TIMEOUT": 300,
+    "CACHE_KEY_PREFIX": "superset_",
+    "CACHE_REDIS_URL": f"redis://{REDIS_HOST}:{REDIS_PORT}/1",
+}
+DATA_CACHE_CONFIG = {
+    "CACHE_TYPE": "RedisCache",
+    "CACHE_DEFAULT_TIMEOUT": int(os.environ.get("SUPERSET_DATA_CACHE_TIMEOUT", 3600)),
+    "CACHE_KEY_PREFIX": "superset_data_",
+    "CACHE_REDIS_URL": f"redis://{REDIS_HOST}:{REDIS_PORT}/2",
+}
+
 # --- Session Cookie Settings ---
 SESSION_COOKIE_SAMESITE = None
 SESSION_COOKIE_SECURE = False
@@ -70,7 +93,10 @@ print(f"Flask Env: {os.environ.get('FLASK_ENV', 'Not Set (Defaulting to Producti
 print(f"Main SECRET_KEY Loaded: {'******'}")
 print(f"Allowed Embedded Domains: {ALLOWED_EMBEDDED_DOMAINS}")
 print(f"Guest Token JWT Secret Loaded: {'******'}")
+print(f"Guest Token JWT Audience: {GUEST_TOKEN_JWT_AUDIENCE}")
+print(f"Guest Token JWT Exp Seconds: {GUEST_TOKEN_JWT_EXP_SECONDS}")
 print(f"Guest Role Name (Default): {GUEST_ROLE_NAME}")
+print(f"Cache Redis: {REDIS_HOST}:{REDIS_PORT} (data cache timeout {DATA_CACHE_CONFIG['CACHE_DEFAULT_TIMEOUT']}s)")
 print(f"Session Cookie SameSite: {SESSION_COOKIE_SAMESITE}")
 print(f"Session Cookie Secure: {SESSION_COOKIE_SECURE}")
 print(f"Session Cookie HttpOnly: {SESSION_COOKIE_HTTPONLY}")